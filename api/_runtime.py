@@ -0,0 +1,203 @@
+"""Shared runtime for the Vercel Python handlers under api/
+
+Vercel reuses a container across invocations while it stays warm, so
+everything at module level here is built once per container: the parsed
+configuration, a keep-alive HTTP pool to PhonePe and the OAuth token (kept in
+memory and in the shared token store). Warm invocations reuse all three.
+Files starting with an underscore are not deployed as endpoints.
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import hmac
+import threading
+from http.server import BaseHTTPRequestHandler
+from typing import Any, Dict, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+from services.http_pool import get_sync_pool
+from services.rate_limiter import RateLimitExceeded
+from services.resilience import CircuitOpenError, phonepe_gateway
+from services.token_store import TokenStore, create_token_store
+
+# Refresh tokens this long before they expire (matches the backend auth service)
+TOKEN_EXPIRY_BUFFER_SECONDS = 300
+
+# Raised when PhonePe calls are being shed; both carry retry_after (seconds)
+GATEWAY_ERRORS = (CircuitOpenError, RateLimitExceeded)
+
+AUTH_URLS = {
+    'SANDBOX': "https://api-preprod.phonepe.com/apis/pg-sandbox/v1/oauth/token",
+    'PRODUCTION': "https://api.phonepe.com/apis/identity-manager/v1/oauth/token",
+}
+
+
+class RuntimeConfig:
+    """PhonePe settings read from the environment once per container"""
+
+    REQUIRED = ('PHONEPE_CLIENT_ID', 'PHONEPE_CLIENT_SECRET', 'PHONEPE_MERCHANT_ID', 'PHONEPE_WEBHOOK_URL')
+
+    def __init__(self, environ: Dict[str, str]):
+        self.environment = environ.get('PHONEPE_ENVIRONMENT', 'PRODUCTION')
+        self.client_id = environ.get('PHONEPE_CLIENT_ID')
+        self.client_secret = environ.get('PHONEPE_CLIENT_SECRET')
+        self.client_version = environ.get('PHONEPE_CLIENT_VERSION', '1')
+        self.merchant_id = environ.get('PHONEPE_MERCHANT_ID')
+        self.webhook_url = environ.get('PHONEPE_WEBHOOK_URL')
+        self.webhook_password = environ.get('PHONEPE_WEBHOOK_PASSWORD')
+        self.auth_url = environ.get('PHONEPE_AUTH_URL') or AUTH_URLS.get(self.environment, AUTH_URLS['PRODUCTION'])
+        self.checkout_url = environ.get('PHONEPE_CHECKOUT_URL', "https://api.phonepe.com/apis/pg/checkout/v2/pay")
+        self.status_url = environ.get('PHONEPE_STATUS_URL', "https://api.phonepe.com/apis/pg/checkout/v2/order")
+        self.success_url = environ.get('SUCCESS_URL', 'https://www.lekhakai.com/payment/success')
+        self.token_store = environ.get('PHONEPE_TOKEN_STORE', 'file')
+        self.missing = [name for name in self.REQUIRED if not environ.get(name)]
+
+    @classmethod
+    def from_env(cls) -> "RuntimeConfig":
+        return cls(dict(os.environ))
+
+
+class HandlerRuntime:
+    """Per-container state shared by every handler invocation"""
+
+    def __init__(self, config: RuntimeConfig, token_store: Optional[TokenStore] = None):
+        self.config = config
+        self.token_store = token_store or create_token_store(config.token_store, key=config.client_id or 'default')
+        self.http = get_sync_pool("phonepe")
+        self.gateway = phonepe_gateway
+
+        self.started_at = time.time()
+        self.invocations = 0
+        self.token_fetches = 0
+        self._access_token: Optional[str] = None
+        self._token_expires_at = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "HandlerRuntime":
+        return cls(RuntimeConfig.from_env())
+
+    def begin_invocation(self) -> bool:
+        """Count an invocation; True for the first one in this container (the cold start)"""
+        with self._lock:
+            self.invocations += 1
+            return self.invocations == 1
+
+    def get_access_token(self) -> Optional[str]:
+        """OAuth token from memory, then the token store, fetching a new one only when both are stale"""
+        if self._access_token and time.time() < self._token_expires_at - TOKEN_EXPIRY_BUFFER_SECONDS:
+            return self._access_token
+
+        with self._lock:
+            if self._adopt_stored_token():
+                return self._access_token
+
+            with self.token_store.refresh_lock():
+                # Another invocation may have refreshed while we waited for the lock
+                if self._adopt_stored_token():
+                    return self._access_token
+                return self._fetch_access_token()
+
+    def _adopt_stored_token(self) -> bool:
+        cached = self.token_store.get_valid(TOKEN_EXPIRY_BUFFER_SECONDS)
+        if not cached:
+            return False
+        self._access_token = cached['access_token']
+        self._token_expires_at = cached['expires_at']
+        return True
+
+    def _fetch_access_token(self) -> Optional[str]:
+        """Get OAuth access token from PhonePe"""
+        form_data = {
+            "client_id": self.config.client_id,
+            "client_secret": self.config.client_secret,
+            "client_version": self.config.client_version,
+            "grant_type": "client_credentials"
+        }
+        headers = {"Content-Type": "application/x-www-form-urlencoded"}
+
+        self.token_fetches += 1
+        response = self.gateway.call("token", lambda timeout: self.http.request(
+            "POST", self.config.auth_url, data=form_data, headers=headers, timeout=timeout
+        ))
+
+        if response.status_code != 200:
+            print(f"OAuth failed: {response.status_code} - {response.text}")
+            return None
+
+        token_data = response.json()
+        access_token = token_data.get('access_token')
+        if access_token:
+            # Default 1 hour if no expiry provided
+            expires_at = token_data.get('expires_at') or time.time() + 3600
+            self.token_store.save(access_token, expires_at)
+            self._access_token = access_token
+            self._token_expires_at = expires_at
+        return access_token
+
+    def phonepe_request(self, endpoint: str, method: str, url: str, access_token: str, **kwargs):
+        """Authorized request to PhonePe over the pooled connection, through the gateway policy"""
+        headers = {"Content-Type": "application/json", "Authorization": f"O-Bearer {access_token}"}
+        headers.update(kwargs.pop('headers', None) or {})
+        return self.gateway.call(endpoint, lambda timeout: self.http.request(
+            method, url, headers=headers, timeout=timeout, **kwargs
+        ))
+
+    def verify_webhook_signature(self, auth_header: str, body: bytes) -> bool:
+        """Check a 'SHA256 <hex>' Authorization header against sha256(body + webhook password)"""
+        if not auth_header.startswith('SHA256') or not self.config.webhook_password:
+            return False
+
+        received_signature = auth_header[6:].strip()
+        expected_signature = hashlib.sha256(body + self.config.webhook_password.encode('utf-8')).hexdigest()
+        return hmac.compare_digest(received_signature.lower(), expected_signature)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "container_age_seconds": round(time.time() - self.started_at, 1),
+            "invocations": self.invocations,
+            "token_fetches": self.token_fetches,
+            "http": self.http.get_stats()
+        }
+
+
+class JsonHandler(BaseHTTPRequestHandler):
+    """Base handler with JSON body parsing and responses"""
+
+    cors = True
+
+    def parse_request(self) -> bool:
+        self.cold_start = runtime.begin_invocation()
+        return super().parse_request()
+
+    def read_json(self) -> Any:
+        content_length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(content_length)
+        return json.loads(body.decode('utf-8')) if body else None
+
+    def send_json(self, status_code: int, data: Any, headers: Optional[Dict[str, str]] = None) -> None:
+        body = json.dumps(data).encode()
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if self.cors:
+            self.send_header('Access-Control-Allow-Origin', '*')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_success_response(self, data: Any) -> None:
+        """Send successful response"""
+        self.send_json(200, data)
+
+    def send_error_response(self, status_code: int, data: Any, headers: Optional[Dict[str, str]] = None) -> None:
+        """Send error response"""
+        self.send_json(status_code, data, headers)
+
+
+# Global runtime, built once per container and reused by warm invocations
+runtime = HandlerRuntime.from_env()
@@ -1,36 +1,23 @@
 import os
-import json
+import sys
 from datetime import datetime
-from http.server import BaseHTTPRequestHandler
-from urllib.parse import urlparse, parse_qs
 
-class handler(BaseHTTPRequestHandler):
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _runtime import JsonHandler, runtime
+
+class handler(JsonHandler):
     def do_GET(self):
         """Health check endpoint for PhonePe integration"""
         try:
-            # Check environment variables
-            required_vars = [
-                'PHONEPE_CLIENT_ID',
-                'PHONEPE_CLIENT_SECRET', 
-                'PHONEPE_MERCHANT_ID',
-                'PHONEPE_WEBHOOK_URL'
-            ]
-            
-            missing_vars = [var for var in required_vars if not os.getenv(var)]
+            # Required settings are checked once per container by the runtime
+            config = runtime.config
             
-            if missing_vars:
-                self.send_response(503)
-                self.send_header('Content-Type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                
-                response_data = {
+            if config.missing:
+                self.send_error_response(503, {
                     "status": "unhealthy",
                     "timestamp": datetime.now().isoformat(),
-                    "error": f"Missing environment variables: {', '.join(missing_vars)}"
-                }
-                
-                self.wfile.write(json.dumps(response_data).encode())
+                    "error": f"Missing environment variables: {', '.join(config.missing)}"
+                })
                 return
             
             response_data = {
@@ -38,33 +25,25 @@ class handler(BaseHTTPRequestHandler):
                 "timestamp": datetime.now().isoformat(),
                 "service": "Lekhak AI PhonePe Integration",
                 "version": "1.0.0",
-                "environment": os.getenv('PHONEPE_ENVIRONMENT', 'PRODUCTION'),
-                "merchant_id": os.getenv('PHONEPE_MERCHANT_ID'),
-                "webhook_url": os.getenv('PHONEPE_WEBHOOK_URL'),
+                "environment": config.environment,
+                "merchant_id": config.merchant_id,
+                "webhook_url": config.webhook_url,
                 "services": {
                     "phonepe_auth": {"configured": True},
                     "phonepe_payment": {"configured": True},
                     "webhook_handler": {"configured": True}
+                },
+                "runtime": {
+                    "cold_start": self.cold_start,
+                    **runtime.get_stats()
                 }
             }
             
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            
-            self.wfile.write(json.dumps(response_data).encode())
+            self.send_success_response(response_data)
             
         except Exception as e:
-            self.send_response(503)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            
-            response_data = {
+            self.send_error_response(503, {
                 "status": "unhealthy",
                 "timestamp": datetime.now().isoformat(),
                 "error": str(e)
-            }
-            
-            self.wfile.write(json.dumps(response_data).encode())
\ No newline at end of file
+            })
@@ -1,18 +1,18 @@
 import os
-import json
-import time
-import requests
-from http.server import BaseHTTPRequestHandler
-from urllib.parse import urlparse, parse_qs
+import sys
 
-class handler(BaseHTTPRequestHandler):
+# Config, pooled PhonePe connection and cached token live in the shared runtime (once per container)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from _runtime import GATEWAY_ERRORS, JsonHandler, runtime
+from services.plan_catalog import plan_catalog
+from services.order_ids import order_ids
+
+class handler(JsonHandler):
     def do_POST(self):
         """Create PhonePe payment order"""
         try:
             # Get request body
-            content_length = int(self.headers.get('Content-Length', 0))
-            body_bytes = self.rfile.read(content_length)
-            body = json.loads(body_bytes.decode('utf-8'))
+            body = self.read_json()
             
             # Validate request
             if not body:
@@ -21,23 +21,24 @@ class handler(BaseHTTPRequestHandler):
             
             user_id = body.get('user_id')
             plan_id = body.get('plan_id')
-            amount = body.get('amount')
-            plan_name = body.get('plan_name')
+            billing_cycle = body.get('billing_cycle') or 'monthly'
             
-            if not all([user_id, plan_id, amount, plan_name]):
-                self.send_error_response(400, {'error': 'Missing required fields: user_id, plan_id, amount, plan_name'})
+            if not all([user_id, plan_id]):
+                self.send_error_response(400, {'error': 'Missing required fields: user_id, plan_id'})
                 return
             
-            if amount <= 0:
-                self.send_error_response(400, {'error': 'Invalid amount'})
+            # Price comes from the plan catalog (base + GST in exact paisa), never from the client
+            price = plan_catalog.get_price(plan_id, billing_cycle)
+            if price is None:
+                self.send_error_response(400, {'error': f'Unknown plan: {plan_id} ({billing_cycle})'})
                 return
             
-            # Generate unique merchant order ID
-            merchant_order_id = f"LEKHAK_{user_id[:8]}_{int(time.time())}"
-            amount_paisa = int(float(amount) * 100)
+            # Unique, time-ordered merchant order ID (safe across concurrent invocations)
+            merchant_order_id = order_ids.order_id()
+            amount_paisa = price.total_paisa
             
-            # Get OAuth token
-            access_token = get_access_token()
+            # Get OAuth token (cached across warm invocations)
+            access_token = runtime.get_access_token()
             
             if not access_token:
                 self.send_error_response(500, {'error': 'Failed to get PhonePe access token'})
@@ -50,30 +51,29 @@ class handler(BaseHTTPRequestHandler):
                 "paymentFlow": {
                     "type": "PG_CHECKOUT",
                     "merchantUrls": {
-                        "redirectUrl": os.getenv('SUCCESS_URL', 'https://www.lekhakai.com/payment/success')
+                        "redirectUrl": runtime.config.success_url
                     }
                 },
                 "expireAfter": 1800,  # 30 minutes
                 "metaInfo": {
                     "user_id": user_id,
-                    "plan_id": plan_id,
-                    "plan_name": plan_name,
-                    "source": "lekhakai_website"
+                    "plan_id": price.plan_id,
+                    "plan_name": price.plan_name,
+                    "billing_cycle": price.billing_cycle,
+                    "source": "lekhakai_website",
+                    "base_amount": str(price.base_amount),
+                    "gst_amount": str(price.gst_amount),
+                    "total_amount": str(price.total_amount)
                 }
             }
             
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"O-Bearer {access_token}"
-            }
-            
-            # Make API call to PhonePe (use correct production URL)
-            checkout_url = "https://api.phonepe.com/apis/pg/checkout/v2/pay"
-            response = requests.post(
-                checkout_url,
-                json=payment_payload,
-                headers=headers,
-                timeout=30
+            # Make API call to PhonePe over the container's pooled connection
+            response = runtime.phonepe_request(
+                "pay",
+                "POST",
+                runtime.config.checkout_url,
+                access_token,
+                json=payment_payload
             )
             
             if response.status_code == 200:
@@ -108,61 +108,13 @@ class handler(BaseHTTPRequestHandler):
                     'details': response.text
                 })
                 
+        except GATEWAY_ERRORS as e:
+            self.send_error_response(503, {
+                'success': False,
+                'error': 'Payment gateway busy, please retry'
+            }, headers={'Retry-After': str(e.retry_after)})
         except Exception as e:
             self.send_error_response(500, {
                 'success': False,
                 'error': f'Payment creation failed: {str(e)}'
             })
-    
-    def send_success_response(self, data):
-        """Send successful response"""
-        self.send_response(200)
-        self.send_header('Content-Type', 'application/json')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.end_headers()
-        self.wfile.write(json.dumps(data).encode())
-    
-    def send_error_response(self, status_code, data):
-        """Send error response"""
-        self.send_response(status_code)
-        self.send_header('Content-Type', 'application/json')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.end_headers()
-        self.wfile.write(json.dumps(data).encode())
-
-def get_access_token():
-    """Get OAuth access token from PhonePe"""
-    try:
-        # Check environment to use correct OAuth URL
-        environment = os.getenv('PHONEPE_ENVIRONMENT', 'PRODUCTION')
-        if environment == 'SANDBOX':
-            auth_url = "https://api-preprod.phonepe.com/apis/pg-sandbox/v1/oauth/token"
-        else:
-            # Try the correct production OAuth URL
-            auth_url = "https://api.phonepe.com/apis/identity-manager/v1/oauth/token"
-        
-        # Prepare form data as per PhonePe documentation
-        form_data = {
-            "client_id": os.getenv('PHONEPE_CLIENT_ID'),
-            "client_secret": os.getenv('PHONEPE_CLIENT_SECRET'),
-            "client_version": os.getenv('PHONEPE_CLIENT_VERSION', '1'),
-            "grant_type": "client_credentials"
-        }
-        
-        headers = {
-            "Content-Type": "application/x-www-form-urlencoded"
-        }
-        
-        # Send POST request with form data
-        response = requests.post(auth_url, data=form_data, headers=headers, timeout=30)
-        
-        if response.status_code == 200:
-            token_data = response.json()
-            return token_data.get('access_token')
-        else:
-            print(f"OAuth failed: {response.status_code} - {response.text}")
-            return None
-            
-    except Exception as e:
-        print(f"OAuth error: {e}")
-        return None
\ No newline at end of file
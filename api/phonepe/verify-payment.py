@@ -1,10 +1,11 @@
 import os
-import json
-import requests
-from http.server import BaseHTTPRequestHandler
-from urllib.parse import urlparse, parse_qs
+import sys
 
-class handler(BaseHTTPRequestHandler):
+# Config, pooled PhonePe connection and cached token live in the shared runtime (once per container)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from _runtime import GATEWAY_ERRORS, JsonHandler, runtime
+
+class handler(JsonHandler):
     def do_GET(self):
         """Verify payment status with PhonePe"""
         try:
@@ -22,29 +23,25 @@ class handler(BaseHTTPRequestHandler):
                 self.send_error_response(400, {'error': 'Merchant order ID is required'})
                 return
             
-            # Get OAuth token
-            access_token = get_access_token()
+            # Get OAuth token (cached across warm invocations)
+            access_token = runtime.get_access_token()
             
             if not access_token:
                 self.send_error_response(500, {'error': 'Failed to get PhonePe access token'})
                 return
             
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"O-Bearer {access_token}"
-            }
-            
             params = {
                 "details": "true"
             }
             
-            status_url = f"{os.getenv('PHONEPE_STATUS_URL')}/{merchant_order_id}/status"
+            status_url = f"{runtime.config.status_url}/{merchant_order_id}/status"
             
-            response = requests.get(
+            response = runtime.phonepe_request(
+                "status",
+                "GET",
                 status_url,
-                headers=headers,
-                params=params,
-                timeout=30
+                access_token,
+                params=params
             )
             
             if response.status_code == 200:
@@ -64,61 +61,13 @@ class handler(BaseHTTPRequestHandler):
                     'details': response.text
                 })
                 
+        except GATEWAY_ERRORS as e:
+            self.send_error_response(503, {
+                'success': False,
+                'error': 'Payment gateway busy, please retry'
+            }, headers={'Retry-After': str(e.retry_after)})
         except Exception as e:
             self.send_error_response(500, {
                 'success': False,
                 'error': f'Payment verification failed: {str(e)}'
             })
-    
-    def send_success_response(self, data):
-        """Send successful response"""
-        self.send_response(200)
-        self.send_header('Content-Type', 'application/json')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.end_headers()
-        self.wfile.write(json.dumps(data).encode())
-    
-    def send_error_response(self, status_code, data):
-        """Send error response"""
-        self.send_response(status_code)
-        self.send_header('Content-Type', 'application/json')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.end_headers()
-        self.wfile.write(json.dumps(data).encode())
-
-def get_access_token():
-    """Get OAuth access token from PhonePe"""
-    try:
-        # Check environment to use correct OAuth URL
-        environment = os.getenv('PHONEPE_ENVIRONMENT', 'PRODUCTION')
-        if environment == 'SANDBOX':
-            auth_url = "https://api-preprod.phonepe.com/apis/pg-sandbox/v1/oauth/token"
-        else:
-            # Try the correct production OAuth URL
-            auth_url = "https://api.phonepe.com/apis/identity-manager/v1/oauth/token"
-        
-        # Prepare form data as per PhonePe documentation
-        form_data = {
-            "client_id": os.getenv('PHONEPE_CLIENT_ID'),
-            "client_secret": os.getenv('PHONEPE_CLIENT_SECRET'),
-            "client_version": os.getenv('PHONEPE_CLIENT_VERSION', '1'),
-            "grant_type": "client_credentials"
-        }
-        
-        headers = {
-            "Content-Type": "application/x-www-form-urlencoded"
-        }
-        
-        # Send POST request with form data
-        response = requests.post(auth_url, data=form_data, headers=headers, timeout=30)
-        
-        if response.status_code == 200:
-            token_data = response.json()
-            return token_data.get('access_token')
-        else:
-            print(f"OAuth failed: {response.status_code} - {response.text}")
-            return None
-            
-    except Exception as e:
-        print(f"OAuth error: {e}")
-        return None
\ No newline at end of file
@@ -1,10 +1,14 @@
 import os
+import sys
 import json
-import hashlib
-import hmac
-from http.server import BaseHTTPRequestHandler
 
-class handler(BaseHTTPRequestHandler):
+# Webhook password and signature check live in the shared runtime (once per container)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from _runtime import JsonHandler, runtime
+
+class handler(JsonHandler):
+    cors = False
+
     def do_POST(self):
         """Handle PhonePe webhooks"""
         try:
@@ -17,7 +21,7 @@ class handler(BaseHTTPRequestHandler):
             webhook_body = webhook_body_bytes.decode('utf-8')
             
             # Verify webhook authenticity
-            if not verify_webhook_signature(authorization_header, webhook_body_bytes):
+            if not runtime.verify_webhook_signature(authorization_header, webhook_body_bytes):
                 self.send_error_response(401, {'error': 'Invalid webhook signature'})
                 return
             
@@ -48,42 +52,6 @@ class handler(BaseHTTPRequestHandler):
             self.send_error_response(500, {
                 'error': f'Webhook processing failed: {str(e)}'
             })
-    
-    def send_success_response(self, data):
-        """Send successful response"""
-        self.send_response(200)
-        self.send_header('Content-Type', 'application/json')
-        self.end_headers()
-        self.wfile.write(json.dumps(data).encode())
-    
-    def send_error_response(self, status_code, data):
-        """Send error response"""
-        self.send_response(status_code)
-        self.send_header('Content-Type', 'application/json')
-        self.end_headers()
-        self.wfile.write(json.dumps(data).encode())
-
-def verify_webhook_signature(auth_header, webhook_body_bytes):
-    """Verify webhook signature using SHA256"""
-    try:
-        if not auth_header.startswith('SHA256'):
-            return False
-        
-        received_signature = auth_header.split(' ', 1)[1]
-        webhook_password = os.getenv('PHONEPE_WEBHOOK_PASSWORD')
-        
-        if not webhook_password:
-            return False
-        
-        # Calculate expected signature
-        message = webhook_body_bytes + webhook_password.encode('utf-8')
-        expected_signature = hashlib.sha256(message).hexdigest()
-        
-        # Compare signatures
-        return hmac.compare_digest(received_signature, expected_signature)
-        
-    except Exception as e:
-        return False
 
 def handle_successful_payment(payload):
     """Handle successful payment webhook"""
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""Benchmark subscription activation throughput
+
+Compares the legacy sequence (read payment, read plan, cancel active subscription,
+insert subscription, update quota: five autocommitted round trips) with the
+activate_subscription function from database_schema_performance.sql (one round
+trip, one transaction). Everything runs in a throwaway activation_bench schema.
+
+Requires a PostgreSQL DATABASE_URL (a local database, not production).
+
+Usage: python benchmarks/activation_benchmark.py [--orders 2000] [--concurrency 1,8,32]
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import asyncio
+import argparse
+
+import asyncpg
+from dotenv import load_dotenv
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'database_schema_performance.sql')
+
+SETUP_SQL = """
+DROP SCHEMA IF EXISTS activation_bench CASCADE;
+CREATE SCHEMA activation_bench;
+SET search_path TO activation_bench, public;
+
+CREATE TABLE users (
+  id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+  extension_id VARCHAR(255) UNIQUE
+);
+CREATE TABLE subscription_plans (
+  id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+  name VARCHAR(100) NOT NULL UNIQUE,
+  hits_limit INTEGER DEFAULT -1
+);
+CREATE TABLE user_subscriptions (
+  id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+  user_id UUID NOT NULL REFERENCES users(id),
+  plan_id UUID NOT NULL REFERENCES subscription_plans(id),
+  status VARCHAR(50) DEFAULT 'active',
+  billing_cycle VARCHAR(20) DEFAULT 'monthly',
+  phonepe_merchant_order_id VARCHAR(255),
+  started_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+  current_period_start TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+  current_period_end TIMESTAMP WITH TIME ZONE,
+  cancelled_at TIMESTAMP WITH TIME ZONE,
+  created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+CREATE UNIQUE INDEX ON user_subscriptions(user_id) WHERE status = 'active';
+CREATE INDEX ON user_subscriptions(phonepe_merchant_order_id);
+CREATE TABLE user_quotas (
+  user_id UUID NOT NULL UNIQUE REFERENCES users(id),
+  hits_used_this_month INTEGER DEFAULT 0,
+  daily_limit INTEGER DEFAULT 7,
+  monthly_limit INTEGER DEFAULT -1,
+  plan_name VARCHAR(100) DEFAULT 'Free',
+  plan_expires_at TIMESTAMP WITH TIME ZONE,
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+CREATE TABLE payment_transactions (
+  id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+  user_id UUID NOT NULL REFERENCES users(id),
+  subscription_id UUID REFERENCES user_subscriptions(id),
+  phonepe_merchant_order_id VARCHAR(255) UNIQUE NOT NULL,
+  metadata JSONB,
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+INSERT INTO subscription_plans (name, hits_limit) VALUES ('Free', 7), ('Pro', 1000), ('Unlimited', -1);
+"""
+
+
+def load_activation_function() -> str:
+    """Pull activate_subscription out of the migration file"""
+    with open(SCHEMA_FILE, 'r', encoding='utf-8') as schema:
+        sql = schema.read()
+    match = re.search(r"CREATE OR REPLACE FUNCTION activate_subscription\(.*?\$\$ LANGUAGE plpgsql;", sql, flags=re.S)
+    if not match:
+        raise SystemExit(f"Could not find activate_subscription in {SCHEMA_FILE}")
+    return match.group(0)
+
+
+async def create_orders(conn: asyncpg.Connection, count: int, prefix: str) -> list:
+    """One user with a quota row and one pending Pro payment per order"""
+    orders = [f"{prefix}_{uuid.uuid4().hex[:12]}" for _ in range(count)]
+    await conn.execute(
+        """
+        WITH new_users AS (
+          INSERT INTO users (extension_id) SELECT 'ext_' || o FROM unnest($1::text[]) AS o RETURNING id, extension_id
+        ), quotas AS (
+          INSERT INTO user_quotas (user_id) SELECT id FROM new_users
+        )
+        INSERT INTO payment_transactions (user_id, phonepe_merchant_order_id, metadata)
+        SELECT id, substr(extension_id, 5), $2::jsonb FROM new_users
+        """,
+        orders, json.dumps({"plan_name": "Pro"})
+    )
+    return orders
+
+
+async def legacy_activate(pool: asyncpg.Pool, order_id: str) -> None:
+    payment = await pool.fetchrow(
+        "SELECT * FROM payment_transactions WHERE phonepe_merchant_order_id = $1", order_id
+    )
+    plan = await pool.fetchrow(
+        "SELECT * FROM subscription_plans WHERE name = $1", json.loads(payment['metadata'])['plan_name']
+    )
+    await pool.execute(
+        "UPDATE user_subscriptions SET status = 'cancelled', cancelled_at = NOW() WHERE user_id = $1 AND status = 'active'",
+        payment['user_id']
+    )
+    period_end = await pool.fetchval(
+        """
+        INSERT INTO user_subscriptions (user_id, plan_id, status, phonepe_merchant_order_id, current_period_end)
+        VALUES ($1, $2, 'active', $3, NOW() + INTERVAL '1 month') RETURNING current_period_end
+        """,
+        payment['user_id'], plan['id'], order_id
+    )
+    await pool.execute(
+        """
+        UPDATE user_quotas SET daily_limit = -1, monthly_limit = $2, plan_name = $3, plan_expires_at = $4,
+          hits_used_this_month = 0, updated_at = NOW()
+        WHERE user_id = $1
+        """,
+        payment['user_id'], plan['hits_limit'], plan['name'], period_end
+    )
+
+
+async def function_activate(pool: asyncpg.Pool, order_id: str) -> None:
+    await pool.fetchrow("SELECT * FROM activate_subscription($1)", order_id)
+
+
+async def run(pool: asyncpg.Pool, activate, orders: list, concurrency: int) -> tuple:
+    queue = list(reversed(orders))
+    errors = 0
+
+    async def worker() -> None:
+        nonlocal errors
+        while queue:
+            order_id = queue.pop()
+            try:
+                await activate(pool, order_id)
+            except Exception:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return len(orders) / (time.perf_counter() - started), errors
+
+
+async def main() -> None:
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--orders', type=int, default=2000, help='activations per run')
+    parser.add_argument('--concurrency', default='1,8,32', help='comma-separated concurrent activators')
+    parser.add_argument('--database-url', default=os.getenv('DATABASE_URL'))
+    args = parser.parse_args()
+
+    if not args.database_url:
+        raise SystemExit("Set DATABASE_URL (or pass --database-url) to a disposable PostgreSQL database")
+
+    conn = await asyncpg.connect(args.database_url)
+    await conn.execute('CREATE EXTENSION IF NOT EXISTS "uuid-ossp"')
+    await conn.execute(SETUP_SQL)
+    await conn.execute(load_activation_function())
+
+    levels = [int(level) for level in args.concurrency.split(',')]
+    pool = await asyncpg.create_pool(
+        args.database_url, min_size=1, max_size=max(levels),
+        server_settings={'search_path': 'activation_bench, public'}
+    )
+    try:
+        print(f"{args.orders} activations per run\n")
+        for concurrency in levels:
+            for label, activate in (("legacy 5 round trips", legacy_activate), ("activate_subscription", function_activate)):
+                orders = await create_orders(conn, args.orders, f"c{concurrency}")
+                rate, errors = await run(pool, activate, orders, concurrency)
+                print(f"  concurrency {concurrency:3d}  {label:24s} {rate:10.1f} activations/s   errors {errors}")
+    finally:
+        await pool.close()
+        await conn.execute("DROP SCHEMA IF EXISTS activation_bench CASCADE")
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
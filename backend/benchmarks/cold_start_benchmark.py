@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""Benchmark API cold start: import time and time to first byte from a fresh interpreter
+
+Each run starts a new Python process, so nothing is cached in memory:
+  import  - time to `import main` (what a serverless cold start pays before any request)
+  ttfb    - from spawning `uvicorn main:app` to the first byte of GET /api/health
+With --top N, also lists the N slowest imports (python -X importtime) for one run.
+
+Environment comes from .env / the shell as for the API; startup network calls
+(credential validation, database pool, plan prices) run in the background and
+do not count towards time to first byte.
+
+Usage: python benchmarks/cold_start_benchmark.py [--runs 10] [--path /api/health] [--top 15]
+"""
+
+import os
+import sys
+import time
+import socket
+import argparse
+import statistics
+import subprocess
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+IMPORT_SNIPPET = "import time; started = time.perf_counter(); import main; print(time.perf_counter() - started)"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def measure_import() -> float:
+    output = subprocess.run(
+        [sys.executable, '-c', IMPORT_SNIPPET], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+    )
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+def first_byte(port: int, path: str) -> bool:
+    """Send one GET and wait for the first response byte; False if the server is not listening yet"""
+    try:
+        with socket.create_connection(('127.0.0.1', port), timeout=5) as sock:
+            sock.sendall(f"GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n".encode())
+            return bool(sock.recv(1))
+    except OSError:
+        return False
+
+
+def measure_ttfb(path: str, timeout: float) -> float:
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'main:app', '--port', str(port), '--log-level', 'warning'],
+        cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if first_byte(port, path):
+                return time.perf_counter() - started
+            if server.poll() is not None:
+                raise SystemExit(f"uvicorn exited with code {server.returncode}; run it by hand to see why")
+            time.sleep(0.005)
+        raise SystemExit(f"No response from {path} within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+def slowest_imports(count: int) -> list:
+    output = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import main'], cwd=BACKEND_DIR, capture_output=True, text=True
+    )
+    rows = []
+    for line in output.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative), name.rstrip()))
+    return sorted(rows, reverse=True)[:count]
+
+
+def summarize(label: str, samples: list) -> None:
+    samples = sorted(samples)
+    p90 = samples[min(len(samples) - 1, int(len(samples) * 0.9))]
+    print(f"  {label:18s} median {statistics.median(samples) * 1000:8.1f} ms   "
+          f"p90 {p90 * 1000:8.1f} ms   min {samples[0] * 1000:8.1f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--path', default='/api/health', help='endpoint requested for time to first byte')
+    parser.add_argument('--timeout', type=float, default=30.0, help='seconds to wait for the first byte')
+    parser.add_argument('--top', type=int, default=0, help='also list the N slowest imports')
+    args = parser.parse_args()
+
+    print(f"{args.runs} fresh interpreters each\n")
+    summarize("import main", [measure_import() for _ in range(args.runs)])
+    summarize(f"ttfb {args.path}", [measure_ttfb(args.path, args.timeout) for _ in range(args.runs)])
+
+    if args.top:
+        print("\nslowest imports (cumulative):")
+        for microseconds, name in slowest_imports(args.top):
+            print(f"  {microseconds / 1000:8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
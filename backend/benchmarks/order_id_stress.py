@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""Stress-test merchant order ID generation for collisions and ordering
+
+Issues IDs from several processes at once, each with several threads sharing
+the process generator (the way API workers and serverless instances do), then
+checks that:
+  - no two IDs are equal across all processes
+  - every ID fits PhonePe's 63-character limit and [A-Za-z0-9_-] charset
+  - each thread's IDs strictly increase (monotonic per process)
+  - sorting all IDs orders them by issue time to the millisecond (k-sortable)
+and reports single-thread and aggregate throughput.
+
+Usage: python benchmarks/order_id_stress.py [--processes 4] [--threads 4] [--ids 200000]
+"""
+
+import os
+import re
+import sys
+import time
+import argparse
+import threading
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from services.order_ids import MAX_ID_LENGTH, OrderIdGenerator, order_ids
+
+VALID_ID = re.compile(r'^[A-Za-z0-9_-]+$')
+
+
+def issue(args: tuple) -> tuple:
+    """Issue IDs from threads sharing this process's generator; returns (ids, failures, seconds)"""
+    threads, per_thread = args
+    results = [None] * threads
+    start = threading.Barrier(threads)
+
+    def run(slot: int) -> None:
+        start.wait()
+        results[slot] = [order_ids.order_id() for _ in range(per_thread)]
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=run, args=(slot,)) for slot in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    failures = 0
+    for ids in results:
+        failures += sum(1 for previous, current in zip(ids, ids[1:]) if current <= previous)
+    return [generated for ids in results for generated in ids], failures, elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4, help='threads per process')
+    parser.add_argument('--ids', type=int, default=200000, help='IDs per thread')
+    args = parser.parse_args()
+
+    generator = OrderIdGenerator()
+    started = time.perf_counter()
+    for _ in range(args.ids):
+        generator.order_id()
+    single = args.ids / (time.perf_counter() - started)
+    print(f"single thread: {single:,.0f} IDs/s")
+
+    # fork gives every child the parent's generator; each must re-draw its worker ID
+    context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn')
+    started = time.perf_counter()
+    with context.Pool(args.processes) as pool:
+        batches = pool.map(issue, [(args.threads, args.ids)] * args.processes)
+    wall = time.perf_counter() - started
+
+    all_ids = [generated for ids, _, _ in batches for generated in ids]
+    monotonic_failures = sum(failures for _, failures, _ in batches)
+    per_process = [len(ids) / seconds for ids, _, seconds in batches]
+    print(f"{args.processes} processes x {args.threads} threads: {len(all_ids):,} IDs in {wall:.2f}s "
+          f"({sum(per_process):,.0f} IDs/s summed over processes)")
+
+    duplicates = len(all_ids) - len(set(all_ids))
+    too_long = sum(1 for generated in all_ids if len(generated) > MAX_ID_LENGTH)
+    bad_chars = sum(1 for generated in all_ids if not VALID_ID.match(generated))
+    timestamps = [OrderIdGenerator.timestamp_ms(generated) for generated in sorted(all_ids)]
+    unsorted = sum(1 for previous, current in zip(timestamps, timestamps[1:]) if current < previous)
+
+    print(f"  duplicates:              {duplicates}")
+    print(f"  over {MAX_ID_LENGTH} characters:      {too_long} (length {len(all_ids[0])})")
+    print(f"  invalid characters:      {bad_chars}")
+    print(f"  non-monotonic in thread: {monotonic_failures}")
+    print(f"  out of time order:       {unsorted}")
+
+    if duplicates or too_long or bad_chars or monotonic_failures or unsorted:
+        raise SystemExit("FAILED")
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
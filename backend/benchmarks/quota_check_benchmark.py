@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""Benchmark quota-check latency as user_quotas grows
+
+Compares the legacy check (PERFORM reset_daily_quotas(); PERFORM
+reset_monthly_quotas(); then increment) with consume_quota from
+database_schema_performance.sql, which applies resets lazily to the one row
+it updates. Everything runs in a throwaway quota_bench schema.
+
+Requires a PostgreSQL DATABASE_URL (a local database, not production).
+
+Usage: python benchmarks/quota_check_benchmark.py [--sizes 10000,100000,1000000] [--calls 500]
+"""
+
+import os
+import re
+import time
+import random
+import asyncio
+import argparse
+import statistics
+
+import asyncpg
+from dotenv import load_dotenv
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'database_schema_performance.sql')
+
+SETUP_SQL = """
+DROP SCHEMA IF EXISTS quota_bench CASCADE;
+CREATE SCHEMA quota_bench;
+SET search_path TO quota_bench, public;
+
+CREATE TABLE user_quotas (
+  id BIGSERIAL PRIMARY KEY,
+  user_id UUID NOT NULL UNIQUE,
+  hits_used_today INTEGER DEFAULT 0,
+  hits_used_this_month INTEGER DEFAULT 0,
+  total_hits_used INTEGER DEFAULT 0,
+  daily_reset_at TIMESTAMP WITH TIME ZONE DEFAULT date_trunc('day', NOW() + INTERVAL '1 day'),
+  monthly_reset_at TIMESTAMP WITH TIME ZONE DEFAULT date_trunc('month', NOW() + INTERVAL '1 month'),
+  daily_limit INTEGER DEFAULT 7,
+  monthly_limit INTEGER DEFAULT -1,
+  plan_name VARCHAR(100) DEFAULT 'Free',
+  plan_expires_at TIMESTAMP WITH TIME ZONE,
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+CREATE INDEX idx_user_quotas_reset_dates ON user_quotas(daily_reset_at, monthly_reset_at);
+
+-- Legacy behaviour: table-wide resets on every call, then a single-row increment
+CREATE FUNCTION legacy_check(p_user_id UUID) RETURNS BOOLEAN AS $$
+DECLARE
+  v_found BOOLEAN;
+BEGIN
+  UPDATE user_quotas SET hits_used_today = 0, daily_reset_at = date_trunc('day', NOW() + INTERVAL '1 day'),
+    updated_at = NOW() WHERE daily_reset_at <= NOW();
+  UPDATE user_quotas SET hits_used_this_month = 0, monthly_reset_at = date_trunc('month', NOW() + INTERVAL '1 month'),
+    updated_at = NOW() WHERE monthly_reset_at <= NOW();
+  UPDATE user_quotas SET hits_used_today = hits_used_today + 1, hits_used_this_month = hits_used_this_month + 1,
+    total_hits_used = total_hits_used + 1, updated_at = NOW()
+  WHERE user_id = p_user_id AND hits_used_today < daily_limit;
+  v_found := FOUND;
+  RETURN v_found;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+
+def load_quota_functions() -> str:
+    """Pull the quota_* helpers and consume_quota out of the migration file"""
+    with open(SCHEMA_FILE, 'r', encoding='utf-8') as schema:
+        sql = schema.read()
+    functions = re.findall(
+        r"CREATE OR REPLACE FUNCTION (?:quota_\w+|consume_quota)\(.*?\$\$ LANGUAGE \w+(?: \w+)?;",
+        sql, flags=re.S
+    )
+    if len(functions) < 5:
+        raise SystemExit(f"Could not find the quota functions in {SCHEMA_FILE}")
+    return "\n\n".join(functions)
+
+
+async def populate(conn: asyncpg.Connection, size: int) -> list:
+    """Grow user_quotas to size rows; a slice has reset times already in the past"""
+    current = await conn.fetchval("SELECT COUNT(*) FROM user_quotas")
+    if size > current:
+        await conn.execute(
+            """
+            INSERT INTO user_quotas (user_id, hits_used_today, hits_used_this_month, daily_reset_at)
+            SELECT uuid_generate_v4(), (random() * 5)::INT, (random() * 50)::INT,
+                   CASE WHEN random() < 0.3 THEN NOW() - INTERVAL '1 hour'
+                        ELSE date_trunc('day', NOW() + INTERVAL '1 day') END
+            FROM generate_series(1, $1)
+            """,
+            size - current
+        )
+        await conn.execute("ANALYZE user_quotas")
+    rows = await conn.fetch("SELECT user_id FROM user_quotas TABLESAMPLE SYSTEM (1) LIMIT 5000")
+    return [row["user_id"] for row in rows]
+
+
+async def time_calls(conn: asyncpg.Connection, query: str, user_ids: list, calls: int) -> list:
+    samples = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        await conn.fetchval(query, random.choice(user_ids))
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def summarize(samples: list) -> str:
+    samples = sorted(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    return f"p50 {statistics.median(samples):8.3f} ms   p99 {p99:8.3f} ms   max {samples[-1]:8.3f} ms"
+
+
+async def main() -> None:
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10000,100000,1000000', help='comma-separated user_quotas sizes')
+    parser.add_argument('--calls', type=int, default=500, help='quota checks per function and size')
+    parser.add_argument('--database-url', default=os.getenv('DATABASE_URL'))
+    args = parser.parse_args()
+
+    if not args.database_url:
+        raise SystemExit("Set DATABASE_URL (or pass --database-url) to a disposable PostgreSQL database")
+
+    conn = await asyncpg.connect(args.database_url)
+    try:
+        await conn.execute('CREATE EXTENSION IF NOT EXISTS "uuid-ossp"')
+        await conn.execute(SETUP_SQL)
+        await conn.execute(load_quota_functions())
+
+        for size in [int(size) for size in args.sizes.split(',')]:
+            user_ids = await populate(conn, size)
+            print(f"\nuser_quotas rows: {size:,}")
+
+            # Midnight rollover: every row is due for a daily reset
+            await conn.execute("UPDATE user_quotas SET daily_reset_at = NOW() - INTERVAL '1 second'")
+            started = time.perf_counter()
+            await conn.fetchval("SELECT legacy_check($1)", user_ids[0])
+            print(f"  legacy first call after rollover:  {(time.perf_counter() - started) * 1000:10.3f} ms")
+
+            await conn.execute("UPDATE user_quotas SET daily_reset_at = NOW() - INTERVAL '1 second'")
+            started = time.perf_counter()
+            await conn.fetchval("SELECT allowed FROM consume_quota($1)", user_ids[0])
+            print(f"  lazy first call after rollover:    {(time.perf_counter() - started) * 1000:10.3f} ms")
+
+            legacy = await time_calls(conn, "SELECT legacy_check($1)", user_ids, args.calls)
+            lazy = await time_calls(conn, "SELECT allowed FROM consume_quota($1)", user_ids, args.calls)
+            print(f"  legacy check_and_increment:  {summarize(legacy)}")
+            print(f"  lazy consume_quota:          {summarize(lazy)}")
+    finally:
+        await conn.execute("DROP SCHEMA IF EXISTS quota_bench CASCADE")
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
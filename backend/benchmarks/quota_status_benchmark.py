@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""Compare quota-status latency: legacy two-query path vs one round trip
+
+Legacy:    user_quotas select, then user_subscriptions joined to subscription_plans
+RPC:       get_quota_status through PostgREST (supabase-py)
+Prepared:  get_quota_status through an asyncpg pool (needs DATABASE_URL)
+
+Needs SUPABASE_URL / SUPABASE_SERVICE_ROLE_KEY and an existing user id with a
+user_quotas row. The get_quota_status function from database_schema_performance.sql
+must be applied.
+
+Usage: python benchmarks/quota_status_benchmark.py --user-id <uuid> [--calls 200]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from services.supabase_client import QUOTA_STATUS_QUERY, supabase_service
+
+
+def legacy_check(user_id: str) -> None:
+    client = supabase_service.supabase
+    client.table('user_quotas').select('*').eq('user_id', user_id).execute()
+    client.table('user_subscriptions').select('*, subscription_plans(*)').eq(
+        'user_id', user_id
+    ).eq('status', 'active').execute()
+
+
+def rpc_check(user_id: str) -> None:
+    supabase_service.supabase.rpc('get_quota_status', {'p_user_id': user_id}).execute()
+
+
+def summarize(samples: list) -> str:
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    return f"p50 {statistics.median(samples):8.2f} ms   p95 {p95:8.2f} ms   max {samples[-1]:8.2f} ms"
+
+
+def time_sync(check, user_id: str, calls: int) -> list:
+    check(user_id)  # warm the connection
+    samples = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        check(user_id)
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+async def time_prepared(user_id: str, calls: int) -> list:
+    await supabase_service.init_connection_pool()
+    try:
+        await supabase_service.connection_pool.fetchrow(QUOTA_STATUS_QUERY, user_id)
+        samples = []
+        for _ in range(calls):
+            started = time.perf_counter()
+            await supabase_service.connection_pool.fetchrow(QUOTA_STATUS_QUERY, user_id)
+            samples.append((time.perf_counter() - started) * 1000)
+        return samples
+    finally:
+        await supabase_service.close_connection_pool()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--user-id', required=True, help='user id with a user_quotas row')
+    parser.add_argument('--calls', type=int, default=200, help='checks per path')
+    args = parser.parse_args()
+
+    print(f"Quota status for {args.user_id}, {args.calls} calls per path\n")
+    print(f"  legacy two queries:     {summarize(time_sync(legacy_check, args.user_id, args.calls))}")
+    print(f"  get_quota_status RPC:   {summarize(time_sync(rpc_check, args.user_id, args.calls))}")
+
+    if supabase_service.database_url:
+        prepared = asyncio.run(time_prepared(args.user_id, args.calls))
+        print(f"  asyncpg prepared:       {summarize(prepared)}")
+    else:
+        print("  asyncpg prepared:       skipped (DATABASE_URL not set)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""Benchmark cold versus warm invocations of the Vercel handlers under api/
+
+Each container is a fresh interpreter that imports one handler (and with it
+api/_runtime.py) and serves --invocations requests in a row, like a Vercel
+instance that stays warm. The first invocation is the cold start (import plus
+OAuth plus a new connection); the rest show what the shared runtime saves by
+reusing the token and the keep-alive connection. PhonePe is replaced by a local
+stand-in with configurable latency and connection setup (handshake) cost.
+
+Usage: python benchmarks/vercel_handler_benchmark.py [--handler create-payment] [--containers 5] [--invocations 20] [--latency-ms 20] [--handshake-ms 30]
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import statistics
+import subprocess
+import threading
+import http.client
+import importlib.util
+from http.server import BaseHTTPRequestHandler, HTTPServer, ThreadingHTTPServer
+
+API_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'api')
+
+HANDLERS = {
+    "create-payment": "phonepe/create-payment.py",
+    "verify-payment": "phonepe/verify-payment.py",
+    "webhook": "webhooks/phonepe.py",
+    "health": "health.py",
+}
+
+WEBHOOK_PASSWORD = "benchmark"
+
+
+class StandInStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.tokens = 0
+        self.requests = 0
+
+    def add(self, name: str) -> None:
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+
+def make_stand_in(stats: StandInStats, latency: float, handshake: float) -> type:
+    """PhonePe stand-in: OAuth token, pay and order status with fixed latency"""
+
+    class StandIn(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Headers and body go out as separate writes; avoid the delayed-ACK stall on keep-alive
+        disable_nagle_algorithm = True
+
+        def setup(self):
+            super().setup()
+            stats.add("connections")
+            time.sleep(handshake)
+
+        def log_message(self, format, *args):
+            pass
+
+        def _reply(self, data):
+            time.sleep(latency)
+            body = json.dumps(data).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            stats.add("requests")
+            if self.path.endswith('/oauth/token'):
+                stats.add("tokens")
+                self._reply({"access_token": "stand-in-token", "expires_at": int(time.time()) + 3600})
+            else:
+                self._reply({"orderId": "OMO" + str(time.time_ns()), "state": "PENDING",
+                             "expireAt": int(time.time() * 1000) + 1800000, "redirectUrl": "https://example.com/pay"})
+
+        def do_GET(self):
+            stats.add("requests")
+            self._reply({"orderId": "OMO1", "state": "COMPLETED", "amount": 47082, "paymentDetails": []})
+
+    return StandIn
+
+
+def invocation_request(name: str):
+    """(method, path, body, headers) for one invocation of the handler"""
+    if name == "create-payment":
+        body = json.dumps({"user_id": "benchmark-user", "plan_id": "pro_plan", "billing_cycle": "monthly"}).encode()
+        return "POST", "/api/phonepe/create-payment", body, {"Content-Type": "application/json"}
+    if name == "verify-payment":
+        return "GET", "/api/phonepe/verify-payment/LEKHAK_BENCHMARK", None, {}
+    if name == "webhook":
+        body = json.dumps({"event": "checkout.order.completed",
+                           "payload": {"merchantOrderId": "LEKHAK_BENCHMARK", "state": "COMPLETED"}}).encode()
+        signature = hashlib.sha256(body + WEBHOOK_PASSWORD.encode()).hexdigest()
+        return "POST", "/api/webhooks/phonepe", body, {"Authorization": f"SHA256 {signature}"}
+    return "GET", "/api/health", None, {}
+
+
+def run_container(name: str, invocations: int) -> None:
+    """Child process: import the handler, then time each invocation; prints JSON"""
+    started = time.perf_counter()
+    spec = importlib.util.spec_from_file_location("handler_under_test", os.path.join(API_DIR, HANDLERS[name]))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    imported = time.perf_counter() - started
+
+    server = HTTPServer(('127.0.0.1', 0), module.handler)
+    server.RequestHandlerClass.log_message = lambda *args: None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    method, path, body, headers = invocation_request(name)
+    timings, statuses = [], []
+    for _ in range(invocations):
+        begun = time.perf_counter()
+        conn = http.client.HTTPConnection('127.0.0.1', server.server_address[1])
+        conn.request(method, path, body=body, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        conn.close()
+        timings.append(time.perf_counter() - begun)
+        statuses.append(response.status)
+    server.shutdown()
+    print(json.dumps({"import": imported, "invocations": timings, "statuses": statuses}))
+
+
+def percentile(samples: list, fraction: float) -> float:
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--handler', choices=sorted(HANDLERS), default='create-payment')
+    parser.add_argument('--containers', type=int, default=5, help='fresh interpreters (cold starts)')
+    parser.add_argument('--invocations', type=int, default=20, help='invocations per container')
+    parser.add_argument('--latency-ms', type=float, default=20.0, help='stand-in response latency')
+    parser.add_argument('--handshake-ms', type=float, default=30.0, help='stand-in cost of each new connection')
+    parser.add_argument('--container', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.container:
+        run_container(args.handler, args.invocations)
+        return
+
+    stats = StandInStats()
+    stand_in = ThreadingHTTPServer(('127.0.0.1', 0), make_stand_in(stats, args.latency_ms / 1000, args.handshake_ms / 1000))
+    threading.Thread(target=stand_in.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{stand_in.server_address[1]}"
+
+    env = dict(
+        os.environ,
+        PHONEPE_CLIENT_ID='benchmark', PHONEPE_CLIENT_SECRET='benchmark', PHONEPE_MERCHANT_ID='benchmark',
+        PHONEPE_WEBHOOK_URL=f"{base}/webhook", PHONEPE_WEBHOOK_PASSWORD=WEBHOOK_PASSWORD,
+        PHONEPE_AUTH_URL=f"{base}/v1/oauth/token", PHONEPE_CHECKOUT_URL=f"{base}/checkout/v2/pay",
+        PHONEPE_STATUS_URL=f"{base}/checkout/v2/order",
+        # Containers do not share /tmp, so each cold start must fetch its own token
+        PHONEPE_TOKEN_STORE='memory'
+    )
+
+    imports, cold, warm = [], [], []
+    for _ in range(args.containers):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--container', '--handler', args.handler,
+             '--invocations', str(args.invocations)],
+            env=env, capture_output=True, text=True, check=True
+        )
+        result = json.loads(output.stdout.strip().splitlines()[-1])
+        if set(result["statuses"]) != {200}:
+            raise SystemExit(f"Handler returned {result['statuses']}")
+        imports.append(result["import"])
+        cold.append(result["import"] + result["invocations"][0])
+        warm.extend(result["invocations"][1:])
+
+    stand_in.shutdown()
+    print(f"{args.handler}: {args.containers} containers x {args.invocations} invocations, "
+          f"stand-in latency {args.latency_ms:.0f} ms, handshake {args.handshake_ms:.0f} ms\n")
+    for label, samples in (("import", imports), ("cold invocation", cold), ("warm invocation", warm)):
+        if samples:
+            print(f"  {label:16s} median {statistics.median(samples) * 1000:8.1f} ms   p90 {percentile(samples, 0.9) * 1000:8.1f} ms")
+    print(f"\n  PhonePe stand-in: {stats.requests} requests, {stats.tokens} token fetches, "
+          f"{stats.connections} connections")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""Benchmark the cost of rejecting unauthenticated and oversized webhooks
+
+Compares the old ingest path (read whole body, parse JSON, then verify) with
+PhonePeWebhookHandler.process_webhook, which checks the Authorization header
+and Content-Length first and streams the body into the SHA256 digest.
+
+Usage: python benchmarks/webhook_reject_benchmark.py [--seconds 2] [--body-kb 512]
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+os.environ.setdefault('PHONEPE_WEBHOOK_USERNAME', 'benchmark')
+os.environ.setdefault('PHONEPE_WEBHOOK_PASSWORD', 'benchmark')
+
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from services.phonepe_webhook import PhonePeWebhookHandler
+
+CHUNK_SIZE = 64 * 1024
+
+
+def make_request(body: bytes, authorization: str, content_length: bool = True) -> Request:
+    """Build a Starlette request that delivers the body in ASGI-sized chunks"""
+    headers = [(b'authorization', authorization.encode())] if authorization else []
+    if content_length:
+        headers.append((b'content-length', str(len(body)).encode()))
+
+    chunks = [body[i:i + CHUNK_SIZE] for i in range(0, len(body), CHUNK_SIZE)] or [b'']
+    position = 0
+
+    async def receive():
+        nonlocal position
+        chunk = chunks[position]
+        position += 1
+        return {"type": "http.request", "body": chunk, "more_body": position < len(chunks)}
+
+    scope = {"type": "http", "method": "POST", "path": "/api/webhooks/phonepe", "headers": headers}
+    return Request(scope, receive)
+
+
+async def legacy_reject(handler: PhonePeWebhookHandler, request: Request) -> None:
+    """Previous ingest order: full body read and JSON parse before verification"""
+    webhook_body = await request.body()
+    try:
+        json.loads(webhook_body.decode('utf-8'))
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Invalid JSON payload")
+    if not handler._verify_webhook_signature(request.headers.get('Authorization', ''), webhook_body):
+        raise HTTPException(status_code=401, detail="Invalid webhook signature")
+
+
+async def measure(name: str, reject, make, seconds: float) -> None:
+    rejected = 0
+    status_codes = set()
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        try:
+            await reject(make())
+        except HTTPException as e:
+            status_codes.add(e.status_code)
+            rejected += 1
+    elapsed = time.perf_counter() - started
+    print(f"  {name:<44} {rejected / elapsed:>12,.0f} rejects/s  "
+          f"{elapsed / max(rejected, 1) * 1e6:>9.1f} us/reject  status={sorted(status_codes)}")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=2.0, help='duration of each scenario')
+    parser.add_argument('--body-kb', type=int, default=512, help='size of the forged webhook body')
+    args = parser.parse_args()
+
+    handler = PhonePeWebhookHandler()
+    handler.max_body_bytes = 1024 * 1024
+    # Keep the benchmark output readable
+    handler.logger.disabled = True
+
+    event = {"event": "checkout.order.completed", "payload": {"merchantOrderId": "BENCH", "state": "COMPLETED"},
+             "padding": ["x" * 1000] * (args.body_kb)}
+    body = json.dumps(event).encode()
+    forged = "SHA256 " + hashlib.sha256(b"not the secret").hexdigest()
+    oversized = body * (handler.max_body_bytes // len(body) + 2)
+
+    print(f"Forged body: {len(body) / 1024:.0f} KiB, limit: {handler.max_body_bytes // 1024} KiB\n")
+
+    scenarios = [
+        ("missing Authorization header", lambda: make_request(body, "")),
+        ("forged signature", lambda: make_request(body, forged)),
+        ("oversized body with Content-Length", lambda: make_request(oversized, forged)),
+        ("oversized body, chunked (no Content-Length)", lambda: make_request(oversized, forged, False)),
+    ]
+
+    for title, make in scenarios:
+        print(title)
+        await measure("legacy: read + parse + verify", lambda r: legacy_reject(handler, r), make, args.seconds)
+        await measure("process_webhook: header + streamed digest", handler.process_webhook, make, args.seconds)
+        print()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,455 @@
+-- Lekhak AI PhonePe Payment Integration - Performance Migrations
+-- Apply after database_schema.sql
+-- Compatible with: PostgreSQL 12+
+
+-- Webhook deduplication: one webhook_events row per (event class, entity id, state) or body digest
+ALTER TABLE webhook_events ADD COLUMN IF NOT EXISTS dedup_key VARCHAR(255);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_webhook_events_dedup_key ON webhook_events(dedup_key);
+
+-- Audit trail for payment, settlement and dispute webhooks, written in bulk by the write-behind buffer
+CREATE TABLE IF NOT EXISTS audit_events (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    entity_type VARCHAR(50) NOT NULL,
+    entity_id VARCHAR(255),
+    status VARCHAR(50) NOT NULL,
+    merchant_order_id VARCHAR(255),
+    payload JSONB,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS idx_audit_events_entity ON audit_events(entity_type, entity_id);
+CREATE INDEX IF NOT EXISTS idx_audit_events_merchant_order_id ON audit_events(merchant_order_id);
+CREATE INDEX IF NOT EXISTS idx_audit_events_created_at ON audit_events(created_at);
+
+-- ==========================================
+-- LAZY QUOTA RESETS
+-- ==========================================
+-- Plan limits live on the quota row, so a quota check reads and writes exactly one row.
+-- Daily/monthly resets and plan expiry are applied to that row inside the same UPDATE,
+-- replacing the table-wide reset_daily_quotas()/reset_monthly_quotas() scans.
+
+ALTER TABLE user_quotas ADD COLUMN IF NOT EXISTS plan_name VARCHAR(100) DEFAULT 'Free';
+ALTER TABLE user_quotas ADD COLUMN IF NOT EXISTS plan_expires_at TIMESTAMP WITH TIME ZONE;
+
+-- Backfill limits from active subscriptions (paid plans are limited per month only)
+UPDATE user_quotas AS q
+SET
+  plan_name = p.name,
+  plan_expires_at = s.current_period_end,
+  daily_limit = -1,
+  monthly_limit = p.hits_limit
+FROM user_subscriptions s
+JOIN subscription_plans p ON p.id = s.plan_id
+WHERE s.user_id = q.user_id
+  AND s.status = 'active'
+  AND p.name <> 'Free'
+  AND (s.current_period_end IS NULL OR s.current_period_end > NOW());
+
+-- Usage counter as of p_now: zero once its reset time has passed
+CREATE OR REPLACE FUNCTION quota_effective_used(p_used INTEGER, p_reset_at TIMESTAMP WITH TIME ZONE, p_now TIMESTAMP WITH TIME ZONE)
+RETURNS INTEGER AS $$
+  SELECT CASE WHEN p_reset_at <= p_now THEN 0 ELSE COALESCE(p_used, 0) END;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Next reset time: unchanged until it passes, then the start of the next day/month
+CREATE OR REPLACE FUNCTION quota_next_reset(p_reset_at TIMESTAMP WITH TIME ZONE, p_now TIMESTAMP WITH TIME ZONE, p_unit TEXT)
+RETURNS TIMESTAMP WITH TIME ZONE AS $$
+  SELECT CASE
+    WHEN p_reset_at IS NULL OR p_reset_at <= p_now THEN date_trunc(p_unit, p_now + ('1 ' || p_unit)::INTERVAL)
+    ELSE p_reset_at
+  END;
+$$ LANGUAGE sql STABLE;
+
+-- Limit as of p_now: falls back to the free-plan value once the paid plan has expired
+CREATE OR REPLACE FUNCTION quota_effective_limit(p_limit INTEGER, p_free_limit INTEGER, p_plan_expires_at TIMESTAMP WITH TIME ZONE, p_now TIMESTAMP WITH TIME ZONE)
+RETURNS INTEGER AS $$
+  SELECT CASE WHEN p_plan_expires_at <= p_now THEN p_free_limit ELSE COALESCE(p_limit, p_free_limit) END;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Hits left under both limits (-1 = unlimited)
+CREATE OR REPLACE FUNCTION quota_remaining(p_used_today INTEGER, p_daily_limit INTEGER, p_used_month INTEGER, p_monthly_limit INTEGER)
+RETURNS INTEGER AS $$
+  SELECT CASE
+    WHEN p_daily_limit = -1 AND p_monthly_limit = -1 THEN -1
+    WHEN p_daily_limit = -1 THEN GREATEST(0, p_monthly_limit - p_used_month)
+    WHEN p_monthly_limit = -1 THEN GREATEST(0, p_daily_limit - p_used_today)
+    ELSE GREATEST(0, LEAST(p_daily_limit - p_used_today, p_monthly_limit - p_used_month))
+  END;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Consume p_hits from one user's quota in a single-row UPDATE ... RETURNING.
+-- The limit check sits in the WHERE clause, so concurrent calls re-check against the
+-- latest row version and can never overshoot a limit.
+CREATE OR REPLACE FUNCTION consume_quota(p_user_id UUID, p_hits INTEGER DEFAULT 1)
+RETURNS TABLE(
+  allowed BOOLEAN,
+  hits_remaining INTEGER,
+  hits_used_today INTEGER,
+  hits_used_this_month INTEGER,
+  daily_limit INTEGER,
+  monthly_limit INTEGER,
+  plan_name VARCHAR(100),
+  daily_reset_at TIMESTAMP WITH TIME ZONE,
+  monthly_reset_at TIMESTAMP WITH TIME ZONE
+) AS $$
+#variable_conflict use_column
+DECLARE
+  v_now TIMESTAMP WITH TIME ZONE := NOW();
+BEGIN
+  RETURN QUERY
+  UPDATE user_quotas AS q
+  SET
+    hits_used_today = quota_effective_used(q.hits_used_today, q.daily_reset_at, v_now) + p_hits,
+    hits_used_this_month = quota_effective_used(q.hits_used_this_month, q.monthly_reset_at, v_now) + p_hits,
+    total_hits_used = COALESCE(q.total_hits_used, 0) + p_hits,
+    daily_reset_at = quota_next_reset(q.daily_reset_at, v_now, 'day'),
+    monthly_reset_at = quota_next_reset(q.monthly_reset_at, v_now, 'month'),
+    daily_limit = quota_effective_limit(q.daily_limit, 7, q.plan_expires_at, v_now),
+    monthly_limit = quota_effective_limit(q.monthly_limit, -1, q.plan_expires_at, v_now),
+    plan_name = CASE WHEN q.plan_expires_at <= v_now THEN 'Free' ELSE COALESCE(q.plan_name, 'Free') END,
+    plan_expires_at = CASE WHEN q.plan_expires_at <= v_now THEN NULL ELSE q.plan_expires_at END,
+    updated_at = v_now
+  WHERE q.user_id = p_user_id
+    AND (quota_effective_limit(q.daily_limit, 7, q.plan_expires_at, v_now) = -1
+         OR quota_effective_used(q.hits_used_today, q.daily_reset_at, v_now) + p_hits
+            <= quota_effective_limit(q.daily_limit, 7, q.plan_expires_at, v_now))
+    AND (quota_effective_limit(q.monthly_limit, -1, q.plan_expires_at, v_now) = -1
+         OR quota_effective_used(q.hits_used_this_month, q.monthly_reset_at, v_now) + p_hits
+            <= quota_effective_limit(q.monthly_limit, -1, q.plan_expires_at, v_now))
+  RETURNING
+    true,
+    quota_remaining(q.hits_used_today, q.daily_limit, q.hits_used_this_month, q.monthly_limit),
+    q.hits_used_today,
+    q.hits_used_this_month,
+    q.daily_limit,
+    q.monthly_limit,
+    q.plan_name,
+    q.daily_reset_at,
+    q.monthly_reset_at;
+
+  IF FOUND THEN
+    RETURN;
+  END IF;
+
+  -- Denied: report the lazily-reset state of the same row without writing it
+  RETURN QUERY
+  SELECT
+    false,
+    quota_remaining(
+      quota_effective_used(q.hits_used_today, q.daily_reset_at, v_now),
+      quota_effective_limit(q.daily_limit, 7, q.plan_expires_at, v_now),
+      quota_effective_used(q.hits_used_this_month, q.monthly_reset_at, v_now),
+      quota_effective_limit(q.monthly_limit, -1, q.plan_expires_at, v_now)),
+    quota_effective_used(q.hits_used_today, q.daily_reset_at, v_now),
+    quota_effective_used(q.hits_used_this_month, q.monthly_reset_at, v_now),
+    quota_effective_limit(q.daily_limit, 7, q.plan_expires_at, v_now),
+    quota_effective_limit(q.monthly_limit, -1, q.plan_expires_at, v_now),
+    CASE WHEN q.plan_expires_at <= v_now THEN 'Free' ELSE COALESCE(q.plan_name, 'Free') END::VARCHAR(100),
+    quota_next_reset(q.daily_reset_at, v_now, 'day'),
+    quota_next_reset(q.monthly_reset_at, v_now, 'month')
+  FROM user_quotas AS q
+  WHERE q.user_id = p_user_id;
+
+  IF FOUND THEN
+    RETURN;
+  END IF;
+
+  -- First use: create the quota row and consume from it
+  INSERT INTO user_quotas (user_id) VALUES (p_user_id) ON CONFLICT (user_id) DO NOTHING;
+  RETURN QUERY SELECT * FROM consume_quota(p_user_id, p_hits);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Same contract as before, without the per-call full-table reset scans
+CREATE OR REPLACE FUNCTION check_and_increment_quota(p_extension_id VARCHAR)
+RETURNS TABLE(
+  can_use BOOLEAN,
+  hits_remaining INTEGER,
+  is_free_user BOOLEAN,
+  subscription_status VARCHAR(50),
+  plan_name VARCHAR(100)
+) AS $$
+#variable_conflict use_column
+DECLARE
+  v_user_id UUID;
+  v_quota RECORD;
+BEGIN
+  SELECT id INTO v_user_id FROM users WHERE extension_id = p_extension_id;
+
+  IF v_user_id IS NULL THEN
+    INSERT INTO users (extension_id) VALUES (p_extension_id)
+    ON CONFLICT (extension_id) DO UPDATE SET last_seen = NOW()
+    RETURNING id INTO v_user_id;
+  END IF;
+
+  SELECT * INTO v_quota FROM consume_quota(v_user_id, 1);
+
+  RETURN QUERY SELECT
+    v_quota.allowed,
+    v_quota.hits_remaining,
+    v_quota.plan_name = 'Free',
+    (CASE WHEN v_quota.plan_name = 'Free' THEN 'free' ELSE 'active' END)::VARCHAR(50),
+    v_quota.plan_name;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Apply usage already admitted by in-process quota caches, aggregated per user, in one statement.
+-- Returns the refreshed state so callers can renew their local budgets in the same round trip.
+CREATE OR REPLACE FUNCTION apply_quota_usage(p_user_ids UUID[], p_hits INTEGER[])
+RETURNS TABLE(
+  user_id UUID,
+  hits_remaining INTEGER,
+  hits_used_today INTEGER,
+  hits_used_this_month INTEGER,
+  daily_limit INTEGER,
+  monthly_limit INTEGER,
+  plan_name VARCHAR(100),
+  daily_reset_at TIMESTAMP WITH TIME ZONE,
+  monthly_reset_at TIMESTAMP WITH TIME ZONE
+) AS $$
+#variable_conflict use_column
+DECLARE
+  v_now TIMESTAMP WITH TIME ZONE := NOW();
+BEGIN
+  RETURN QUERY
+  UPDATE user_quotas AS q
+  SET
+    hits_used_today = quota_effective_used(q.hits_used_today, q.daily_reset_at, v_now) + u.hits,
+    hits_used_this_month = quota_effective_used(q.hits_used_this_month, q.monthly_reset_at, v_now) + u.hits,
+    total_hits_used = COALESCE(q.total_hits_used, 0) + u.hits,
+    daily_reset_at = quota_next_reset(q.daily_reset_at, v_now, 'day'),
+    monthly_reset_at = quota_next_reset(q.monthly_reset_at, v_now, 'month'),
+    daily_limit = quota_effective_limit(q.daily_limit, 7, q.plan_expires_at, v_now),
+    monthly_limit = quota_effective_limit(q.monthly_limit, -1, q.plan_expires_at, v_now),
+    plan_name = CASE WHEN q.plan_expires_at <= v_now THEN 'Free' ELSE COALESCE(q.plan_name, 'Free') END,
+    plan_expires_at = CASE WHEN q.plan_expires_at <= v_now THEN NULL ELSE q.plan_expires_at END,
+    updated_at = v_now
+  FROM unnest(p_user_ids, p_hits) AS u(user_id, hits)
+  WHERE q.user_id = u.user_id
+  RETURNING
+    q.user_id,
+    quota_remaining(q.hits_used_today, q.daily_limit, q.hits_used_this_month, q.monthly_limit),
+    q.hits_used_today,
+    q.hits_used_this_month,
+    q.daily_limit,
+    q.monthly_limit,
+    q.plan_name,
+    q.daily_reset_at,
+    q.monthly_reset_at;
+END;
+$$ LANGUAGE plpgsql;
+
+-- The usage_logs trigger from database_schema.sql adds to the counters without moving the
+-- reset times; once a reset passed, quota_effective_used() would read those counters as 0
+-- forever. Count through the same lazy reset as consume_quota().
+CREATE OR REPLACE FUNCTION update_user_quota()
+RETURNS TRIGGER AS $$
+DECLARE
+  v_now TIMESTAMP WITH TIME ZONE := NOW();
+BEGIN
+  INSERT INTO user_quotas (user_id, hits_used_today, hits_used_this_month, total_hits_used)
+  VALUES (NEW.user_id, 1, 1, 1)
+  ON CONFLICT (user_id) DO UPDATE SET
+    hits_used_today = quota_effective_used(user_quotas.hits_used_today, user_quotas.daily_reset_at, v_now) + 1,
+    hits_used_this_month = quota_effective_used(user_quotas.hits_used_this_month, user_quotas.monthly_reset_at, v_now) + 1,
+    total_hits_used = COALESCE(user_quotas.total_hits_used, 0) + 1,
+    daily_reset_at = quota_next_reset(user_quotas.daily_reset_at, v_now, 'day'),
+    monthly_reset_at = quota_next_reset(user_quotas.monthly_reset_at, v_now, 'month'),
+    updated_at = v_now;
+
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Hits are counted by consume_quota() and apply_quota_usage(); usage_logs is a log only,
+-- and counting its rows as well would charge every hit twice.
+DROP TRIGGER IF EXISTS trigger_update_user_quota ON usage_logs;
+
+-- ==========================================
+-- SINGLE ROUND-TRIP QUOTA STATUS
+-- ==========================================
+-- Usage and limits in one query, read from the limits cached on the quota row so the status
+-- always agrees with consume_quota() and check_and_increment_quota(). Nothing is written:
+-- resets and plan expiry are applied the same way consume_quota() would apply them.
+CREATE OR REPLACE FUNCTION get_quota_status(p_user_id UUID)
+RETURNS TABLE(
+  can_use BOOLEAN,
+  hits_remaining INTEGER,
+  hits_used_today INTEGER,
+  hits_used_this_month INTEGER,
+  daily_limit INTEGER,
+  monthly_limit INTEGER,
+  plan_name VARCHAR(100),
+  subscription_status VARCHAR(50)
+) AS $$
+  WITH status AS (
+    SELECT
+      quota_effective_used(q.hits_used_today, q.daily_reset_at, NOW()) AS used_today,
+      quota_effective_used(q.hits_used_this_month, q.monthly_reset_at, NOW()) AS used_month,
+      quota_effective_limit(q.daily_limit, 7, q.plan_expires_at, NOW()) AS daily_limit,
+      quota_effective_limit(q.monthly_limit, -1, q.plan_expires_at, NOW()) AS monthly_limit,
+      CASE WHEN q.plan_expires_at <= NOW() THEN 'Free' ELSE COALESCE(q.plan_name, 'Free') END AS plan_name
+    FROM user_quotas q
+    WHERE q.user_id = p_user_id
+  )
+  SELECT
+    quota_remaining(used_today, daily_limit, used_month, monthly_limit) <> 0,
+    quota_remaining(used_today, daily_limit, used_month, monthly_limit),
+    used_today,
+    used_month,
+    daily_limit,
+    monthly_limit,
+    plan_name::VARCHAR(100),
+    (CASE WHEN plan_name = 'Free' THEN 'free' ELSE lower(plan_name) END)::VARCHAR(50)
+  FROM status;
+$$ LANGUAGE sql STABLE;
+
+CREATE INDEX IF NOT EXISTS idx_user_subscriptions_user_active
+  ON user_subscriptions(user_id, created_at DESC) WHERE status = 'active';
+
+-- ==========================================
+-- TRANSACTIONAL SUBSCRIPTION ACTIVATION
+-- ==========================================
+-- UNIQUE (user_id, status) allowed only one cancelled subscription per user, so a second
+-- upgrade could never commit. Only one *active* subscription per user is required.
+ALTER TABLE user_subscriptions DROP CONSTRAINT IF EXISTS unique_active_subscription;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_user_subscriptions_one_active
+  ON user_subscriptions(user_id) WHERE status = 'active';
+CREATE INDEX IF NOT EXISTS idx_user_subscriptions_merchant_order_id
+  ON user_subscriptions(phonepe_merchant_order_id);
+
+-- Activate the plan paid for by one order: cancel the current subscription, insert the new
+-- one, link it to the payment and cache the plan limits on the quota row, all in the caller's
+-- single transaction. Locking the payment and then the user serializes redeliveries of the same
+-- order and concurrent upgrades of the same user. Re-activating an order returns the existing
+-- subscription with created = false. No row means the payment or the plan was not found.
+CREATE OR REPLACE FUNCTION activate_subscription(p_merchant_order_id VARCHAR)
+RETURNS TABLE(
+  user_id UUID,
+  subscription_id UUID,
+  plan_name VARCHAR(100),
+  current_period_end TIMESTAMP WITH TIME ZONE,
+  created BOOLEAN
+) AS $$
+#variable_conflict use_column
+DECLARE
+  v_payment RECORD;
+  v_plan RECORD;
+  v_existing RECORD;
+  v_subscription_id UUID;
+  v_now TIMESTAMP WITH TIME ZONE := NOW();
+  v_period_end TIMESTAMP WITH TIME ZONE := NOW() + INTERVAL '1 month';
+BEGIN
+  SELECT id, user_id, metadata INTO v_payment
+  FROM payment_transactions
+  WHERE phonepe_merchant_order_id = p_merchant_order_id
+  FOR UPDATE;
+
+  IF NOT FOUND THEN
+    RETURN;
+  END IF;
+
+  SELECT s.id, s.current_period_end, p.name INTO v_existing
+  FROM user_subscriptions s
+  JOIN subscription_plans p ON p.id = s.plan_id
+  WHERE s.phonepe_merchant_order_id = p_merchant_order_id
+  ORDER BY s.created_at DESC
+  LIMIT 1;
+
+  IF FOUND THEN
+    RETURN QUERY SELECT v_payment.user_id, v_existing.id, v_existing.name, v_existing.current_period_end, false;
+    RETURN;
+  END IF;
+
+  SELECT id, name, hits_limit INTO v_plan
+  FROM subscription_plans
+  WHERE name = COALESCE(v_payment.metadata->>'plan_name', 'Pro');
+
+  IF NOT FOUND THEN
+    RETURN;
+  END IF;
+
+  PERFORM 1 FROM users WHERE id = v_payment.user_id FOR UPDATE;
+
+  UPDATE user_subscriptions
+  SET status = 'cancelled', cancelled_at = v_now, updated_at = v_now
+  WHERE user_id = v_payment.user_id AND status = 'active';
+
+  INSERT INTO user_subscriptions (user_id, plan_id, status, billing_cycle, phonepe_merchant_order_id,
+                                  started_at, current_period_start, current_period_end)
+  VALUES (v_payment.user_id, v_plan.id, 'active', 'monthly', p_merchant_order_id, v_now, v_now, v_period_end)
+  RETURNING id INTO v_subscription_id;
+
+  UPDATE payment_transactions SET subscription_id = v_subscription_id, updated_at = v_now
+  WHERE id = v_payment.id;
+
+  -- Limits are cached on the quota row so consume_quota never joins plans
+  INSERT INTO user_quotas (user_id, daily_limit, monthly_limit, plan_name, plan_expires_at)
+  VALUES (
+    v_payment.user_id,
+    CASE WHEN v_plan.name = 'Free' THEN v_plan.hits_limit ELSE -1 END,
+    CASE WHEN v_plan.name = 'Free' THEN -1 ELSE v_plan.hits_limit END,
+    v_plan.name,
+    v_period_end
+  )
+  ON CONFLICT (user_id) DO UPDATE SET
+    daily_limit = EXCLUDED.daily_limit,
+    monthly_limit = EXCLUDED.monthly_limit,
+    plan_name = EXCLUDED.plan_name,
+    plan_expires_at = EXCLUDED.plan_expires_at,
+    hits_used_this_month = 0,
+    updated_at = v_now;
+
+  RETURN QUERY SELECT v_payment.user_id, v_subscription_id, v_plan.name, v_period_end, true;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ==========================================
+-- ONE-CALL USER IDENTIFICATION
+-- ==========================================
+-- Find or create the user for an extension and make sure its quota row exists, in one call.
+-- Concurrent first use is safe: both callers land on the same row through ON CONFLICT.
+-- Email and name are only overwritten when given; created is true for a brand-new user.
+CREATE OR REPLACE FUNCTION upsert_user(p_extension_id VARCHAR, p_email VARCHAR DEFAULT NULL, p_name VARCHAR DEFAULT NULL)
+RETURNS TABLE(
+  id UUID,
+  email VARCHAR(255),
+  extension_id VARCHAR(255),
+  name VARCHAR(255),
+  profile_picture TEXT,
+  created_at TIMESTAMP WITH TIME ZONE,
+  updated_at TIMESTAMP WITH TIME ZONE,
+  last_seen TIMESTAMP WITH TIME ZONE,
+  is_active BOOLEAN,
+  created BOOLEAN
+) AS $$
+#variable_conflict use_column
+DECLARE
+  v_user_id UUID;
+  v_created BOOLEAN;
+BEGIN
+  INSERT INTO users AS u (extension_id, email, name, is_active, last_seen)
+  VALUES (p_extension_id, p_email, p_name, true, NOW())
+  ON CONFLICT (extension_id) DO UPDATE SET
+    email = COALESCE(EXCLUDED.email, u.email),
+    name = COALESCE(EXCLUDED.name, u.name),
+    last_seen = NOW()
+  RETURNING u.id, (u.xmax = 0) INTO v_user_id, v_created;
+
+  INSERT INTO user_quotas (user_id) VALUES (v_user_id)
+  ON CONFLICT (user_id) DO NOTHING;
+
+  RETURN QUERY
+  SELECT u.id, u.email, u.extension_id, u.name, u.profile_picture, u.created_at, u.updated_at,
+         u.last_seen, u.is_active, v_created
+  FROM users u
+  WHERE u.id = v_user_id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ==========================================
+-- PENDING PAYMENT RECONCILIATION
+-- ==========================================
+-- The reconciler (services/reconciler.py) pages through pending payments by (created_at, id);
+-- this partial index keeps each page an index range scan however many payments have settled.
+CREATE INDEX IF NOT EXISTS idx_payment_transactions_pending
+ON payment_transactions(created_at, id) WHERE status = 'pending';
@@ -1,4 +1,5 @@
 import os
+import asyncio
 import logging
 from fastapi import FastAPI, HTTPException, Request, Depends
 from fastapi.middleware.cors import CORSMiddleware
@@ -6,15 +7,25 @@ from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from typing import Optional, Dict, Any
 from datetime import datetime
-from dotenv import load_dotenv
 
-# Import our services
-from services.phonepe_auth import phonepe_auth
-from services.phonepe_payment import phonepe_payment
-from services.phonepe_webhook import webhook_handler
+# Import our services (the services package loads .env; services are constructed on first use)
+from services.http_pool import close_http_pools, get_pool_stats
+from services.phonepe_auth import AsyncPhonePeAuthService, phonepe_auth_async as phonepe_auth
+from services.phonepe_payment import AsyncPhonePePaymentService, phonepe_payment_async as phonepe_payment
+from services.phonepe_webhook import PhonePeWebhookHandler, webhook_handler
 from services.supabase_rest_client import supabase_service
-
-load_dotenv()
+from services.supabase_client import supabase_service as database_service
+from services.webhook_dedup import SupabaseWebhookIndex
+from services.write_behind import write_behind
+from services.quota_cache import quota_cache
+from services.quota_engine import quota_engine
+from services.plan_catalog import plan_catalog, to_paisa
+from services.payment_status_cache import payment_status_cache
+from services.order_state import order_state
+from services.reconciler import payment_reconciler
+from services.order_ids import order_ids
+from services.resilience import phonepe_gateway
+from services.rate_limiter import phonepe_limiter
 
 # Configure logging
 logging.basicConfig(
@@ -45,8 +56,10 @@ app.add_middleware(
 class PaymentCreateRequest(BaseModel):
     user_id: str
     plan_id: str
-    amount: float
-    plan_name: str
+    billing_cycle: str = "monthly"
+    # Display values from the client; the charged amount always comes from the plan catalog
+    amount: Optional[float] = None
+    plan_name: Optional[str] = None
 
 class RefundRequest(BaseModel):
     merchant_order_id: str
@@ -58,9 +71,30 @@ class HealthResponse(BaseModel):
     timestamp: str
     services: Dict[str, Any]
 
+# Route dependencies: each service is built on the first request that needs it
+async def get_phonepe_auth() -> AsyncPhonePeAuthService:
+    return phonepe_auth.get()
+
+async def get_phonepe_payment() -> AsyncPhonePePaymentService:
+    return phonepe_payment.get()
+
+async def get_webhook_handler() -> PhonePeWebhookHandler:
+    return webhook_handler.get()
+
+def gateway_error(result: Dict[str, Any]) -> HTTPException:
+    """400 for a rejected request, 503 with Retry-After while PhonePe's circuit is open"""
+    if result.get("retry_after"):
+        return HTTPException(status_code=503, detail=result["error"],
+                             headers={"Retry-After": str(result["retry_after"])})
+    return HTTPException(status_code=400, detail=result["error"])
+
 # Health check endpoint
 @app.get("/api/health", response_model=HealthResponse)
-async def health_check():
+async def health_check(
+    phonepe_auth: AsyncPhonePeAuthService = Depends(get_phonepe_auth),
+    phonepe_payment: AsyncPhonePePaymentService = Depends(get_phonepe_payment),
+    webhook_handler: PhonePeWebhookHandler = Depends(get_webhook_handler)
+):
     """Health check endpoint with service status"""
     try:
         # Check PhonePe auth status
@@ -90,24 +124,25 @@ async def health_check():
 
 # Payment creation endpoint
 @app.post("/api/phonepe/create-payment")
-async def create_payment(request: PaymentCreateRequest):
+async def create_payment(request: PaymentCreateRequest,
+                         phonepe_payment: AsyncPhonePePaymentService = Depends(get_phonepe_payment)):
     """Create PhonePe payment order"""
     try:
-        logger.info(f"Creating payment for user: {request.user_id}, plan: {request.plan_name}")
+        logger.info(f"Creating payment for user: {request.user_id}, plan: {request.plan_id}")
         
         # Validate request
-        if request.amount <= 0:
-            raise HTTPException(status_code=400, detail="Invalid amount")
-        
         if not request.user_id or not request.plan_id:
             raise HTTPException(status_code=400, detail="Missing user_id or plan_id")
         
+        price = plan_catalog.get_price(request.plan_id, request.billing_cycle)
+        if price is not None and request.amount is not None and to_paisa(request.amount) != price.base_paisa:
+            logger.warning(f"Client amount {request.amount} ignored for {request.plan_id}, charging catalog price {price.base_amount} + GST")
+        
         # Create payment order
-        result = phonepe_payment.create_payment_order(
+        result = await phonepe_payment.create_payment_order(
             user_id=request.user_id,
             plan_id=request.plan_id,
-            amount_rupees=request.amount,
-            plan_name=request.plan_name
+            billing_cycle=request.billing_cycle
         )
         
         if result["success"]:
@@ -115,7 +150,7 @@ async def create_payment(request: PaymentCreateRequest):
             return result
         else:
             logger.error(f"Payment creation failed: {result['error']}")
-            raise HTTPException(status_code=400, detail=result["error"])
+            raise gateway_error(result)
             
     except HTTPException:
         raise
@@ -149,18 +184,15 @@ async def verify_payment(merchant_order_id: str):
     try:
         logger.info(f"Verifying payment: {merchant_order_id}")
         
-        # Check payment status with PhonePe
-        result = phonepe_payment.check_payment_status(
-            merchant_order_id=merchant_order_id,
-            include_details=True
-        )
+        # Terminal states come from webhooks/phonepe_transactions; others from PhonePe (cached, coalesced)
+        result = await order_state.get_status(merchant_order_id, include_details=True)
         
         if result["success"]:
             logger.info(f"Payment verification successful: {merchant_order_id} - {result.get('state')}")
             return result
         else:
             logger.error(f"Payment verification failed: {result['error']}")
-            raise HTTPException(status_code=400, detail=result["error"])
+            raise gateway_error(result)
             
     except HTTPException:
         raise
@@ -170,7 +202,7 @@ async def verify_payment(merchant_order_id: str):
 
 # Webhook endpoint
 @app.post("/api/webhooks/phonepe")
-async def phonepe_webhook(request: Request):
+async def phonepe_webhook(request: Request, webhook_handler: PhonePeWebhookHandler = Depends(get_webhook_handler)):
     """Handle PhonePe webhooks"""
     try:
         logger.info("PhonePe webhook received")
@@ -189,7 +221,8 @@ async def phonepe_webhook(request: Request):
 
 # Refund endpoint
 @app.post("/api/phonepe/refund")
-async def process_refund(request: RefundRequest):
+async def process_refund(request: RefundRequest,
+                         phonepe_payment: AsyncPhonePePaymentService = Depends(get_phonepe_payment)):
     """Process refund using PhonePe"""
     try:
         logger.info(f"Processing refund for order: {request.merchant_order_id}")
@@ -199,7 +232,7 @@ async def process_refund(request: RefundRequest):
             raise HTTPException(status_code=400, detail="Invalid refund amount")
         
         # Process refund
-        result = phonepe_payment.initiate_refund(
+        result = await phonepe_payment.initiate_refund(
             original_merchant_order_id=request.merchant_order_id,
             refund_amount=request.amount,
             reason=request.reason
@@ -210,7 +243,7 @@ async def process_refund(request: RefundRequest):
             return result
         else:
             logger.error(f"Refund failed: {result['error']}")
-            raise HTTPException(status_code=400, detail=result["error"])
+            raise gateway_error(result)
             
     except HTTPException:
         raise
@@ -221,19 +254,16 @@ async def process_refund(request: RefundRequest):
 # Order status endpoint
 @app.get("/api/phonepe/order-status/{merchant_order_id}")
 async def get_order_status(merchant_order_id: str, details: bool = True):
-    """Get order status from PhonePe"""
+    """Get order status, locally when terminal, otherwise from PhonePe"""
     try:
         logger.info(f"Checking order status: {merchant_order_id}")
         
-        result = phonepe_payment.check_payment_status(
-            merchant_order_id=merchant_order_id,
-            include_details=details
-        )
+        result = await order_state.get_status(merchant_order_id, include_details=details)
         
         if result["success"]:
             return result
         else:
-            raise HTTPException(status_code=400, detail=result["error"])
+            raise gateway_error(result)
             
     except HTTPException:
         raise
@@ -259,6 +289,26 @@ async def get_service_info():
         logger.error(f"Service info error: {e}")
         raise HTTPException(status_code=500, detail="Service info unavailable")
 
+# Metrics endpoint
+@app.get("/api/metrics")
+async def get_metrics():
+    """Get runtime performance metrics"""
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "http_pools": get_pool_stats(),
+        "webhooks": webhook_handler.get_stats(),
+        "write_behind": write_behind.get_stats(),
+        "quota_cache": quota_cache.get_stats(),
+        "database": database_service.get_pool_stats(),
+        "plan_catalog": plan_catalog.get_stats(),
+        "payment_status": payment_status_cache.get_stats(),
+        "order_state": order_state.get_stats(),
+        "reconciler": payment_reconciler.get_stats(),
+        "order_ids": order_ids.get_stats(),
+        "phonepe_gateway": phonepe_gateway.get_stats(),
+        "phonepe_rate_limits": phonepe_limiter.get_stats()
+    }
+
 # Error handlers
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
@@ -270,7 +320,8 @@ async def http_exception_handler(request: Request, exc: HTTPException):
             "error": exc.detail,
             "status_code": exc.status_code,
             "timestamp": datetime.now().isoformat()
-        }
+        },
+        headers=getattr(exc, "headers", None)
     )
 
 @app.exception_handler(Exception)
@@ -286,32 +337,97 @@ async def general_exception_handler(request: Request, exc: Exception):
         }
     )
 
+# Network warm-up runs after startup so the first request never waits on it
+warmup_task: Optional[asyncio.Task] = None
+
+async def warm_up():
+    """Build the PhonePe services, validate credentials, open the database pool and load plan prices"""
+    try:
+        # Back the in-memory webhook dedup window with the unique key on webhook_events
+        if os.getenv('PHONEPE_WEBHOOK_DEDUP_INDEX', 'supabase').lower() == 'supabase':
+            webhook_handler.deduplicator.index = SupabaseWebhookIndex(supabase_service)
+        logger.info(f"Webhook handler supports {len(webhook_handler.event_handlers)} events")
+        
+        # Start per-order dispatch lanes and drain webhooks acknowledged before a restart
+        await webhook_handler.start_workers()
+        
+        # Renew the OAuth token ahead of expiry so requests never wait on it
+        if os.getenv('PHONEPE_TOKEN_BACKGROUND_REFRESH', 'true').lower() == 'true':
+            phonepe_auth.start_background_refresh()
+        
+        # Log service configuration
+        service_info = phonepe_payment.get_service_info()
+        logger.info(f"Service configured with merchant ID: {service_info['merchant_id']}")
+        
+        # Validate PhonePe credentials
+        if await phonepe_auth.validate_credentials():
+            logger.info("✅ PhonePe credentials validated successfully")
+        else:
+            logger.error("❌ PhonePe credentials validation failed")
+        
+        # Hot queries go through the asyncpg pool unless DATABASE_BACKEND=rest (REST until it is ready)
+        await database_service.init_connection_pool()
+        
+        # Load plan prices from subscription_plans (checkout defaults are used until then)
+        await asyncio.to_thread(plan_catalog.refresh)
+    except Exception as e:
+        logger.error(f"Startup warm-up failed: {e}")
+
 # Startup event
 @app.on_event("startup")
 async def startup_event():
     """Application startup tasks"""
+    global warmup_task
     logger.info("Starting Lekhak AI PhonePe Integration Service")
     
     try:
-        # Validate PhonePe credentials
-        if phonepe_auth.validate_credentials():
-            logger.info("✅ PhonePe credentials validated successfully")
-        else:
-            logger.error("❌ PhonePe credentials validation failed")
-            
-        # Log service configuration
-        service_info = phonepe_payment.get_service_info()
-        logger.info(f"Service configured with merchant ID: {service_info['merchant_id']}")
-        logger.info(f"Webhook handler supports {len(webhook_handler.event_handlers)} events")
+        # The PhonePe services are built by warm_up() below, off the path to the first request
+        plan_catalog.source = supabase_service
+        
+        # Bulk-write webhook and audit rows in the background
+        write_behind.sink = supabase_service
+        await write_behind.start()
+        
+        # Quota checks and batched usage run on the asyncpg pool once it is open
+        quota_engine.database = database_service
+        await quota_cache.start()
+        
+        # Settle payments left pending by lost webhooks
+        if os.getenv('RECONCILER_ENABLED', 'false').lower() == 'true':
+            await payment_reconciler.start()
         
     except Exception as e:
         logger.error(f"Startup validation failed: {e}")
+    
+    warmup_task = asyncio.ensure_future(warm_up())
 
 # Shutdown event
 @app.on_event("shutdown")
 async def shutdown_event():
     """Application shutdown tasks"""
     logger.info("Shutting down Lekhak AI PhonePe Integration Service")
+    
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+        await asyncio.gather(warmup_task, return_exceptions=True)
+    
+    await payment_reconciler.stop()
+    if webhook_handler.created:
+        await webhook_handler.stop_workers()
+    if phonepe_auth.created:
+        await phonepe_auth.stop_background_refresh()
+    
+    # Reconcile locally admitted quota hits to Postgres
+    await quota_cache.stop()
+    
+    # Write out buffered audit rows (spilled to disk if the database is unreachable)
+    await write_behind.stop()
+    
+    if database_service.created:
+        await database_service.close_connection_pool()
+    
+    # Release pooled gateway connections
+    await close_http_pools()
 
 # Root endpoint
 @app.get("/")
@@ -0,0 +1,551 @@
+#!/usr/bin/env python3
+"""Local PhonePe gateway simulator for load and latency testing
+
+Serves the OAuth token, checkout pay, order status and refund endpoints that
+PhonePePaymentService, PhonePeAuthService and the api/ handlers call, with
+configurable latency distributions, injected errors and token expiry. Orders
+settle after --settle-after seconds and, with --webhook-url, are reported back
+to the app as webhooks signed the way PhonePe signs them (SHA256 of body plus
+password). --synthetic-webhooks keeps the webhook firer busy at --webhook-rate
+even without checkout traffic, for load testing the webhook endpoint alone.
+
+Latency specs are in milliseconds: fixed:MS, uniform:LOW:HIGH, normal:MEAN:STDDEV
+or lognormal:MEDIAN:SIGMA. --latency, --error-rate, --throttle-rate and
+--hang-rate take a default, or ENDPOINT=VALUE for token, pay, status or refund,
+and can be repeated.
+
+Usage: python phonepe_simulator.py [--port 8500] [--latency lognormal:80:0.5] [--latency status=fixed:20] [--error-rate 0.01] [--token-ttl 3600] [--webhook-url http://127.0.0.1:8000/api/webhooks/phonepe] [--webhook-rate 20]
+"""
+
+import os
+import json
+import math
+import time
+import uuid
+import random
+import asyncio
+import hashlib
+import argparse
+import logging
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Set
+from urllib.parse import parse_qs
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+ENDPOINTS = ("token", "pay", "status", "refund")
+
+logger = logging.getLogger("phonepe_simulator")
+
+
+class LatencyDistribution:
+    """Response delay drawn from fixed, uniform, normal or lognormal (milliseconds)"""
+
+    KINDS = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+
+    def __init__(self, kind: str, params: List[float], rng: random.Random):
+        self.kind = kind
+        self.params = params
+        self.rng = rng
+
+    @classmethod
+    def parse(cls, spec: str, rng: random.Random) -> "LatencyDistribution":
+        kind, _, rest = spec.partition(':')
+        params = [float(value) for value in rest.split(':')] if rest else []
+        if kind not in cls.KINDS or len(params) != cls.KINDS[kind]:
+            raise ValueError(f"Bad latency spec {spec!r}; use fixed:MS, uniform:LOW:HIGH, normal:MEAN:STDDEV or lognormal:MEDIAN:SIGMA")
+        return cls(kind, params, rng)
+
+    def sample(self) -> float:
+        """Delay in seconds"""
+        if self.kind == "fixed":
+            ms = self.params[0]
+        elif self.kind == "uniform":
+            ms = self.rng.uniform(*self.params)
+        elif self.kind == "normal":
+            ms = self.rng.gauss(*self.params)
+        else:
+            median, sigma = self.params
+            ms = self.rng.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+        return max(0.0, ms) / 1000
+
+    def __str__(self) -> str:
+        return ':'.join([self.kind] + [f"{value:g}" for value in self.params])
+
+
+def per_endpoint(values: Optional[List[str]], parse: Callable[[str], Any], default: str) -> Dict[str, Any]:
+    """Resolve repeated VALUE / ENDPOINT=VALUE options into a value per endpoint"""
+    fallback = default
+    overrides = {}
+    for value in values or []:
+        name, sep, rest = value.partition('=')
+        if not sep:
+            fallback = value
+        elif name in ENDPOINTS:
+            overrides[name] = rest
+        else:
+            raise ValueError(f"Unknown endpoint {name!r}; expected one of {', '.join(ENDPOINTS)}")
+    return {name: parse(overrides.get(name, fallback)) for name in ENDPOINTS}
+
+
+class EndpointStats:
+    def __init__(self):
+        self.requests = 0
+        self.unauthorized = 0
+        self.errors = 0
+        self.throttled = 0
+        self.hung = 0
+        self.latencies: Deque[float] = deque(maxlen=10000)
+
+    def snapshot(self) -> Dict[str, Any]:
+        samples = sorted(self.latencies)
+
+        def pick(fraction: float) -> float:
+            return round(samples[min(len(samples) - 1, int(len(samples) * fraction))] * 1000, 1) if samples else 0.0
+
+        return {
+            "requests": self.requests,
+            "unauthorized": self.unauthorized,
+            "injected_errors": self.errors,
+            "injected_throttles": self.throttled,
+            "injected_hangs": self.hung,
+            "p50_ms": pick(0.5),
+            "p99_ms": pick(0.99)
+        }
+
+
+class WebhookFirer:
+    """Sends signed webhooks to the app at up to `rate` per second"""
+
+    def __init__(self, url: str, password: str, rate: float, concurrency: int,
+                 synthetic: bool, duplicate_rate: float, bad_signature_rate: float, rng: random.Random):
+        self.url = url
+        self.password = password
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.concurrency = concurrency
+        self.synthetic = synthetic
+        self.duplicate_rate = duplicate_rate
+        self.bad_signature_rate = bad_signature_rate
+        self.rng = rng
+
+        self.queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._deliveries: Set[asyncio.Task] = set()
+        self._client: Optional[httpx.AsyncClient] = None
+
+        self.sent = 0
+        self.acknowledged = 0
+        self.rejected = 0
+        self.failed = 0
+        self.duplicates = 0
+        self.bad_signatures = 0
+        self.latencies: Deque[float] = deque(maxlen=10000)
+
+    def sign(self, body: bytes) -> str:
+        return f"SHA256 {hashlib.sha256(body + self.password.encode('utf-8')).hexdigest()}"
+
+    def enqueue(self, event: str, payload: Dict[str, Any]) -> None:
+        self.queue.put_nowait({"event": event, "payload": payload})
+
+    def _synthetic_event(self) -> Dict[str, Any]:
+        merchant_order_id = f"SIM_{uuid.uuid4().hex[:20].upper()}"
+        completed = self.rng.random() < 0.9
+        return {
+            "event": "checkout.order.completed" if completed else "checkout.order.failed",
+            "payload": order_payload(merchant_order_id, f"OMO{uuid.uuid4().hex[:18].upper()}",
+                                     "COMPLETED" if completed else "FAILED", 100)
+        }
+
+    async def _next_event(self) -> Dict[str, Any]:
+        if self.synthetic and self.queue.empty():
+            return self._synthetic_event()
+        return await self.queue.get()
+
+    async def _send(self, body: bytes, signature: str) -> None:
+        started = time.perf_counter()
+        try:
+            response = await self._client.post(self.url, content=body, headers={
+                "Content-Type": "application/json",
+                "Authorization": signature
+            })
+        except httpx.HTTPError as e:
+            self.failed += 1
+            logger.warning(f"Webhook delivery failed: {e}")
+            return
+        self.latencies.append(time.perf_counter() - started)
+        if response.status_code < 300:
+            self.acknowledged += 1
+        else:
+            self.rejected += 1
+
+    async def _run(self) -> None:
+        slots = asyncio.Semaphore(self.concurrency)
+        next_at = time.monotonic()
+
+        async def deliver(body: bytes, signature: str) -> None:
+            try:
+                await self._send(body, signature)
+            finally:
+                slots.release()
+
+        while True:
+            event = await self._next_event()
+            event["timestamp"] = int(time.time() * 1000)
+            body = json.dumps(event).encode()
+            signature = self.sign(body)
+            if self.rng.random() < self.bad_signature_rate:
+                self.bad_signatures += 1
+                signature = self.sign(body + b"tampered")
+
+            copies = 2 if self.rng.random() < self.duplicate_rate else 1
+            self.duplicates += copies - 1
+            for _ in range(copies):
+                if self.interval:
+                    next_at = max(next_at + self.interval, time.monotonic())
+                    await asyncio.sleep(max(0.0, next_at - time.monotonic()))
+                await slots.acquire()
+                self.sent += 1
+                delivery = asyncio.ensure_future(deliver(body, signature))
+                self._deliveries.add(delivery)
+                delivery.add_done_callback(self._deliveries.discard)
+
+    async def start(self) -> None:
+        self.queue = asyncio.Queue()
+        self._client = httpx.AsyncClient(timeout=30)
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, *self._deliveries, return_exceptions=True)
+        if self._client is not None:
+            await self._client.aclose()
+
+    def get_stats(self) -> Dict[str, Any]:
+        samples = sorted(self.latencies)
+        return {
+            "url": self.url,
+            "queued": self.queue.qsize() if self.queue is not None else 0,
+            "sent": self.sent,
+            "acknowledged": self.acknowledged,
+            "rejected": self.rejected,
+            "failed": self.failed,
+            "duplicates": self.duplicates,
+            "bad_signatures": self.bad_signatures,
+            "p50_ms": round(samples[len(samples) // 2] * 1000, 1) if samples else 0.0,
+            "p99_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000, 1) if samples else 0.0
+        }
+
+
+def order_payload(merchant_order_id: str, order_id: str, state: str, amount: int) -> Dict[str, Any]:
+    """Order as PhonePe reports it in status responses and webhooks"""
+    payload = {
+        "orderId": order_id,
+        "merchantOrderId": merchant_order_id,
+        "state": state,
+        "amount": amount,
+        "expireAt": int(time.time() * 1000) + 1800 * 1000,
+        "paymentDetails": []
+    }
+    if state in ("COMPLETED", "FAILED"):
+        payload["paymentDetails"].append({
+            "paymentMode": "UPI_QR",
+            "transactionId": f"OM{uuid.uuid4().hex[:20].upper()}",
+            "timestamp": int(time.time() * 1000),
+            "amount": amount,
+            "state": state
+        })
+    if state == "FAILED":
+        payload["errorCode"] = "PAYMENT_DECLINED"
+    return payload
+
+
+class PhonePeSimulator:
+    """In-memory PhonePe: tokens, orders and refunds with injected latency and faults"""
+
+    def __init__(self, latency: Dict[str, LatencyDistribution], error_rate: Dict[str, float],
+                 throttle_rate: Dict[str, float], hang_rate: Dict[str, float], hang_seconds: float,
+                 token_ttl: float, settle_after: float, success_rate: float,
+                 client_id: Optional[str], client_secret: Optional[str],
+                 webhooks: Optional[WebhookFirer], rng: random.Random):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.token_ttl = token_ttl
+        self.settle_after = settle_after
+        self.success_rate = success_rate
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.webhooks = webhooks
+        self.rng = rng
+
+        self.tokens: Dict[str, float] = {}
+        self.orders: Dict[str, Dict[str, Any]] = {}
+        self.refunds: Dict[str, Dict[str, Any]] = {}
+        self.stats = {name: EndpointStats() for name in ENDPOINTS}
+
+    async def _fault(self, endpoint: str) -> Optional[JSONResponse]:
+        """Sleep for the endpoint's latency, then maybe inject a 5xx, 429 or hang"""
+        stats = self.stats[endpoint]
+        stats.requests += 1
+        started = time.perf_counter()
+        await asyncio.sleep(self.latency[endpoint].sample())
+        roll = self.rng.random()
+        try:
+            if roll < self.hang_rate[endpoint]:
+                stats.hung += 1
+                await asyncio.sleep(self.hang_seconds)
+                return JSONResponse({"success": False, "code": "GATEWAY_TIMEOUT"}, status_code=504)
+            roll -= self.hang_rate[endpoint]
+            if roll < self.throttle_rate[endpoint]:
+                stats.throttled += 1
+                return JSONResponse({"success": False, "code": "TOO_MANY_REQUESTS"}, status_code=429,
+                                    headers={"Retry-After": "1"})
+            roll -= self.throttle_rate[endpoint]
+            if roll < self.error_rate[endpoint]:
+                stats.errors += 1
+                return JSONResponse({"success": False, "code": "INTERNAL_SERVER_ERROR"}, status_code=500)
+            return None
+        finally:
+            stats.latencies.append(time.perf_counter() - started)
+
+    def _authorized(self, request: Request, endpoint: str) -> bool:
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        expires_at = self.tokens.get(token)
+        if scheme != 'O-Bearer' or expires_at is None or expires_at <= time.time():
+            self.stats[endpoint].unauthorized += 1
+            return False
+        return True
+
+    @staticmethod
+    def _unauthorized() -> JSONResponse:
+        return JSONResponse({"success": False, "code": "UNAUTHORIZED", "message": "Invalid or expired token"},
+                            status_code=401)
+
+    async def issue_token(self, request: Request) -> JSONResponse:
+        form = {key: values[0] for key, values in parse_qs((await request.body()).decode()).items()}
+        fault = await self._fault("token")
+        if fault is not None:
+            return fault
+        if form.get('grant_type') != 'client_credentials' or \
+                (self.client_id and form.get('client_id') != self.client_id) or \
+                (self.client_secret and form.get('client_secret') != self.client_secret):
+            self.stats["token"].unauthorized += 1
+            return JSONResponse({"success": False, "code": "INVALID_CLIENT"}, status_code=401)
+
+        now = int(time.time())
+        expires_at = now + int(self.token_ttl)
+        access_token = uuid.uuid4().hex
+        self.tokens = {token: expiry for token, expiry in self.tokens.items() if expiry > now}
+        self.tokens[access_token] = expires_at
+        return JSONResponse({
+            "access_token": access_token,
+            "encrypted_access_token": access_token,
+            "expires_in": int(self.token_ttl),
+            "issued_at": now,
+            "expires_at": expires_at,
+            "session_expires_at": expires_at,
+            "token_type": "O-Bearer"
+        })
+
+    async def pay(self, request: Request) -> JSONResponse:
+        body = await request.json()
+        if not self._authorized(request, "pay"):
+            return self._unauthorized()
+        fault = await self._fault("pay")
+        if fault is not None:
+            return fault
+
+        merchant_order_id = body.get('merchantOrderId')
+        amount = body.get('amount')
+        if not merchant_order_id or not isinstance(amount, int) or amount < 100:
+            return JSONResponse({"success": False, "code": "BAD_REQUEST", "message": "Invalid merchantOrderId or amount"},
+                                status_code=400)
+        if merchant_order_id in self.orders:
+            return JSONResponse({"success": False, "code": "DUPLICATE_ORDER"}, status_code=409)
+
+        order_id = f"OMO{uuid.uuid4().hex[:18].upper()}"
+        expire_at = int(time.time() * 1000) + int(body.get('expireAfter', 1200)) * 1000
+        self.orders[merchant_order_id] = {"order_id": order_id, "state": "PENDING", "amount": amount}
+        asyncio.get_running_loop().call_later(self.settle_after, self._settle_order, merchant_order_id)
+
+        redirect_url = f"https://mercury-t2.phonepe.com/transact/simulator?token={order_id}"
+        # v2 fields (api/phonepe/create-payment.py) and the IFRAME fields PhonePePaymentService reads
+        return JSONResponse({
+            "orderId": order_id,
+            "state": "PENDING",
+            "expireAt": expire_at,
+            "redirectUrl": redirect_url,
+            "token": order_id,
+            "paymentUrl": redirect_url,
+            "expiresAt": expire_at
+        })
+
+    def _settle_order(self, merchant_order_id: str) -> None:
+        order = self.orders[merchant_order_id]
+        order["state"] = "COMPLETED" if self.rng.random() < self.success_rate else "FAILED"
+        if self.webhooks is not None:
+            event = "checkout.order.completed" if order["state"] == "COMPLETED" else "checkout.order.failed"
+            self.webhooks.enqueue(event, order_payload(merchant_order_id, order["order_id"], order["state"], order["amount"]))
+
+    async def order_status(self, merchant_order_id: str, request: Request) -> JSONResponse:
+        if not self._authorized(request, "status"):
+            return self._unauthorized()
+        fault = await self._fault("status")
+        if fault is not None:
+            return fault
+
+        order = self.orders.get(merchant_order_id)
+        if order is None:
+            return JSONResponse({"success": False, "code": "ORDER_NOT_FOUND"}, status_code=404)
+        payload = order_payload(merchant_order_id, order["order_id"], order["state"], order["amount"])
+        # The payment services read the order under "payload"
+        return JSONResponse({**payload, "payload": payload})
+
+    async def refund(self, request: Request) -> JSONResponse:
+        body = await request.json()
+        if not self._authorized(request, "refund"):
+            return self._unauthorized()
+        fault = await self._fault("refund")
+        if fault is not None:
+            return fault
+
+        merchant_refund_id = body.get('merchantRefundId')
+        order = self.orders.get(body.get('originalMerchantOrderId'))
+        if not merchant_refund_id or order is None or order["state"] != "COMPLETED":
+            return JSONResponse({"success": False, "code": "INVALID_REFUND", "message": "Order not found or not completed"},
+                                status_code=400)
+        if not isinstance(body.get('amount'), int) or not 100 <= body['amount'] <= order["amount"]:
+            return JSONResponse({"success": False, "code": "INVALID_REFUND_AMOUNT"}, status_code=400)
+        if merchant_refund_id in self.refunds:
+            return JSONResponse({"success": False, "code": "DUPLICATE_REFUND"}, status_code=409)
+
+        refund_id = f"OMR{uuid.uuid4().hex[:18].upper()}"
+        self.refunds[merchant_refund_id] = {"refund_id": refund_id, "state": "PENDING", "amount": body['amount'],
+                                            "original_merchant_order_id": body['originalMerchantOrderId']}
+        asyncio.get_running_loop().call_later(self.settle_after, self._settle_refund, merchant_refund_id)
+        return JSONResponse({"refundId": refund_id, "amount": body['amount'], "state": "PENDING"})
+
+    def _settle_refund(self, merchant_refund_id: str) -> None:
+        refund = self.refunds[merchant_refund_id]
+        refund["state"] = "COMPLETED"
+        if self.webhooks is not None:
+            self.webhooks.enqueue("pg.refund.completed", {
+                "merchantRefundId": merchant_refund_id,
+                "refundId": refund["refund_id"],
+                "originalMerchantOrderId": refund["original_merchant_order_id"],
+                "amount": refund["amount"],
+                "state": "COMPLETED",
+                "timestamp": int(time.time() * 1000)
+            })
+
+    def get_stats(self) -> Dict[str, Any]:
+        states: Dict[str, int] = {}
+        for order in self.orders.values():
+            states[order["state"]] = states.get(order["state"], 0) + 1
+        return {
+            "latency": {name: str(distribution) for name, distribution in self.latency.items()},
+            "endpoints": {name: stats.snapshot() for name, stats in self.stats.items()},
+            "live_tokens": sum(1 for expiry in self.tokens.values() if expiry > time.time()),
+            "orders": states,
+            "refunds": len(self.refunds),
+            "webhooks": self.webhooks.get_stats() if self.webhooks is not None else None
+        }
+
+
+def create_app(simulator: PhonePeSimulator) -> FastAPI:
+    """Mount the simulator on both the production and sandbox PhonePe paths"""
+    app = FastAPI(title="PhonePe simulator", docs_url=None, redoc_url=None)
+
+    for token_path in ("/apis/identity-manager/v1/oauth/token", "/apis/pg-sandbox/v1/oauth/token"):
+        app.add_api_route(token_path, simulator.issue_token, methods=["POST"])
+    for base in ("/apis/pg", "/apis/pg-sandbox"):
+        app.add_api_route(f"{base}/checkout/v2/pay", simulator.pay, methods=["POST"])
+        app.add_api_route(f"{base}/checkout/v2/order/{{merchant_order_id}}/status", simulator.order_status, methods=["GET"])
+        app.add_api_route(f"{base}/payments/v2/refund", simulator.refund, methods=["POST"])
+
+    @app.get("/simulator/stats")
+    async def stats():
+        return simulator.get_stats()
+
+    @app.on_event("startup")
+    async def start_webhooks():
+        if simulator.webhooks is not None:
+            await simulator.webhooks.start()
+
+    @app.on_event("shutdown")
+    async def stop_webhooks():
+        if simulator.webhooks is not None:
+            await simulator.webhooks.stop()
+        print(json.dumps(simulator.get_stats(), indent=2))
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8500)
+    parser.add_argument('--latency', action='append', help='latency spec, or ENDPOINT=SPEC (default lognormal:80:0.5)')
+    parser.add_argument('--error-rate', action='append', help='fraction answered 500, or ENDPOINT=RATE')
+    parser.add_argument('--throttle-rate', action='append', help='fraction answered 429, or ENDPOINT=RATE')
+    parser.add_argument('--hang-rate', action='append', help='fraction held for --hang-seconds, then 504')
+    parser.add_argument('--hang-seconds', type=float, default=30.0)
+    parser.add_argument('--token-ttl', type=float, default=3600, help='seconds until issued tokens expire')
+    parser.add_argument('--client-id', default=os.getenv('PHONEPE_CLIENT_ID'), help='reject other client ids')
+    parser.add_argument('--client-secret', default=os.getenv('PHONEPE_CLIENT_SECRET'))
+    parser.add_argument('--settle-after', type=float, default=5.0, help='seconds before orders and refunds settle')
+    parser.add_argument('--success-rate', type=float, default=0.9, help='fraction of orders that complete')
+    parser.add_argument('--webhook-url', help='app webhook endpoint; omit to send no webhooks')
+    parser.add_argument('--webhook-password', default=os.getenv('PHONEPE_WEBHOOK_PASSWORD', ''))
+    parser.add_argument('--webhook-rate', type=float, default=20.0, help='webhooks per second (0 for no limit)')
+    parser.add_argument('--webhook-concurrency', type=int, default=50, help='webhooks in flight')
+    parser.add_argument('--synthetic-webhooks', action='store_true',
+                        help='fill --webhook-rate with events for made-up orders')
+    parser.add_argument('--webhook-duplicate-rate', type=float, default=0.0, help='fraction delivered twice')
+    parser.add_argument('--bad-signature-rate', type=float, default=0.0, help='fraction sent with a wrong signature')
+    parser.add_argument('--seed', type=int, help='random seed for repeatable runs')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    rng = random.Random(args.seed)
+
+    try:
+        latency = per_endpoint(args.latency, lambda spec: LatencyDistribution.parse(spec, rng), 'lognormal:80:0.5')
+        error_rate = per_endpoint(args.error_rate, float, '0')
+        throttle_rate = per_endpoint(args.throttle_rate, float, '0')
+        hang_rate = per_endpoint(args.hang_rate, float, '0')
+    except ValueError as e:
+        parser.error(str(e))
+    if args.synthetic_webhooks and not args.webhook_url:
+        parser.error("--synthetic-webhooks needs --webhook-url")
+
+    webhooks = None
+    if args.webhook_url:
+        webhooks = WebhookFirer(args.webhook_url, args.webhook_password, args.webhook_rate,
+                                args.webhook_concurrency, args.synthetic_webhooks, args.webhook_duplicate_rate,
+                                args.bad_signature_rate, rng)
+
+    simulator = PhonePeSimulator(latency, error_rate, throttle_rate, hang_rate, args.hang_seconds, args.token_ttl,
+                                 args.settle_after, args.success_rate, args.client_id, args.client_secret,
+                                 webhooks, rng)
+
+    base = f"http://{args.host}:{args.port}"
+    print("Point the app at the simulator with:")
+    print(f"  PHONEPE_AUTH_URL={base}/apis/identity-manager/v1/oauth/token")
+    print(f"  PHONEPE_CHECKOUT_URL={base}/apis/pg/checkout/v2/pay")
+    print(f"  PHONEPE_STATUS_URL={base}/apis/pg/checkout/v2/order")
+    print(f"  PHONEPE_REFUND_URL={base}/apis/pg/payments/v2/refund")
+    print(f"Stats: {base}/simulator/stats\n")
+
+    uvicorn.run(create_app(simulator), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""Reconcile payment_transactions rows stuck in pending against PhonePe
+
+Runs the same reconciler the API starts when RECONCILER_ENABLED=true, once or on
+an interval. Use --dry-run to see what would change without writing anything.
+
+Usage: python reconcile_payments.py [--dry-run] [--loop] [--concurrency 8] [--rate 5] [--min-age 2100]
+"""
+
+import json
+import asyncio
+import argparse
+import logging
+
+from services.reconciler import payment_reconciler
+from services.supabase_client import supabase_service as database_service
+from services.supabase_rest_client import supabase_service
+from services.write_behind import write_behind
+from services.http_pool import close_http_pools
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dry-run', action='store_true', help='check statuses but write nothing')
+    parser.add_argument('--loop', action='store_true', help='keep running every --interval seconds')
+    parser.add_argument('--interval', type=float, default=payment_reconciler.interval_seconds)
+    parser.add_argument('--concurrency', type=int, default=payment_reconciler.concurrency,
+                        help='status checks in flight')
+    parser.add_argument('--rate', type=float, default=payment_reconciler.rate_per_second,
+                        help='status checks per second (0 for no limit)')
+    parser.add_argument('--page-size', type=int, default=payment_reconciler.page_size)
+    parser.add_argument('--batch-size', type=int, default=payment_reconciler.batch_size)
+    parser.add_argument('--min-age', type=float, default=payment_reconciler.min_age_seconds,
+                        help='only pending rows older than this many seconds')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    reconciler = payment_reconciler
+    reconciler.dry_run = args.dry_run or reconciler.dry_run
+    reconciler.interval_seconds = args.interval
+    reconciler.concurrency = args.concurrency
+    reconciler.rate_per_second = args.rate
+    reconciler.page_size = args.page_size
+    reconciler.batch_size = args.batch_size
+    reconciler.min_age_seconds = args.min_age
+
+    await database_service.init_connection_pool()
+    write_behind.sink = supabase_service
+    await write_behind.start()
+    try:
+        if args.loop:
+            await reconciler.start()
+            await asyncio.Event().wait()
+        else:
+            await reconciler.run_once()
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+    finally:
+        await reconciler.stop()
+        await write_behind.stop()
+        await database_service.close_connection_pool()
+        await close_http_pools()
+        print(json.dumps(reconciler.get_stats(), indent=2))
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,4 @@
+# Loads .env once for every entry point (API, serverless handlers, scripts) before any service reads its settings
+from dotenv import load_dotenv
+
+load_dotenv()
@@ -0,0 +1,256 @@
+import os
+import time
+import asyncio
+import threading
+import logging
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+logger = logging.getLogger(__name__)
+
+
+def _pool_setting(name: str, key: str, default: str) -> str:
+    """Read HTTP_POOL_<NAME>_<KEY>, falling back to HTTP_POOL_<KEY> and then the default"""
+    return os.getenv(f'HTTP_POOL_{name.upper()}_{key}', os.getenv(f'HTTP_POOL_{key}', default))
+
+
+class PoolStats:
+    """Thread-safe counters for connection reuse and pool wait time"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+        self.wait_count = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def record_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def record_new_connection(self) -> None:
+        with self._lock:
+            self.new_connections += 1
+
+    def record_wait(self, seconds: float) -> None:
+        with self._lock:
+            self.wait_count += 1
+            self.wait_time_total += seconds
+            self.wait_time_max = max(self.wait_time_max, seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Get current pool statistics"""
+        with self._lock:
+            reused = max(0, self.requests - self.new_connections)
+            return {
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "reused_connections": reused,
+                "reuse_rate": round(reused / self.requests, 4) if self.requests else 0.0,
+                "avg_wait_ms": round(self.wait_time_total / self.wait_count * 1000, 3) if self.wait_count else 0.0,
+                "max_wait_ms": round(self.wait_time_max * 1000, 3)
+            }
+
+
+def _instrumented_pool_class(base: type, stats: PoolStats) -> type:
+    """Subclass a urllib3 connection pool to count connects and time connection checkout"""
+
+    class InstrumentedConnection(base.ConnectionCls):
+        def connect(self):
+            stats.record_new_connection()
+            return super().connect()
+
+    class InstrumentedPool(base):
+        ConnectionCls = InstrumentedConnection
+
+        def _get_conn(self, timeout=None):
+            started = time.perf_counter()
+            conn = super()._get_conn(timeout=timeout)
+            stats.record_wait(time.perf_counter() - started)
+            return conn
+
+    return InstrumentedPool
+
+
+class _InstrumentedAdapter(HTTPAdapter):
+    """requests adapter whose per-host connection pools report into PoolStats"""
+
+    def __init__(self, stats: PoolStats, **kwargs):
+        self._stats = stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _instrumented_pool_class(HTTPConnectionPool, self._stats),
+            "https": _instrumented_pool_class(HTTPSConnectionPool, self._stats),
+        }
+
+
+class SyncHttpPool:
+    """Keep-alive requests.Session with bounded per-host connection pools"""
+
+    def __init__(self, name: str, per_host_limit: Optional[int] = None, max_hosts: Optional[int] = None,
+                 block: Optional[bool] = None, timeout: Optional[float] = None):
+        self.name = name
+        self.stats = PoolStats()
+        self.per_host_limit = per_host_limit or int(_pool_setting(name, 'PER_HOST_LIMIT', '20'))
+        self.max_hosts = max_hosts or int(_pool_setting(name, 'MAX_HOSTS', '10'))
+        self.block = block if block is not None else _pool_setting(name, 'BLOCK', 'true').lower() == 'true'
+        self.timeout = timeout or float(_pool_setting(name, 'TIMEOUT', '30'))
+
+        adapter = _InstrumentedAdapter(
+            self.stats,
+            pool_connections=self.max_hosts,
+            pool_maxsize=self.per_host_limit,
+            pool_block=self.block
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Send a request over a pooled keep-alive connection"""
+        kwargs.setdefault("timeout", self.timeout)
+        self.stats.record_request()
+        return self.session.request(method, url, **kwargs)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "type": "sync",
+            "per_host_limit": self.per_host_limit,
+            "max_hosts": self.max_hosts,
+            **self.stats.snapshot()
+        }
+
+    def close(self) -> None:
+        self.session.close()
+
+
+class AsyncHttpPool:
+    """Shared httpx.AsyncClient with keep-alive, a global cap and per-host limits"""
+
+    def __init__(self, name: str, max_connections: Optional[int] = None, max_keepalive: Optional[int] = None,
+                 keepalive_expiry: Optional[float] = None, per_host_limit: Optional[int] = None,
+                 timeout: Optional[float] = None):
+        self.name = name
+        self.stats = PoolStats()
+        self.max_connections = max_connections or int(_pool_setting(name, 'MAX_CONNECTIONS', '200'))
+        self.max_keepalive = max_keepalive or int(_pool_setting(name, 'MAX_KEEPALIVE', '50'))
+        self.keepalive_expiry = keepalive_expiry or float(_pool_setting(name, 'KEEPALIVE_EXPIRY', '30'))
+        self.per_host_limit = per_host_limit or int(_pool_setting(name, 'PER_HOST_LIMIT', '100'))
+        self.timeout = timeout or float(_pool_setting(name, 'TIMEOUT', '30'))
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self._host_slots: Dict[str, asyncio.Semaphore] = {}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Get the underlying client, creating it on first use"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive,
+                    keepalive_expiry=self.keepalive_expiry,
+                ),
+                timeout=httpx.Timeout(self.timeout),
+            )
+            self._host_slots = {}
+            logger.info(f"Async HTTP pool '{self.name}' initialized")
+        return self._client
+
+    def _host_slot(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(str(url)).netloc
+        if host not in self._host_slots:
+            self._host_slots[host] = asyncio.Semaphore(self.per_host_limit)
+        return self._host_slots[host]
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """Send a request over a pooled keep-alive connection"""
+        client = self.client
+        stats = self.stats
+        started = time.perf_counter()
+        waited = False
+
+        async def trace(event_name: str, info: Dict[str, Any]) -> None:
+            # The first connect or send marks the end of the wait for a pool slot
+            nonlocal waited
+            if event_name == "connection.connect_tcp.started":
+                stats.record_new_connection()
+            if not waited and event_name in ("connection.connect_tcp.started", "http11.send_request_headers.started",
+                                             "http2.send_request_headers.started"):
+                waited = True
+                stats.record_wait(time.perf_counter() - started)
+
+        extensions = dict(kwargs.pop("extensions", None) or {})
+        extensions["trace"] = trace
+
+        stats.record_request()
+        async with self._host_slot(url):
+            return await client.request(method, url, extensions=extensions, **kwargs)
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "type": "async",
+            "max_connections": self.max_connections,
+            "per_host_limit": self.per_host_limit,
+            **self.stats.snapshot()
+        }
+
+    async def close(self) -> None:
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+            logger.info(f"Async HTTP pool '{self.name}' closed")
+        self._client = None
+
+
+_sync_pools: Dict[str, SyncHttpPool] = {}
+_async_pools: Dict[str, AsyncHttpPool] = {}
+_registry_lock = threading.Lock()
+
+
+def get_sync_pool(name: str = "default") -> SyncHttpPool:
+    """Get the shared synchronous pool for a name, creating it on first use"""
+    with _registry_lock:
+        if name not in _sync_pools:
+            _sync_pools[name] = SyncHttpPool(name)
+        return _sync_pools[name]
+
+
+def get_async_pool(name: str = "default") -> AsyncHttpPool:
+    """Get the shared async pool for a name, creating it on first use"""
+    with _registry_lock:
+        if name not in _async_pools:
+            _async_pools[name] = AsyncHttpPool(name)
+        return _async_pools[name]
+
+
+async def close_http_pools() -> None:
+    """Close every shared pool and release pooled connections"""
+    for pool in list(_async_pools.values()):
+        await pool.close()
+    for pool in list(_sync_pools.values()):
+        pool.close()
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Get statistics for every shared pool"""
+    stats = {}
+    for name, pool in list(_sync_pools.items()):
+        stats[f"{name}.sync"] = pool.get_stats()
+    for name, pool in list(_async_pools.items()):
+        stats[f"{name}.async"] = pool.get_stats()
+    return stats
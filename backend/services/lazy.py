@@ -0,0 +1,44 @@
+import threading
+from typing import Any, Callable, Generic, TypeVar
+
+T = TypeVar('T')
+
+
+class LazyService(Generic[T]):
+    """Module-level stand-in for a shared service that is built on first use
+
+    Importing a service module no longer constructs the service (or reads its
+    credentials); the first attribute access, or get(), does, exactly once
+    even when several threads race for it. Attribute reads and writes are
+    forwarded, so existing `from services.x import service` imports keep working.
+    """
+
+    def __init__(self, factory: Callable[[], T]):
+        object.__setattr__(self, '_factory', factory)
+        object.__setattr__(self, '_instance', None)
+        object.__setattr__(self, '_lock', threading.Lock())
+
+    def get(self) -> T:
+        """The service instance, constructing it on the first call"""
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                instance = self._instance
+                if instance is None:
+                    instance = self._factory()
+                    object.__setattr__(self, '_instance', instance)
+        return instance
+
+    @property
+    def created(self) -> bool:
+        return self._instance is not None
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.get(), name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self.get(), name, value)
+
+    def __repr__(self) -> str:
+        state = repr(self._instance) if self._instance is not None else 'not created'
+        return f"<LazyService {getattr(self._factory, '__name__', self._factory)}: {state}>"
@@ -0,0 +1,123 @@
+import os
+import time
+import secrets
+import threading
+from typing import Any, Dict, Optional
+
+# Crockford base32: digits sort before letters, so fixed-width IDs sort by value
+ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+
+# PhonePe accepts merchantOrderId / merchantRefundId up to 63 characters of [A-Za-z0-9_-]
+MAX_ID_LENGTH = 63
+
+TIMESTAMP_CHARS = 10  # 50 bits of milliseconds since the epoch
+WORKER_CHARS = 8      # 40 bits, random per process unless ORDER_ID_WORKER_ID is set
+SEQUENCE_CHARS = 4    # 20 bits, about a million IDs per millisecond per process
+SEQUENCE_LIMIT = 32 ** SEQUENCE_CHARS
+
+_PAIRS = [a + b for a in ALPHABET for b in ALPHABET]
+
+
+def _encode(value: int, width: int) -> str:
+    chars = []
+    for _ in range(width):
+        value, digit = divmod(value, 32)
+        chars.append(ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+
+class OrderIdGenerator:
+    """Monotonic, k-sortable merchant order and refund IDs
+
+    An ID is prefix + millisecond timestamp + worker + sequence, each a fixed
+    width of Crockford base32, e.g. LEKHAK_01JA2B3C4DE7KQ2M9X0001 (29 chars).
+    IDs from one process strictly increase; across processes they sort by
+    creation time to the millisecond. Workers need no coordination: each picks
+    a random 40-bit worker ID (re-drawn after fork), so separate processes,
+    containers and serverless instances cannot issue the same ID unless they
+    draw the same worker ID in the same millisecond. If the clock steps back or
+    a millisecond's sequence runs out, the generator keeps counting from the
+    last timestamp it issued instead of waiting or repeating.
+    """
+
+    def __init__(self, worker_id: Optional[int] = None):
+        self._fixed_worker_id = worker_id
+        self._reset()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset)
+
+        self.issued = 0
+        self.clock_regressions = 0
+        self.sequence_rollovers = 0
+
+    @classmethod
+    def from_env(cls) -> "OrderIdGenerator":
+        """Create a generator, pinning the worker ID from ORDER_ID_WORKER_ID if set"""
+        worker_id = os.getenv('ORDER_ID_WORKER_ID')
+        return cls(int(worker_id) if worker_id else None)
+
+    def _reset(self) -> None:
+        worker_id = self._fixed_worker_id
+        if worker_id is None:
+            worker_id = secrets.randbits(5 * WORKER_CHARS)
+        self.worker_id = worker_id % (32 ** WORKER_CHARS)
+        self._worker = _encode(self.worker_id, WORKER_CHARS)
+        self._last_ms = -1
+        self._seen_ms = -1
+        self._sequence = 0
+        self._prefix = ''
+        # A fresh lock: the parent's may have been held by another thread at fork time
+        self._lock = threading.Lock()
+
+    def next_id(self, prefix: str = '') -> str:
+        """Next ID in this process, with prefix prepended"""
+        with self._lock:
+            now = int(time.time() * 1000)
+            if now > self._last_ms:
+                self._last_ms = now
+                self._sequence = 0
+                self._prefix = _encode(now, TIMESTAMP_CHARS) + self._worker
+            else:
+                if now < self._seen_ms:
+                    self.clock_regressions += 1
+                self._sequence += 1
+                if self._sequence >= SEQUENCE_LIMIT:
+                    # Borrow the next millisecond rather than block
+                    self.sequence_rollovers += 1
+                    self._last_ms += 1
+                    self._sequence = 0
+                    self._prefix = _encode(self._last_ms, TIMESTAMP_CHARS) + self._worker
+            self._seen_ms = now
+            sequence = self._sequence
+            body = self._prefix
+            self.issued += 1
+        return f"{prefix}{body}{_PAIRS[sequence >> 10]}{_PAIRS[sequence & 1023]}"
+
+    def order_id(self) -> str:
+        """merchantOrderId for a new payment order"""
+        return self.next_id('LEKHAK_')
+
+    def refund_id(self) -> str:
+        """merchantRefundId for a new refund"""
+        return self.next_id('REFUND_')
+
+    @staticmethod
+    def timestamp_ms(generated_id: str) -> int:
+        """Millisecond timestamp an ID was issued at"""
+        body = generated_id[-(TIMESTAMP_CHARS + WORKER_CHARS + SEQUENCE_CHARS):]
+        value = 0
+        for char in body[:TIMESTAMP_CHARS]:
+            value = value * 32 + ALPHABET.index(char)
+        return value
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "worker_id": self._worker,
+            "issued": self.issued,
+            "clock_regressions": self.clock_regressions,
+            "sequence_rollovers": self.sequence_rollovers
+        }
+
+
+# Global order ID generator shared by the payment services and serverless handlers
+order_ids = OrderIdGenerator.from_env()
@@ -0,0 +1,141 @@
+import os
+import logging
+from typing import Any, Dict, Optional
+
+from .cache import TTLCache
+from .payment_status_cache import TERMINAL_STATES, PaymentStatusCache, payment_status_cache
+from .supabase_rest_client import supabase_service
+from .write_behind import write_behind
+
+
+class OrderStateStore:
+    """Latest known PhonePe state per merchant order
+
+    Webhook handlers and gateway lookups record states here; they are kept in
+    memory and persisted to phonepe_transactions through the write-behind buffer.
+    Status requests for an order in a terminal state (COMPLETED, FAILED) are
+    answered locally; unknown or pending orders fall back to the gateway.
+    A terminal state is never replaced by a non-terminal one.
+    """
+
+    def __init__(self, status_cache: PaymentStatusCache, database=None, max_entries: int = 100000,
+                 ttl_seconds: float = 86400, miss_ttl_seconds: float = 60):
+        self.status_cache = status_cache
+        self.database = database
+        self.ttl_seconds = ttl_seconds
+        self.miss_ttl_seconds = miss_ttl_seconds
+        self.logger = logging.getLogger(__name__)
+
+        self._orders = TTLCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+
+        self.local_answers = 0
+        self.database_answers = 0
+        self.gateway_fallbacks = 0
+        self.recorded = 0
+
+    @classmethod
+    def from_env(cls, status_cache: PaymentStatusCache, database=None) -> "OrderStateStore":
+        """Create a store from ORDER_STATE_* environment variables"""
+        return cls(
+            status_cache,
+            database,
+            max_entries=int(os.getenv('ORDER_STATE_MAX_ENTRIES', '100000')),
+            ttl_seconds=float(os.getenv('ORDER_STATE_TTL_SECONDS', '86400')),
+            miss_ttl_seconds=float(os.getenv('ORDER_STATE_MISS_TTL_SECONDS', '60'))
+        )
+
+    def record(self, merchant_order_id: str, state: Optional[str], payload: Dict[str, Any], source: str = 'webhook') -> bool:
+        """Remember an order's state and persist it; returns False if it was ignored"""
+        if not merchant_order_id or not state:
+            return False
+
+        current = self._orders.get(merchant_order_id)
+        if current is not None and current["state"] in TERMINAL_STATES and state not in TERMINAL_STATES:
+            return False
+
+        self._orders.set(merchant_order_id, {"state": state, "payload": payload, "source": source})
+        self.recorded += 1
+
+        if current is None or current["state"] != state or source == 'webhook':
+            write_behind.update(
+                'phonepe_transactions', 'merchant_order_id', merchant_order_id,
+                {"state": state, "payment_details": payload},
+                timestamp_column='callback_received_at' if source == 'webhook' else 'verified_at'
+            )
+        if source == 'webhook':
+            self.status_cache.invalidate(merchant_order_id)
+        return True
+
+    def get(self, merchant_order_id: str) -> Optional[Dict[str, Any]]:
+        return self._orders.get(merchant_order_id)
+
+    async def _load(self, merchant_order_id: str) -> Optional[Dict[str, Any]]:
+        """Look an order up in phonepe_transactions, e.g. after a restart"""
+        if self.database is None:
+            return None
+
+        rows = await self.database._make_request_async(
+            "GET", "phonepe_transactions",
+            params={"merchant_order_id": f"eq.{merchant_order_id}", "select": "state,payment_details"}
+        )
+        if rows is None:
+            return None
+
+        order = {"state": None, "payload": {}, "source": 'database'}
+        if rows:
+            order["state"] = rows[0].get("state")
+            order["payload"] = rows[0].get("payment_details") or {}
+        # Unknown and pending orders are remembered briefly so repeated polls skip this read
+        ttl = self.ttl_seconds if order["state"] in TERMINAL_STATES else self.miss_ttl_seconds
+        self._orders.set(merchant_order_id, order, ttl_seconds=ttl)
+        return order
+
+    def _status_result(self, order: Dict[str, Any]) -> Dict[str, Any]:
+        """Same shape as check_payment_status"""
+        payload = order["payload"] or {}
+        return {
+            "success": True,
+            "status_data": {"payload": payload},
+            "state": order["state"],
+            "amount": payload.get('amount'),
+            "payment_details": payload.get('paymentDetails', []),
+            "source": order["source"]
+        }
+
+    async def get_status(self, merchant_order_id: str, include_details: bool = True) -> Dict[str, Any]:
+        """Payment status from the local state when terminal, otherwise from the gateway"""
+        order = self._orders.get(merchant_order_id)
+        if order is not None and order["state"] in TERMINAL_STATES:
+            self.local_answers += 1
+            return self._status_result(order)
+
+        if order is None:
+            try:
+                order = await self._load(merchant_order_id)
+            except Exception as e:
+                self.logger.error(f"Order state lookup failed for {merchant_order_id}: {e}")
+            if order is not None and order["state"] in TERMINAL_STATES:
+                self.database_answers += 1
+                return self._status_result(order)
+
+        self.gateway_fallbacks += 1
+        result = await self.status_cache.get(merchant_order_id, include_details=include_details)
+        if result.get("success"):
+            self.record(merchant_order_id, result.get("state"), (result.get("status_data") or {}).get('payload', {}),
+                        source='gateway')
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        answered = self.local_answers + self.database_answers + self.gateway_fallbacks
+        return {
+            "orders": len(self._orders),
+            "recorded": self.recorded,
+            "local_answers": self.local_answers,
+            "database_answers": self.database_answers,
+            "gateway_fallbacks": self.gateway_fallbacks,
+            "short_circuit_rate": round((self.local_answers + self.database_answers) / answered, 4) if answered else 0.0
+        }
+
+
+# Global order state store, backed by phonepe_transactions
+order_state = OrderStateStore.from_env(payment_status_cache, supabase_service)
@@ -0,0 +1,121 @@
+import os
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from .cache import TTLCache
+from .phonepe_payment import phonepe_payment_async
+
+# Order states that never change once PhonePe reports them
+TERMINAL_STATES = frozenset({"COMPLETED", "FAILED"})
+
+
+class PaymentStatusCache:
+    """Short-lived cache and request coalescing in front of check_payment_status
+
+    Concurrent lookups for the same order share one upstream call. Successful
+    results are cached per order: briefly while the order is still PENDING, for
+    a long time once it is COMPLETED or FAILED. Failed lookups are not cached.
+    """
+
+    def __init__(self, fetch: Callable[..., Awaitable[Dict[str, Any]]], pending_ttl_seconds: float = 3,
+                 terminal_ttl_seconds: float = 86400, max_entries: int = 50000):
+        self.fetch = fetch
+        self.pending_ttl_seconds = pending_ttl_seconds
+        self.terminal_ttl_seconds = terminal_ttl_seconds
+        self.logger = logging.getLogger(__name__)
+
+        self._entries = TTLCache(max_entries=max_entries, ttl_seconds=terminal_ttl_seconds)
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.upstream_calls = 0
+        self.upstream_failures = 0
+
+    @classmethod
+    def from_env(cls, fetch: Callable[..., Awaitable[Dict[str, Any]]]) -> "PaymentStatusCache":
+        """Create a cache from PAYMENT_STATUS_* environment variables"""
+        return cls(
+            fetch,
+            pending_ttl_seconds=float(os.getenv('PAYMENT_STATUS_PENDING_TTL_SECONDS', '3')),
+            terminal_ttl_seconds=float(os.getenv('PAYMENT_STATUS_TERMINAL_TTL_SECONDS', '86400')),
+            max_entries=int(os.getenv('PAYMENT_STATUS_CACHE_MAX_ENTRIES', '50000'))
+        )
+
+    def _cached(self, merchant_order_id: str, include_details: bool) -> Optional[Dict[str, Any]]:
+        result = self._entries.get((merchant_order_id, include_details))
+        if result is None and not include_details:
+            # A detailed result also answers a summary lookup
+            result = self._entries.get((merchant_order_id, True))
+        return result
+
+    async def get(self, merchant_order_id: str, include_details: bool = True) -> Dict[str, Any]:
+        """Payment status for an order, from cache, a shared in-flight call, or PhonePe"""
+        result = self._cached(merchant_order_id, include_details)
+        if result is not None:
+            self.hits += 1
+            return result
+
+        key = (merchant_order_id, include_details)
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+            # The leader was cancelled, not this lookup: look again (cache, a new leader, or PhonePe)
+            return await self.get(merchant_order_id, include_details)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            self.upstream_calls += 1
+            result = await self.fetch(merchant_order_id=merchant_order_id, include_details=include_details)
+            if result.get("success"):
+                terminal = result.get("state") in TERMINAL_STATES
+                ttl = self.terminal_ttl_seconds if terminal else self.pending_ttl_seconds
+                self._entries.set(key, result, ttl_seconds=ttl)
+            else:
+                self.upstream_failures += 1
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            # Leader cancelled (client gone, request timeout): wake the waiters so one of them retries
+            future.cancel()
+            raise
+        except Exception as e:
+            self.upstream_failures += 1
+            future.set_exception(e)
+            # Waiters receive the exception; mark it retrieved for the leader's own raise
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def invalidate(self, merchant_order_id: str) -> None:
+        """Drop cached results for an order, e.g. when a webhook reports a new state"""
+        self._entries.pop((merchant_order_id, True))
+        self._entries.pop((merchant_order_id, False))
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "upstream_calls": self.upstream_calls,
+            "upstream_failures": self.upstream_failures,
+            "hit_rate": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0
+        }
+
+
+# Global payment status cache in front of the async PhonePe payment service (resolved per call, so
+# importing this module does not construct the service)
+payment_status_cache = PaymentStatusCache.from_env(lambda **kwargs: phonepe_payment_async.check_payment_status(**kwargs))
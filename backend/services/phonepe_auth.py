@@ -1,91 +1,199 @@
 import os
 import time
+import random
+import asyncio
+import threading
+import httpx
 import requests
 import logging
-from typing import Dict, Optional
+from typing import Dict, Optional, Tuple
 from datetime import datetime, timedelta
-from dotenv import load_dotenv
+from .http_pool import get_async_pool
+from .lazy import LazyService
+from .rate_limiter import RateLimitExceeded
+from .resilience import CircuitOpenError, phonepe_gateway
+from .token_store import TokenStore, get_default_token_store
 
-load_dotenv()
+# Tokens are treated as expired this long before their actual expiry
+TOKEN_EXPIRY_BUFFER = timedelta(minutes=5)
 
 class PhonePeAuthService:
     """Production PhonePe OAuth Token Management Service"""
     
-    def __init__(self):
+    def __init__(self, token_store: Optional[TokenStore] = None):
         self.client_id = os.getenv('PHONEPE_CLIENT_ID')
         self.client_secret = os.getenv('PHONEPE_CLIENT_SECRET')
         self.client_version = os.getenv('PHONEPE_CLIENT_VERSION', '1')
         self.auth_url = os.getenv('PHONEPE_AUTH_URL')
         
+        # Token store shared with other workers (memory, file or sqlite backend)
+        self.token_store = token_store or get_default_token_store(self.client_id or 'default')
+        self.shared_refresh_timeout = float(os.getenv('PHONEPE_TOKEN_SHARED_REFRESH_TIMEOUT', '30'))
+        
         self.access_token = None
         self.token_expires_at = None
         self.logger = logging.getLogger(__name__)
         
+        # Proactive refresh: renew this many seconds ahead of the expiry buffer, with jitter
+        self.refresh_ahead_seconds = float(os.getenv('PHONEPE_TOKEN_REFRESH_AHEAD_SECONDS', '300'))
+        self.refresh_jitter_seconds = float(os.getenv('PHONEPE_TOKEN_REFRESH_JITTER_SECONDS', '60'))
+        self.refresh_retry_seconds = float(os.getenv('PHONEPE_TOKEN_REFRESH_RETRY_SECONDS', '15'))
+        
+        self._refresh_lock = threading.Lock()
+        self._refresher_thread = None
+        self._refresher_stop = threading.Event()
+        
         # Validate required credentials
         if not all([self.client_id, self.client_secret, self.auth_url]):
             raise ValueError("Missing required PhonePe credentials")
     
     def get_access_token(self) -> str:
         """Get valid access token, refresh if needed"""
-        if self.is_token_expired():
-            self._refresh_token()
+        if self.is_token_expired() and not self._adopt_stored_token():
+            # Single-flight: one thread refreshes, the rest wait and reuse its token
+            with self._refresh_lock:
+                if self.is_token_expired():
+                    self._refresh_shared()
         
         return self.access_token
     
+    def _adopt_stored_token(self, newer_than: Optional[datetime] = None) -> bool:
+        """Use a valid token from the shared store, optionally only one expiring after newer_than"""
+        try:
+            stored = self.token_store.get_valid(TOKEN_EXPIRY_BUFFER.total_seconds())
+        except Exception as e:
+            self.logger.warning(f"Token store read failed: {e}")
+            return False
+        
+        if not stored:
+            return False
+        
+        expires_at = datetime.fromtimestamp(stored['expires_at'])
+        if newer_than is not None and expires_at <= newer_than:
+            return False
+        
+        self.access_token = stored['access_token']
+        self.token_expires_at = expires_at
+        return True
+    
+    def _refresh_shared(self, newer_than: Optional[datetime] = None) -> None:
+        """Refresh under the store's cross-process lock unless another worker already did"""
+        with self.token_store.refresh_lock():
+            # Another worker may have stored a fresh token while we waited for the lock
+            if not self._adopt_stored_token(newer_than):
+                self._refresh_token()
+    
     def is_token_expired(self) -> bool:
         """Check if current token is expired or about to expire"""
         if not self.access_token or not self.token_expires_at:
             return True
         
-        # Refresh token 5 minutes before expiry
-        buffer_time = timedelta(minutes=5)
-        return datetime.now() >= (self.token_expires_at - buffer_time)
+        return datetime.now() >= (self.token_expires_at - TOKEN_EXPIRY_BUFFER)
+    
+    def _next_refresh_delay(self) -> float:
+        """Seconds until the background refresher should renew the token"""
+        if not self.access_token or not self.token_expires_at:
+            return 0.0
+        
+        refresh_at = self.token_expires_at - TOKEN_EXPIRY_BUFFER - timedelta(seconds=self.refresh_ahead_seconds)
+        jitter = random.uniform(0, self.refresh_jitter_seconds)
+        return max(0.0, (refresh_at - datetime.now()).total_seconds() - jitter)
+    
+    def start_background_refresh(self) -> None:
+        """Start a daemon thread that renews the token before it nears expiry"""
+        if self._refresher_thread and self._refresher_thread.is_alive():
+            return
+        
+        self._refresher_stop.clear()
+        self._refresher_thread = threading.Thread(
+            target=self._background_refresh_loop,
+            name="phonepe-token-refresher",
+            daemon=True
+        )
+        self._refresher_thread.start()
+    
+    def stop_background_refresh(self) -> None:
+        """Stop the background refresher thread"""
+        self._refresher_stop.set()
+        if self._refresher_thread:
+            self._refresher_thread.join(timeout=5)
+            self._refresher_thread = None
+    
+    def _background_refresh_loop(self) -> None:
+        """Refresh the token ahead of expiry until stopped"""
+        while not self._refresher_stop.wait(self._next_refresh_delay()):
+            try:
+                with self._refresh_lock:
+                    self._refresh_shared(newer_than=self.token_expires_at)
+            except Exception as e:
+                self.logger.warning(f"Background token refresh failed, retrying: {e}")
+                if self._refresher_stop.wait(self.refresh_retry_seconds):
+                    break
+    
+    def _build_token_request(self) -> Tuple[Dict[str, str], Dict[str, str]]:
+        """Build form payload and headers for the OAuth token request"""
+        payload = {
+            "client_id": self.client_id,
+            "client_secret": self.client_secret,
+            "client_version": self.client_version,
+            "grant_type": "client_credentials"
+        }
+        
+        headers = {
+            "Content-Type": "application/x-www-form-urlencoded",
+            "Accept": "application/json"
+        }
+        
+        return payload, headers
+    
+    def _apply_token_response(self, status_code: int, token_data: Optional[Dict], response_text: str) -> None:
+        """Store the token from an OAuth response or raise on failure"""
+        if status_code == 200:
+            access_token = (token_data or {}).get('access_token')
+            expires_at = (token_data or {}).get('expires_at')
+            
+            if not access_token:
+                raise Exception("No access token in response")
+            
+            self.access_token = access_token
+            
+            # Convert epoch timestamp to datetime
+            if expires_at:
+                self.token_expires_at = datetime.fromtimestamp(expires_at)
+            else:
+                # Default 1 hour if no expiry provided
+                self.token_expires_at = datetime.now() + timedelta(hours=1)
+            
+            self.logger.info(f"PhonePe access token refreshed successfully. Expires at: {self.token_expires_at}")
+            
+            try:
+                self.token_store.save(self.access_token, self.token_expires_at.timestamp())
+            except Exception as e:
+                self.logger.warning(f"Failed to share token through token store: {e}")
+        else:
+            error_msg = f"Token refresh failed: {status_code} - {response_text}"
+            self.logger.error(error_msg)
+            raise Exception(error_msg)
     
     def _refresh_token(self) -> None:
         """Refresh OAuth access token"""
         try:
-            payload = {
-                "client_id": self.client_id,
-                "client_secret": self.client_secret,
-                "client_version": self.client_version,
-                "grant_type": "client_credentials"
-            }
-            
-            headers = {
-                "Content-Type": "application/x-www-form-urlencoded",
-                "Accept": "application/json"
-            }
+            payload, headers = self._build_token_request()
             
             self.logger.info("Refreshing PhonePe access token...")
             
-            response = requests.post(
+            response = phonepe_gateway.call("token", lambda timeout: requests.post(
                 self.auth_url,
                 data=payload,  # Use data instead of json for form encoding
                 headers=headers,
-                timeout=30
-            )
+                timeout=timeout
+            ))
             
-            if response.status_code == 200:
-                token_data = response.json()
-                self.access_token = token_data.get('access_token')
-                expires_at = token_data.get('expires_at')
-                
-                if not self.access_token:
-                    raise Exception("No access token in response")
-                
-                # Convert epoch timestamp to datetime
-                if expires_at:
-                    self.token_expires_at = datetime.fromtimestamp(expires_at)
-                else:
-                    # Default 1 hour if no expiry provided
-                    self.token_expires_at = datetime.now() + timedelta(hours=1)
-                
-                self.logger.info(f"PhonePe access token refreshed successfully. Expires at: {self.token_expires_at}")
-            else:
-                error_msg = f"Token refresh failed: {response.status_code} - {response.text}"
-                self.logger.error(error_msg)
-                raise Exception(error_msg)
+            token_data = response.json() if response.status_code == 200 else None
+            self._apply_token_response(response.status_code, token_data, response.text)
                 
+        except (CircuitOpenError, RateLimitExceeded):
+            raise
         except requests.exceptions.RequestException as e:
             self.logger.error(f"Network error during token refresh: {e}")
             raise Exception(f"Network error: {e}")
@@ -111,8 +219,128 @@ class PhonePeAuthService:
             "client_id": self.client_id[:8] + "..." if self.client_id else None
         }
 
-# Global auth service instance
-phonepe_auth = PhonePeAuthService()
+class AsyncPhonePeAuthService(PhonePeAuthService):
+    """Non-blocking PhonePe OAuth token service on the shared async HTTP client"""
+    
+    def __init__(self, token_store: Optional[TokenStore] = None):
+        super().__init__(token_store)
+        self._inflight_refresh: Optional[asyncio.Future] = None
+        self._refresher_task: Optional[asyncio.Task] = None
+    
+    async def get_access_token(self) -> str:
+        """Get valid access token, refresh if needed"""
+        if self.is_token_expired() and not self._adopt_stored_token():
+            await self._refresh_single_flight()
+        
+        return self.access_token
+    
+    async def _refresh_single_flight(self, newer_than: Optional[datetime] = None) -> None:
+        """Run at most one token refresh at a time; concurrent callers await its result"""
+        if self._inflight_refresh is None:
+            self._inflight_refresh = asyncio.ensure_future(self._refresh_shared(newer_than))
+            self._inflight_refresh.add_done_callback(self._clear_inflight_refresh)
+        
+        # Shield so a cancelled caller does not cancel the refresh other callers share
+        await asyncio.shield(self._inflight_refresh)
+    
+    def _clear_inflight_refresh(self, future: asyncio.Future) -> None:
+        """Forget a finished refresh so the next expiry starts a new one"""
+        if self._inflight_refresh is future:
+            self._inflight_refresh = None
+        if not future.cancelled():
+            # Mark the exception retrieved; awaiting callers still receive it
+            future.exception()
+    
+    async def _refresh_shared(self, newer_than: Optional[datetime] = None) -> None:
+        """Refresh under the store's cross-process lock without blocking the event loop"""
+        deadline = time.monotonic() + self.shared_refresh_timeout
+        
+        while True:
+            with self.token_store.refresh_lock(blocking=False) as acquired:
+                if acquired:
+                    if not self._adopt_stored_token(newer_than):
+                        await self._refresh_token()
+                    return
+            
+            # Another worker is refreshing; pick up its token as soon as it lands
+            if self._adopt_stored_token(newer_than):
+                return
+            
+            if time.monotonic() >= deadline:
+                self.logger.warning("Timed out waiting for shared token refresh, refreshing locally")
+                await self._refresh_token()
+                return
+            
+            await asyncio.sleep(0.05)
+    
+    def start_background_refresh(self) -> None:
+        """Start a task on the running loop that renews the token before it nears expiry"""
+        if self._refresher_task and not self._refresher_task.done():
+            return
+        
+        self._refresher_task = asyncio.ensure_future(self._background_refresh_loop())
+    
+    async def stop_background_refresh(self) -> None:
+        """Cancel the background refresher task"""
+        if self._refresher_task:
+            self._refresher_task.cancel()
+            try:
+                await self._refresher_task
+            except asyncio.CancelledError:
+                pass
+            self._refresher_task = None
+    
+    async def _background_refresh_loop(self) -> None:
+        """Refresh the token ahead of expiry until cancelled"""
+        while True:
+            await asyncio.sleep(self._next_refresh_delay())
+            try:
+                await self._refresh_single_flight(newer_than=self.token_expires_at)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.warning(f"Background token refresh failed, retrying: {e}")
+                await asyncio.sleep(self.refresh_retry_seconds)
+    
+    async def _refresh_token(self) -> None:
+        """Refresh OAuth access token"""
+        try:
+            payload, headers = self._build_token_request()
+            
+            self.logger.info("Refreshing PhonePe access token...")
+            
+            pool = get_async_pool("phonepe")
+            response = await phonepe_gateway.call_async("token", lambda timeout: pool.post(
+                self.auth_url,
+                data=payload,
+                headers=headers,
+                timeout=timeout
+            ))
+            
+            token_data = response.json() if response.status_code == 200 else None
+            self._apply_token_response(response.status_code, token_data, response.text)
+                
+        except (CircuitOpenError, RateLimitExceeded):
+            raise
+        except httpx.HTTPError as e:
+            self.logger.error(f"Network error during token refresh: {e}")
+            raise Exception(f"Network error: {e}")
+        except Exception as e:
+            self.logger.error(f"Token refresh error: {e}")
+            raise Exception(f"Token refresh failed: {e}")
+    
+    async def validate_credentials(self) -> bool:
+        """Validate PhonePe credentials by attempting token refresh"""
+        try:
+            await self._refresh_single_flight()
+            return True
+        except Exception as e:
+            self.logger.error(f"Credential validation failed: {e}")
+            return False
+
+# Global auth service instances, created on first use
+phonepe_auth = LazyService(PhonePeAuthService)
+phonepe_auth_async = LazyService(AsyncPhonePeAuthService)
 
 # Test credentials on module load
 if __name__ == "__main__":
@@ -1,19 +1,22 @@
 import os
-import time
 import uuid
 import requests
 import logging
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Tuple
 from datetime import datetime
-from dotenv import load_dotenv
-from .phonepe_auth import phonepe_auth
-
-load_dotenv()
+from .http_pool import get_async_pool
+from .lazy import LazyService
+from .order_ids import order_ids
+from .phonepe_auth import PhonePeAuthService, phonepe_auth, phonepe_auth_async
+from .plan_catalog import PlanPrice, plan_catalog, to_paisa
+from .rate_limiter import RateLimitExceeded
+from .resilience import CircuitOpenError, phonepe_gateway
 
 class PhonePePaymentService:
     """Production PhonePe Payment Service with Direct API Integration"""
     
-    def __init__(self):
+    def __init__(self, auth_service: Optional[PhonePeAuthService] = None):
+        self.auth = auth_service or phonepe_auth
         self.merchant_id = os.getenv('PHONEPE_MERCHANT_ID')
         self.checkout_url = os.getenv('PHONEPE_CHECKOUT_URL')
         self.status_url = os.getenv('PHONEPE_STATUS_URL')
@@ -27,103 +30,221 @@ class PhonePePaymentService:
         if not all([self.merchant_id, self.checkout_url, self.status_url]):
             raise ValueError("Missing required PhonePe API configuration")
     
-    def create_payment_order(self, user_id: str, plan_id: str, amount_rupees: float, plan_name: str) -> Dict[str, Any]:
+    def _auth_headers(self, access_token: str) -> Dict[str, str]:
+        """Build PhonePe API headers for an access token"""
+        return {
+            "Content-Type": "application/json",
+            "Authorization": f"O-Bearer {access_token}",
+            "Accept": "application/json"
+        }
+    
+    def _build_payment_order(self, user_id: str, price: PlanPrice) -> Dict[str, Any]:
+        """Build merchant order ID, amounts and checkout payload for a payment order"""
+        # Unique, time-ordered merchant order ID (safe for concurrent checkouts by one user)
+        merchant_order_id = order_ids.order_id()
+        
+        # Exact integer-paisa amounts (base + GST) from the plan catalog
+        amount_paisa = price.total_paisa
+        
+        payment_payload = {
+            "merchantId": self.merchant_id,
+            "merchantOrderId": merchant_order_id,
+            "amount": amount_paisa,
+            "paymentFlow": "IFRAME",
+            "expireAfter": 1800,  # 30 minutes
+            "redirectUrl": self.success_url,
+            "callbackUrl": f"https://www.lekhakai.com/api/webhooks/phonepe",
+            "metaInfo": {
+                "user_id": user_id,
+                "plan_id": price.plan_id,
+                "plan_name": price.plan_name,
+                "billing_cycle": price.billing_cycle,
+                "source": "lekhakai_website",
+                "base_amount": str(price.base_amount),
+                "gst_amount": str(price.gst_amount),
+                "total_amount": str(price.total_amount)
+            },
+            "paymentModeConfig": {
+                "enabledModes": ["UPI", "CARD", "NET_BANKING", "WALLET"],
+                "disabledModes": []
+            }
+        }
+        
+        return {
+            "merchant_order_id": merchant_order_id,
+            "payload": payment_payload,
+            "amount_paisa": amount_paisa,
+            "total_amount": price.total_amount,
+            "base_amount": price.base_amount,
+            "gst_amount": price.gst_amount,
+            "user_id": user_id,
+            "plan_id": price.plan_id,
+            "plan_name": price.plan_name,
+            "billing_cycle": price.billing_cycle
+        }
+    
+    def _payment_order_result(self, order: Dict[str, Any], status_code: int, payment_data: Optional[Dict], response_text: str) -> Dict[str, Any]:
+        """Convert a checkout API response into a payment order result"""
+        merchant_order_id = order["merchant_order_id"]
+        
+        if status_code == 200:
+            self.logger.info(f"Payment order created successfully: {merchant_order_id}")
+            
+            return {
+                "success": True,
+                "merchant_order_id": merchant_order_id,
+                "payment_token": payment_data.get("token"),
+                "payment_url": payment_data.get("paymentUrl"),
+                "expires_at": payment_data.get("expiresAt"),
+                "amount_paisa": order["amount_paisa"],
+                "amount_rupees": order["total_amount"],
+                "base_amount": order["base_amount"],
+                "gst_amount": order["gst_amount"],
+                "user_id": order["user_id"],
+                "plan_id": order["plan_id"],
+                "plan_name": order["plan_name"],
+                "billing_cycle": order["billing_cycle"]
+            }
+        
+        error_msg = f"Payment creation failed: {status_code} - {response_text}"
+        self.logger.error(error_msg)
+        return {
+            "success": False,
+            "error": "Payment order creation failed",
+            "details": response_text,
+            "status_code": status_code
+        }
+    
+    def _build_status_request(self, merchant_order_id: str, include_details: bool) -> Tuple[str, Dict[str, str]]:
+        """Build status endpoint URL and query params for an order"""
+        params = {
+            "details": "true" if include_details else "false"
+        }
+        
+        status_endpoint = f"{self.status_url}/{merchant_order_id}/status"
+        
+        return status_endpoint, params
+    
+    def _payment_status_result(self, merchant_order_id: str, status_code: int, status_data: Optional[Dict], response_text: str) -> Dict[str, Any]:
+        """Convert a status API response into a payment status result"""
+        if status_code == 200:
+            self.logger.info(f"Payment status retrieved: {merchant_order_id} - {status_data.get('payload', {}).get('state', 'UNKNOWN')}")
+            
+            return {
+                "success": True,
+                "status_data": status_data,
+                "state": status_data.get('payload', {}).get('state'),
+                "amount": status_data.get('payload', {}).get('amount'),
+                "payment_details": status_data.get('payload', {}).get('paymentDetails', [])
+            }
+        
+        error_msg = f"Status check failed: {status_code} - {response_text}"
+        self.logger.error(error_msg)
+        return {
+            "success": False,
+            "error": "Status check failed",
+            "details": response_text
+        }
+    
+    def _build_refund(self, original_merchant_order_id: str, refund_amount: float, reason: str) -> Dict[str, Any]:
+        """Build merchant refund ID and refund payload"""
+        # Unique, time-ordered refund ID (the original order travels in the payload)
+        merchant_refund_id = order_ids.refund_id()
+        refund_amount_paisa = to_paisa(refund_amount)
+        
+        refund_payload = {
+            "merchantId": self.merchant_id,
+            "merchantRefundId": merchant_refund_id,
+            "originalMerchantOrderId": original_merchant_order_id,
+            "amount": refund_amount_paisa,
+            "reason": reason
+        }
+        
+        return {
+            "merchant_refund_id": merchant_refund_id,
+            "payload": refund_payload,
+            "amount_paisa": refund_amount_paisa,
+            "reason": reason
+        }
+    
+    def _refund_result(self, refund: Dict[str, Any], status_code: int, refund_data: Optional[Dict], response_text: str) -> Dict[str, Any]:
+        """Convert a refund API response into a refund result"""
+        merchant_refund_id = refund["merchant_refund_id"]
+        
+        if status_code == 200:
+            self.logger.info(f"Refund initiated successfully: {merchant_refund_id}")
+            
+            return {
+                "success": True,
+                "merchant_refund_id": merchant_refund_id,
+                "refund_id": refund_data.get("refundId"),
+                "state": refund_data.get("state", "PENDING"),
+                "amount": refund["amount_paisa"],
+                "reason": refund["reason"]
+            }
+        
+        error_msg = f"Refund initiation failed: {status_code} - {response_text}"
+        self.logger.error(error_msg)
+        return {
+            "success": False,
+            "error": "Refund initiation failed",
+            "details": response_text
+        }
+    
+    def _gateway_unavailable(self, error: Exception) -> Dict[str, Any]:
+        """Fail fast while PhonePe's circuit is open or our rate limit is exhausted; callers answer 503 with Retry-After"""
+        self.logger.warning(f"PhonePe unavailable: {error}")
+        return {
+            "success": False,
+            "error": "Payment gateway temporarily unavailable",
+            "retry_after": error.retry_after
+        }
+    
+    def _unknown_plan(self, plan_id: str, billing_cycle: str) -> Dict[str, Any]:
+        self.logger.warning(f"Payment requested for unknown plan: {plan_id} ({billing_cycle})")
+        return {
+            "success": False,
+            "error": f"Unknown plan: {plan_id} ({billing_cycle})"
+        }
+    
+    def create_payment_order(self, user_id: str, plan_id: str, billing_cycle: str = 'monthly') -> Dict[str, Any]:
         """
         Create payment order using PhonePe API
         
         Args:
             user_id: User identifier
-            plan_id: Subscription plan ID  
-            amount_rupees: Amount in rupees
-            plan_name: Name of the plan
+            plan_id: Subscription plan ID, priced from the plan catalog
+            billing_cycle: monthly or yearly
             
         Returns:
             Payment order response with token and URLs
         """
         try:
-            # Generate unique merchant order ID
-            timestamp = int(time.time())
-            user_hash = user_id[:8] if len(user_id) >= 8 else user_id
-            merchant_order_id = f"LEKHAK_{user_hash}_{timestamp}"
+            price = plan_catalog.get_price(plan_id, billing_cycle)
+            if price is None:
+                return self._unknown_plan(plan_id, billing_cycle)
             
-            # Convert to paisa and add GST (18%)
-            base_amount = amount_rupees
-            gst_amount = base_amount * 0.18
-            total_amount = base_amount + gst_amount
-            amount_paisa = int(total_amount * 100)
+            order = self._build_payment_order(user_id, price)
             
             # Get fresh access token
-            access_token = phonepe_auth.get_access_token()
-            
-            # Prepare payment request
-            payment_payload = {
-                "merchantId": self.merchant_id,
-                "merchantOrderId": merchant_order_id,
-                "amount": amount_paisa,
-                "paymentFlow": "IFRAME",
-                "expireAfter": 1800,  # 30 minutes
-                "redirectUrl": self.success_url,
-                "callbackUrl": f"https://www.lekhakai.com/api/webhooks/phonepe",
-                "metaInfo": {
-                    "user_id": user_id,
-                    "plan_id": plan_id,
-                    "plan_name": plan_name,
-                    "source": "lekhakai_website",
-                    "base_amount": base_amount,
-                    "gst_amount": gst_amount,
-                    "total_amount": total_amount
-                },
-                "paymentModeConfig": {
-                    "enabledModes": ["UPI", "CARD", "NET_BANKING", "WALLET"],
-                    "disabledModes": []
-                }
-            }
-            
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"O-Bearer {access_token}",
-                "Accept": "application/json"
-            }
+            access_token = self.auth.get_access_token()
+            headers = self._auth_headers(access_token)
             
-            self.logger.info(f"Creating payment order: {merchant_order_id} for ₹{total_amount}")
+            self.logger.info(f"Creating payment order: {order['merchant_order_id']} for ₹{order['total_amount']}")
             
             # Make API call
-            response = requests.post(
+            response = phonepe_gateway.call("pay", lambda timeout: requests.post(
                 self.checkout_url,
-                json=payment_payload,
+                json=order["payload"],
                 headers=headers,
-                timeout=30
-            )
+                timeout=timeout
+            ))
             
-            if response.status_code == 200:
-                payment_data = response.json()
-                
-                self.logger.info(f"Payment order created successfully: {merchant_order_id}")
-                
-                return {
-                    "success": True,
-                    "merchant_order_id": merchant_order_id,
-                    "payment_token": payment_data.get("token"),
-                    "payment_url": payment_data.get("paymentUrl"),
-                    "expires_at": payment_data.get("expiresAt"),
-                    "amount_paisa": amount_paisa,
-                    "amount_rupees": total_amount,
-                    "base_amount": base_amount,
-                    "gst_amount": gst_amount,
-                    "user_id": user_id,
-                    "plan_id": plan_id,
-                    "plan_name": plan_name
-                }
-            else:
-                error_msg = f"Payment creation failed: {response.status_code} - {response.text}"
-                self.logger.error(error_msg)
-                return {
-                    "success": False,
-                    "error": "Payment order creation failed",
-                    "details": response.text,
-                    "status_code": response.status_code
-                }
+            payment_data = response.json() if response.status_code == 200 else None
+            return self._payment_order_result(order, response.status_code, payment_data, response.text)
                 
+        except (CircuitOpenError, RateLimitExceeded) as e:
+            return self._gateway_unavailable(e)
         except Exception as e:
             self.logger.error(f"Payment creation error: {e}")
             return {
@@ -135,50 +256,24 @@ class PhonePePaymentService:
     def check_payment_status(self, merchant_order_id: str, include_details: bool = True) -> Dict[str, Any]:
         """Check payment status using PhonePe API"""
         try:
-            access_token = phonepe_auth.get_access_token()
-            
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"O-Bearer {access_token}",
-                "Accept": "application/json"
-            }
-            
-            params = {
-                "details": "true" if include_details else "false"
-            }
-            
-            status_endpoint = f"{self.status_url}/{merchant_order_id}/status"
+            access_token = self.auth.get_access_token()
+            headers = self._auth_headers(access_token)
+            status_endpoint, params = self._build_status_request(merchant_order_id, include_details)
             
             self.logger.info(f"Checking payment status: {merchant_order_id}")
             
-            response = requests.get(
+            response = phonepe_gateway.call("status", lambda timeout: requests.get(
                 status_endpoint,
                 headers=headers,
                 params=params,
-                timeout=30
-            )
+                timeout=timeout
+            ))
             
-            if response.status_code == 200:
-                status_data = response.json()
-                
-                self.logger.info(f"Payment status retrieved: {merchant_order_id} - {status_data.get('payload', {}).get('state', 'UNKNOWN')}")
-                
-                return {
-                    "success": True,
-                    "status_data": status_data,
-                    "state": status_data.get('payload', {}).get('state'),
-                    "amount": status_data.get('payload', {}).get('amount'),
-                    "payment_details": status_data.get('payload', {}).get('paymentDetails', [])
-                }
-            else:
-                error_msg = f"Status check failed: {response.status_code} - {response.text}"
-                self.logger.error(error_msg)
-                return {
-                    "success": False,
-                    "error": "Status check failed",
-                    "details": response.text
-                }
+            status_data = response.json() if response.status_code == 200 else None
+            return self._payment_status_result(merchant_order_id, response.status_code, status_data, response.text)
                 
+        except (CircuitOpenError, RateLimitExceeded) as e:
+            return self._gateway_unavailable(e)
         except Exception as e:
             self.logger.error(f"Status check error: {e}")
             return {
@@ -190,58 +285,25 @@ class PhonePePaymentService:
     def initiate_refund(self, original_merchant_order_id: str, refund_amount: float, reason: str) -> Dict[str, Any]:
         """Initiate refund using PhonePe API"""
         try:
-            # Generate unique refund ID
-            timestamp = int(time.time())
-            merchant_refund_id = f"REFUND_{original_merchant_order_id}_{timestamp}"
-            refund_amount_paisa = int(refund_amount * 100)
-            
-            access_token = phonepe_auth.get_access_token()
-            
-            refund_payload = {
-                "merchantId": self.merchant_id,
-                "merchantRefundId": merchant_refund_id,
-                "originalMerchantOrderId": original_merchant_order_id,
-                "amount": refund_amount_paisa,
-                "reason": reason
-            }
+            refund = self._build_refund(original_merchant_order_id, refund_amount, reason)
             
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"O-Bearer {access_token}",
-                "Accept": "application/json"
-            }
+            access_token = self.auth.get_access_token()
+            headers = self._auth_headers(access_token)
             
-            self.logger.info(f"Initiating refund: {merchant_refund_id} for ₹{refund_amount}")
+            self.logger.info(f"Initiating refund: {refund['merchant_refund_id']} for ₹{refund_amount}")
             
-            response = requests.post(
+            response = phonepe_gateway.call("refund", lambda timeout: requests.post(
                 self.refund_url,
-                json=refund_payload,
+                json=refund["payload"],
                 headers=headers,
-                timeout=30
-            )
+                timeout=timeout
+            ))
             
-            if response.status_code == 200:
-                refund_data = response.json()
-                
-                self.logger.info(f"Refund initiated successfully: {merchant_refund_id}")
-                
-                return {
-                    "success": True,
-                    "merchant_refund_id": merchant_refund_id,
-                    "refund_id": refund_data.get("refundId"),
-                    "state": refund_data.get("state", "PENDING"),
-                    "amount": refund_amount_paisa,
-                    "reason": reason
-                }
-            else:
-                error_msg = f"Refund initiation failed: {response.status_code} - {response.text}"
-                self.logger.error(error_msg)
-                return {
-                    "success": False,
-                    "error": "Refund initiation failed",
-                    "details": response.text
-                }
+            refund_data = response.json() if response.status_code == 200 else None
+            return self._refund_result(refund, response.status_code, refund_data, response.text)
                 
+        except (CircuitOpenError, RateLimitExceeded) as e:
+            return self._gateway_unavailable(e)
         except Exception as e:
             self.logger.error(f"Refund initiation error: {e}")
             return {
@@ -259,11 +321,114 @@ class PhonePePaymentService:
             "refund_url": self.refund_url,
             "success_url": self.success_url,
             "failure_url": self.failure_url,
-            "auth_status": phonepe_auth.get_token_info()
+            "auth_status": self.auth.get_token_info()
         }
 
-# Global payment service instance
-phonepe_payment = PhonePePaymentService()
+class AsyncPhonePePaymentService(PhonePePaymentService):
+    """Non-blocking PhonePe Payment Service on the shared async HTTP client"""
+    
+    def __init__(self, auth_service: Optional[PhonePeAuthService] = None):
+        super().__init__(auth_service or phonepe_auth_async)
+    
+    async def create_payment_order(self, user_id: str, plan_id: str, billing_cycle: str = 'monthly') -> Dict[str, Any]:
+        """Create payment order using PhonePe API"""
+        try:
+            price = plan_catalog.get_price(plan_id, billing_cycle)
+            if price is None:
+                return self._unknown_plan(plan_id, billing_cycle)
+            
+            order = self._build_payment_order(user_id, price)
+            
+            access_token = await self.auth.get_access_token()
+            headers = self._auth_headers(access_token)
+            
+            self.logger.info(f"Creating payment order: {order['merchant_order_id']} for ₹{order['total_amount']}")
+            
+            pool = get_async_pool("phonepe")
+            response = await phonepe_gateway.call_async("pay", lambda timeout: pool.post(
+                self.checkout_url,
+                json=order["payload"],
+                headers=headers,
+                timeout=timeout
+            ))
+            
+            payment_data = response.json() if response.status_code == 200 else None
+            return self._payment_order_result(order, response.status_code, payment_data, response.text)
+                
+        except (CircuitOpenError, RateLimitExceeded) as e:
+            return self._gateway_unavailable(e)
+        except Exception as e:
+            self.logger.error(f"Payment creation error: {e}")
+            return {
+                "success": False,
+                "error": "Payment creation failed",
+                "details": str(e)
+            }
+    
+    async def check_payment_status(self, merchant_order_id: str, include_details: bool = True) -> Dict[str, Any]:
+        """Check payment status using PhonePe API"""
+        try:
+            access_token = await self.auth.get_access_token()
+            headers = self._auth_headers(access_token)
+            status_endpoint, params = self._build_status_request(merchant_order_id, include_details)
+            
+            self.logger.info(f"Checking payment status: {merchant_order_id}")
+            
+            pool = get_async_pool("phonepe")
+            response = await phonepe_gateway.call_async("status", lambda timeout: pool.get(
+                status_endpoint,
+                headers=headers,
+                params=params,
+                timeout=timeout
+            ))
+            
+            status_data = response.json() if response.status_code == 200 else None
+            return self._payment_status_result(merchant_order_id, response.status_code, status_data, response.text)
+                
+        except (CircuitOpenError, RateLimitExceeded) as e:
+            return self._gateway_unavailable(e)
+        except Exception as e:
+            self.logger.error(f"Status check error: {e}")
+            return {
+                "success": False,
+                "error": "Status check failed",
+                "details": str(e)
+            }
+    
+    async def initiate_refund(self, original_merchant_order_id: str, refund_amount: float, reason: str) -> Dict[str, Any]:
+        """Initiate refund using PhonePe API"""
+        try:
+            refund = self._build_refund(original_merchant_order_id, refund_amount, reason)
+            
+            access_token = await self.auth.get_access_token()
+            headers = self._auth_headers(access_token)
+            
+            self.logger.info(f"Initiating refund: {refund['merchant_refund_id']} for ₹{refund_amount}")
+            
+            pool = get_async_pool("phonepe")
+            response = await phonepe_gateway.call_async("refund", lambda timeout: pool.post(
+                self.refund_url,
+                json=refund["payload"],
+                headers=headers,
+                timeout=timeout
+            ))
+            
+            refund_data = response.json() if response.status_code == 200 else None
+            return self._refund_result(refund, response.status_code, refund_data, response.text)
+                
+        except (CircuitOpenError, RateLimitExceeded) as e:
+            return self._gateway_unavailable(e)
+        except Exception as e:
+            self.logger.error(f"Refund initiation error: {e}")
+            return {
+                "success": False,
+                "error": "Refund initiation failed",
+                "details": str(e)
+            }
+
+# Global payment service instances, created on first use
+phonepe_payment = LazyService(PhonePePaymentService)
+phonepe_payment_async = LazyService(AsyncPhonePePaymentService)
 
 # Test service on module load
 if __name__ == "__main__":
@@ -278,13 +443,11 @@ if __name__ == "__main__":
         info = phonepe_payment.get_service_info()
         print(f"Service info: {info}")
         
-        # Test payment creation (with small amount)
+        # Test payment creation (cheapest plan)
         print("\nTesting payment creation...")
         result = phonepe_payment.create_payment_order(
             user_id="test_user_123",
-            plan_id="pro_plan",
-            amount_rupees=1.00,  # ₹1 for testing
-            plan_name="Test Plan"
+            plan_id="trial_plan"
         )
         
         if result["success"]:
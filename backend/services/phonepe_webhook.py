@@ -1,14 +1,24 @@
 import os
 import json
+import asyncio
 import hashlib
 import hmac
 import logging
 from typing import Dict, Any, Optional
 from datetime import datetime
 from fastapi import Request, HTTPException
-from dotenv import load_dotenv
+from .lazy import LazyService
+from .webhook_dispatcher import ShardedDispatcher, webhook_order_key
+from .webhook_queue import WebhookQueue, WebhookQueueWorker
+from .webhook_dedup import WebhookDeduplicator, build_dedup_key
+from .order_state import order_state
+from .write_behind import write_behind
 
-load_dotenv()
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
 
 class PhonePeWebhookHandler:
     """Production PhonePe Webhook Handler for all selected events"""
@@ -53,47 +63,87 @@ class PhonePeWebhookHandler:
         
         if not all([self.webhook_username, self.webhook_password]):
             raise ValueError("Missing webhook authentication credentials")
+        
+        # 'inline' runs handlers in the request; 'queued' acks after a durable local write
+        self.mode = os.getenv('PHONEPE_WEBHOOK_MODE', 'inline').lower()
+        self.queue = WebhookQueue.from_env() if self.mode == 'queued' else None
+        self.queue_worker: Optional[WebhookQueueWorker] = None
+        
+        # Per-order lanes: same-order events apply in sequence, different orders in parallel
+        self.dispatcher = ShardedDispatcher(
+            self.dispatch_event,
+            lanes=int(os.getenv('WEBHOOK_DISPATCH_LANES', '8')),
+            lane_capacity=int(os.getenv('WEBHOOK_DISPATCH_LANE_CAPACITY', '1000'))
+        )
+        
+        # Bodies above this are rejected while streaming, before any parsing
+        self.max_body_bytes = int(os.getenv('WEBHOOK_MAX_BODY_BYTES', str(1024 * 1024)))
+        
+        # Redeliveries and checkout/pg event pairs are acknowledged without re-running handlers
+        self.deduplicator = WebhookDeduplicator.from_env()
     
     async def process_webhook(self, request: Request) -> Dict[str, Any]:
         """Process PhonePe webhook with enhanced security"""
         try:
-            # Get webhook data
-            authorization_header = request.headers.get('Authorization', '')
-            webhook_body = await request.body()
+            # Reject unauthenticated requests before reading the body
+            received_signature = self._parse_signature(request.headers.get('Authorization', ''))
+            if received_signature is None:
+                raise HTTPException(status_code=401, detail="Invalid webhook signature")
             
-            # Parse webhook data
-            try:
-                webhook_data = json.loads(webhook_body.decode('utf-8'))
-            except json.JSONDecodeError as e:
-                self.logger.error(f"Invalid JSON in webhook: {e}")
-                raise HTTPException(status_code=400, detail="Invalid JSON payload")
+            content_length = request.headers.get('Content-Length')
+            if content_length and content_length.isdigit() and int(content_length) > self.max_body_bytes:
+                raise HTTPException(status_code=413, detail="Webhook payload too large")
+            
+            # Stream the body into the digest, bounded by max_body_bytes
+            digest = hashlib.sha256()
+            body = bytearray()
+            async for chunk in request.stream():
+                if len(body) + len(chunk) > self.max_body_bytes:
+                    raise HTTPException(status_code=413, detail="Webhook payload too large")
+                digest.update(chunk)
+                body.extend(chunk)
+            webhook_body = bytes(body)
             
             # Verify webhook authenticity
-            if not self._verify_webhook_signature(authorization_header, webhook_body):
+            digest.update(self.webhook_password.encode('utf-8'))
+            if not self._signature_matches(received_signature, digest.hexdigest()):
                 self.logger.error("Webhook signature verification failed")
                 raise HTTPException(status_code=401, detail="Invalid webhook signature")
             
+            # Parse webhook data (only verified bytes reach the decoder)
+            try:
+                webhook_data = _json_loads(webhook_body)
+            except ValueError as e:
+                self.logger.error(f"Invalid JSON in webhook: {e}")
+                raise HTTPException(status_code=400, detail="Invalid JSON payload")
+            
+            if not isinstance(webhook_data, dict):
+                raise HTTPException(status_code=400, detail="Invalid JSON payload")
+            
             # Extract event information
             event_type = webhook_data.get('event')
-            payload = webhook_data.get('payload', {})
             timestamp = webhook_data.get('timestamp', int(datetime.now().timestamp()))
             
-            self.logger.info(f"Processing webhook event: {event_type}")
+            dedup_key = self._dedup_key(webhook_data, webhook_body)
+            if await self.deduplicator.check_and_record(dedup_key, webhook_data):
+                self.logger.info(f"Duplicate webhook ignored: {event_type} ({dedup_key})")
+                return {
+                    "status": "success",
+                    "message": "Duplicate webhook ignored",
+                    "event": event_type,
+                    "timestamp": timestamp
+                }
             
-            # Process event
-            if event_type in self.event_handlers:
-                await self.event_handlers[event_type](payload, webhook_data)
-                self.logger.info(f"Successfully processed webhook event: {event_type}")
-            else:
-                self.logger.warning(f"Unknown webhook event type: {event_type}")
-                # Still return success to avoid retries
+            try:
+                result = await self._accept_webhook(webhook_data, webhook_body, event_type, timestamp)
+            except Exception:
+                await self.deduplicator.forget(dedup_key)
+                raise
             
-            return {
-                "status": "success", 
-                "message": "Webhook processed",
-                "event": event_type,
-                "timestamp": timestamp
-            }
+            # Queued events are marked by the queue worker once applied
+            if self.queue is None:
+                self.deduplicator.mark_processed(dedup_key)
+            return result
             
         except HTTPException:
             raise
@@ -101,32 +151,130 @@ class PhonePeWebhookHandler:
             self.logger.error(f"Webhook processing error: {e}")
             raise HTTPException(status_code=500, detail="Webhook processing failed")
     
+    async def _accept_webhook(self, webhook_data: Dict[str, Any], webhook_body: bytes, event_type: str,
+                              timestamp: Any) -> Dict[str, Any]:
+        """Queue or apply a verified, first-seen webhook"""
+        # Fast-ack mode: persist the verified event and let queue workers apply it
+        if self.queue is not None:
+            await asyncio.to_thread(self.queue.enqueue, webhook_body, webhook_order_key(webhook_data))
+            if self.queue_worker is not None:
+                self.queue_worker.notify()
+            
+            self.logger.info(f"Webhook event queued: {event_type}")
+            return {
+                "status": "success",
+                "message": "Webhook accepted",
+                "event": event_type,
+                "timestamp": timestamp
+            }
+        
+        if self.dispatcher.running:
+            await self.dispatcher.dispatch(webhook_order_key(webhook_data), webhook_data)
+        else:
+            await self.dispatch_event(webhook_data)
+        
+        return {
+            "status": "success", 
+            "message": "Webhook processed",
+            "event": event_type,
+            "timestamp": timestamp
+        }
+    
+    def _dedup_key(self, webhook_data: Dict[str, Any], webhook_body: bytes) -> str:
+        """Dedup key with event aliases (checkout.*/pg.*) collapsed onto their shared handler"""
+        handler = self.event_handlers.get(webhook_data.get('event'))
+        event_class = handler.__name__ if handler else str(webhook_data.get('event'))
+        return build_dedup_key(event_class, webhook_data, webhook_body)
+    
+    async def dispatch_event(self, webhook_data: Dict[str, Any]) -> None:
+        """Run the handler chain for a verified webhook event"""
+        event_type = webhook_data.get('event')
+        payload = webhook_data.get('payload', {})
+        
+        self.logger.info(f"Processing webhook event: {event_type}")
+        
+        # Process event
+        if event_type in self.event_handlers:
+            await self.event_handlers[event_type](payload, webhook_data)
+            self.logger.info(f"Successfully processed webhook event: {event_type}")
+        else:
+            self.logger.warning(f"Unknown webhook event type: {event_type}")
+            # Still return success to avoid retries
+    
+    async def start_workers(self) -> None:
+        """Start dispatcher lanes and, in queued mode, the durable queue worker"""
+        await self.dispatcher.start()
+        
+        if self.queue is None or self.queue_worker is not None:
+            return
+        
+        self.queue_worker = WebhookQueueWorker(
+            self.queue,
+            self.dispatcher,
+            max_in_flight=int(os.getenv('WEBHOOK_QUEUE_MAX_IN_FLIGHT', '64')),
+            poll_interval=float(os.getenv('WEBHOOK_QUEUE_POLL_INTERVAL', '0.5')),
+            deduplicator=self.deduplicator,
+            dedup_key=self._dedup_key
+        )
+        await self.queue_worker.start()
+    
+    async def stop_workers(self) -> None:
+        """Stop workers; unfinished queued events stay queued for the next start"""
+        if self.queue_worker is not None:
+            await self.queue_worker.stop()
+            self.queue_worker = None
+        
+        await self.dispatcher.stop()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get dispatcher lane, queue and dedup statistics"""
+        return {
+            "mode": self.mode,
+            "dedup": self.deduplicator.get_stats(),
+            "dispatcher": self.dispatcher.get_stats(),
+            "queue": self.queue_worker.get_stats() if self.queue_worker else None
+        }
+    
     def _verify_webhook_signature(self, auth_header: str, webhook_body: bytes) -> bool:
         """Verify webhook signature using SHA256"""
         try:
-            # Extract signature from header
-            if not auth_header.startswith('SHA256'):
-                self.logger.warning("Authorization header does not start with SHA256")
+            received_signature = self._parse_signature(auth_header)
+            if received_signature is None:
                 return False
             
-            received_signature = auth_header.split(' ', 1)[1] if ' ' in auth_header else auth_header[6:]
-            
             # Calculate expected signature
             message = webhook_body + self.webhook_password.encode('utf-8')
             expected_signature = hashlib.sha256(message).hexdigest()
             
-            # Compare signatures
-            is_valid = hmac.compare_digest(received_signature.lower(), expected_signature.lower())
-            
-            if not is_valid:
-                self.logger.warning(f"Signature mismatch. Received: {received_signature[:10]}..., Expected: {expected_signature[:10]}...")
-            
-            return is_valid
+            return self._signature_matches(received_signature, expected_signature)
             
         except Exception as e:
             self.logger.error(f"Signature verification error: {e}")
             return False
     
+    def _parse_signature(self, auth_header: str) -> Optional[str]:
+        """Extract the hex signature from a 'SHA256 <signature>' header"""
+        if not auth_header.startswith('SHA256'):
+            self.logger.warning("Authorization header does not start with SHA256")
+            return None
+        
+        received_signature = auth_header.split(' ', 1)[1] if ' ' in auth_header else auth_header[6:]
+        
+        # A SHA256 hex digest is always 64 characters
+        if len(received_signature.strip()) != 64:
+            self.logger.warning("Authorization header carries a malformed signature")
+            return None
+        return received_signature.strip()
+    
+    def _signature_matches(self, received_signature: str, expected_signature: str) -> bool:
+        """Constant-time comparison of hex signatures"""
+        is_valid = hmac.compare_digest(received_signature.lower(), expected_signature.lower())
+        
+        if not is_valid:
+            self.logger.warning(f"Signature mismatch. Received: {received_signature[:10]}..., Expected: {expected_signature[:10]}...")
+        
+        return is_valid
+    
     # Payment Event Handlers
     async def handle_payment_success(self, payload: Dict, webhook_data: Dict):
         """Handle successful payment events"""
@@ -137,6 +285,9 @@ class PhonePeWebhookHandler:
         
         self.logger.info(f"Payment successful: {merchant_order_id}, Amount: {amount}, Method: {payment_method}")
         
+        # Lets verify-payment answer locally instead of asking PhonePe again
+        order_state.record(merchant_order_id, payment_state, payload)
+        
         if payment_state == 'COMPLETED':
             # Activate subscription
             await self._activate_subscription(merchant_order_id, payload)
@@ -152,6 +303,8 @@ class PhonePeWebhookHandler:
         
         self.logger.warning(f"Payment failed: {merchant_order_id}, Error: {error_code} - {error_message}")
         
+        order_state.record(merchant_order_id, payload.get('state') or 'FAILED', payload)
+        
         # Update payment status
         await self._update_payment_failure(merchant_order_id, payload)
         
@@ -299,9 +452,7 @@ class PhonePeWebhookHandler:
     
     async def _log_payment_event(self, merchant_order_id: str, status: str, payload: Dict):
         """Log payment event for audit trail"""
-        # TODO: Implement database operations
-        self.logger.info(f"TODO: Log payment event: {merchant_order_id} - {status}")
-        pass
+        self._audit('payment', merchant_order_id, status, payload)
     
     async def _complete_refund(self, merchant_refund_id: str, payload: Dict):
         """Complete refund processing"""
@@ -329,9 +480,7 @@ class PhonePeWebhookHandler:
     
     async def _log_settlement_event(self, settlement_id: str, status: str, payload: Dict):
         """Log settlement event"""
-        # TODO: Implement database operations
-        self.logger.info(f"TODO: Log settlement event: {settlement_id} - {status}")
-        pass
+        self._audit('settlement', settlement_id, status, payload)
     
     async def _update_subscription_status(self, subscription_id: str, status: str, payload: Dict):
         """Update subscription status"""
@@ -341,9 +490,17 @@ class PhonePeWebhookHandler:
     
     async def _log_dispute_event(self, dispute_id: str, status: str, payload: Dict):
         """Log dispute event"""
-        # TODO: Implement database operations
-        self.logger.info(f"TODO: Log dispute event: {dispute_id} - {status}")
-        pass
+        self._audit('dispute', dispute_id, status, payload)
+    
+    def _audit(self, entity_type: str, entity_id: str, status: str, payload: Dict):
+        """Buffer an audit row; it is written with the next bulk flush, not per event"""
+        write_behind.insert('audit_events', {
+            "entity_type": entity_type,
+            "entity_id": entity_id,
+            "status": status,
+            "merchant_order_id": payload.get('merchantOrderId') or payload.get('originalMerchantOrderId'),
+            "payload": payload
+        })
     
     async def _notify_dispute_created(self, dispute_id: str, payload: Dict):
         """Notify admin team about dispute"""
@@ -351,8 +508,8 @@ class PhonePeWebhookHandler:
         self.logger.info(f"TODO: Notify dispute created: {dispute_id}")
         pass
 
-# Global webhook handler instance
-webhook_handler = PhonePeWebhookHandler()
+# Global webhook handler instance, created on first use
+webhook_handler = LazyService(PhonePeWebhookHandler)
 
 # Test webhook handler
 if __name__ == "__main__":
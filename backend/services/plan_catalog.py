@@ -0,0 +1,181 @@
+import os
+import time
+import logging
+import threading
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Any, Dict, List, Optional, Tuple
+
+# Plans offered at checkout (src/pages/Checkout.tsx); subscription_plans rows override these prices
+DEFAULT_PLANS = [
+    {"plan_id": "trial_plan", "name": "Trial", "price_monthly": "59.00", "price_yearly": None, "hits_limit": 7},
+    {"plan_id": "pro_plan", "name": "Pro", "price_monthly": "399.00", "price_yearly": "3999.00", "hits_limit": 1000},
+    {"plan_id": "unlimited_plan", "name": "Unlimited", "price_monthly": "1599.00", "price_yearly": "15999.00", "hits_limit": -1},
+]
+
+BILLING_CYCLES = {"monthly": "price_monthly", "yearly": "price_yearly"}
+
+
+def to_paisa(rupees: Any) -> int:
+    """Exact rupees -> integer paisa, rounding half up at the paisa"""
+    return int((Decimal(str(rupees)) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def gst_paisa(base_paisa: int, gst_rate: Decimal) -> int:
+    """GST on a paisa amount, rounded half up to a whole paisa"""
+    return int((Decimal(base_paisa) * gst_rate).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def plan_id_for(name: str) -> str:
+    return f"{name.strip().lower()}_plan"
+
+
+class PlanPrice:
+    """Exact price of one plan and billing cycle, held in integer paisa"""
+
+    __slots__ = ("plan_id", "plan_name", "billing_cycle", "hits_limit", "base_paisa", "gst_paisa", "total_paisa")
+
+    def __init__(self, plan_id: str, plan_name: str, billing_cycle: str, hits_limit: int, base_paisa: int, gst: int):
+        self.plan_id = plan_id
+        self.plan_name = plan_name
+        self.billing_cycle = billing_cycle
+        self.hits_limit = hits_limit
+        self.base_paisa = base_paisa
+        self.gst_paisa = gst
+        self.total_paisa = base_paisa + gst
+
+    @property
+    def base_amount(self) -> Decimal:
+        return Decimal(self.base_paisa).scaleb(-2)
+
+    @property
+    def gst_amount(self) -> Decimal:
+        return Decimal(self.gst_paisa).scaleb(-2)
+
+    @property
+    def total_amount(self) -> Decimal:
+        return Decimal(self.total_paisa).scaleb(-2)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "plan_id": self.plan_id,
+            "plan_name": self.plan_name,
+            "billing_cycle": self.billing_cycle,
+            "hits_limit": self.hits_limit,
+            "base_amount": str(self.base_amount),
+            "gst_amount": str(self.gst_amount),
+            "total_amount": str(self.total_amount),
+            "amount_paisa": self.total_paisa
+        }
+
+
+class PlanCatalog:
+    """In-process plan prices keyed by (plan_id, billing_cycle)
+
+    Prices start from DEFAULT_PLANS, so pricing never needs a database call.
+    With a source attached (anything with get_subscription_plans), the catalog
+    reloads subscription_plans in a background thread once ttl_seconds have
+    passed, serving the previous prices meanwhile; refresh() reloads on demand.
+    """
+
+    def __init__(self, source=None, ttl_seconds: float = 3600, gst_rate: Decimal = Decimal('0.18')):
+        self.source = source
+        self.ttl_seconds = ttl_seconds
+        self.gst_rate = gst_rate
+        self.logger = logging.getLogger(__name__)
+
+        self._prices: Dict[Tuple[str, str], PlanPrice] = self._build(DEFAULT_PLANS)
+        self._loaded_at: Optional[float] = None
+        self._refresh_lock = threading.Lock()
+
+        self.refreshes = 0
+        self.refresh_failures = 0
+
+    @classmethod
+    def from_env(cls, source=None) -> "PlanCatalog":
+        """Create a catalog from PLAN_CATALOG_TTL_SECONDS and GST_RATE"""
+        return cls(
+            source,
+            ttl_seconds=float(os.getenv('PLAN_CATALOG_TTL_SECONDS', '3600')),
+            gst_rate=Decimal(os.getenv('GST_RATE', '0.18'))
+        )
+
+    def _build(self, plans: List[Dict[str, Any]]) -> Dict[Tuple[str, str], PlanPrice]:
+        prices = {}
+        for plan in plans:
+            for billing_cycle, column in BILLING_CYCLES.items():
+                if plan.get(column) is None:
+                    continue
+                base = to_paisa(plan[column])
+                if base <= 0:
+                    continue
+                plan_id = plan.get("plan_id") or plan_id_for(plan["name"])
+                prices[(plan_id, billing_cycle)] = PlanPrice(
+                    plan_id, plan["name"], billing_cycle, plan.get("hits_limit", -1), base,
+                    gst_paisa(base, self.gst_rate)
+                )
+        return prices
+
+    def get_price(self, plan_id: str, billing_cycle: str = 'monthly') -> Optional[PlanPrice]:
+        """Price for a plan and billing cycle, or None if it is not sold"""
+        self._refresh_if_stale()
+        return self._prices.get((plan_id, billing_cycle))
+
+    def get_plans(self) -> List[Dict[str, Any]]:
+        self._refresh_if_stale()
+        return [price.to_dict() for price in self._prices.values()]
+
+    def refresh(self) -> bool:
+        """Reload prices from subscription_plans now; keeps the current prices on failure"""
+        if self.source is None:
+            return False
+
+        try:
+            rows = self.source.get_subscription_plans(refresh=True)
+        except Exception as e:
+            self.logger.error(f"Plan catalog refresh error: {e}")
+            rows = None
+
+        if not rows:
+            self.refresh_failures += 1
+            self._loaded_at = time.monotonic()  # back off for a full TTL before retrying
+            return False
+
+        plans = {plan["name"]: dict(plan) for plan in DEFAULT_PLANS}
+        for row in rows:
+            plan = plans.setdefault(row["name"], {"name": row["name"]})
+            plan.update({column: row.get(column) for column in ("price_monthly", "price_yearly", "hits_limit")})
+
+        self._prices = self._build(list(plans.values()))
+        self._loaded_at = time.monotonic()
+        self.refreshes += 1
+        self.logger.info(f"Plan catalog loaded {len(self._prices)} prices")
+        return True
+
+    def _refresh_if_stale(self) -> None:
+        if self.source is None:
+            return
+        if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl_seconds:
+            return
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                self.refresh()
+            finally:
+                self._refresh_lock.release()
+
+        threading.Thread(target=run, name="plan-catalog-refresh", daemon=True).start()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "prices": len(self._prices),
+            "source": "database" if self.refreshes else "defaults",
+            "age_seconds": round(time.monotonic() - self._loaded_at, 1) if self._loaded_at is not None else None,
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures
+        }
+
+
+# Global plan catalog instance (subscription_plans source attached at startup)
+plan_catalog = PlanCatalog.from_env()
@@ -0,0 +1,339 @@
+import os
+import zlib
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from .cache import TTLCache
+from .quota_engine import QuotaEngine, quota_engine
+
+
+class _QuotaEntry:
+    """One user's limits as last seen in Postgres plus the hits admitted locally since"""
+
+    __slots__ = ("remaining", "budget", "used", "plan_name", "daily_limit", "monthly_limit", "expires_at")
+
+    def __init__(self, state: Dict[str, Any], used: int, workers: int, max_budget: int):
+        self.used = used
+        self.sync(state, workers, max_budget)
+
+    def sync(self, state: Dict[str, Any], workers: int, max_budget: int) -> None:
+        """Adopt fresh database state and size this worker's share of what is left"""
+        self.remaining = state["hits_remaining"]
+        self.plan_name = state.get("plan_name") or 'Free'
+        self.daily_limit = state.get("daily_limit")
+        self.monthly_limit = state.get("monthly_limit")
+
+        # Each worker may admit at most its share of the remaining hits before re-syncing,
+        # so W workers starting from the same state can never admit more than remaining.
+        # A share below one hit means admissions go straight to the database instead.
+        if self.remaining == -1:
+            self.budget = -1
+        else:
+            self.budget = min(max_budget, max(0, self.remaining // workers))
+
+        resets = [_seconds_until(state.get("daily_reset_at")), _seconds_until(state.get("monthly_reset_at"))]
+        self.expires_at = min([seconds for seconds in resets if seconds is not None], default=None)
+
+    def try_take(self, hits: int) -> bool:
+        if self.budget != -1 and self.used + hits > self.budget:
+            return False
+        self.used += hits
+        return True
+
+    def needs_database(self, hits: int) -> bool:
+        """True when this worker's share is too small to decide locally but hits may still fit"""
+        return self.budget != -1 and self.budget < hits and not self.exhausted(hits)
+
+    def exhausted(self, hits: int) -> bool:
+        """True when the database itself had no room left, so renewing cannot help"""
+        return self.remaining != -1 and self.remaining - self.used < hits
+
+    def hits_remaining(self) -> int:
+        return -1 if self.remaining == -1 else max(0, self.remaining - self.used)
+
+
+def _seconds_until(value: Any) -> Optional[float]:
+    if value is None:
+        return None
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    return max(0.0, (value - datetime.now(timezone.utc)).total_seconds())
+
+
+class _Shard:
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.entries = TTLCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self.pending: Dict[str, int] = {}
+        self.loading: Dict[str, asyncio.Future] = {}
+
+
+class QuotaCache:
+    """In-process quota counters, sharded by user id, reconciled to Postgres in batches
+
+    Admission is decided locally against a per-worker budget of
+    remaining_hits / workers (capped at max_budget); once that share drops below
+    one hit, requests are decided by consume_quota in Postgres. Admitted hits accumulate per
+    user and are written with one apply_quota_usage call per flush, which also
+    returns fresh state for the flushed users. A user whose local budget is spent
+    triggers a flush and a reload; a user the database reports as exhausted is
+    denied from memory until the entry expires or a reset time passes.
+
+    Over-admission across workers is bounded by the shares other workers hold
+    but have not flushed yet: at most (workers - 1) x share, shrinking to zero as
+    the user approaches the limit. With workers=1 admission is exact.
+    """
+
+    def __init__(self, engine: QuotaEngine, shards: int = 16, max_entries: int = 100000, ttl_seconds: float = 30,
+                 workers: int = 1, max_budget: int = 100, flush_interval: float = 1.0, flush_batch: int = 1000):
+        self.engine = engine
+        self.ttl_seconds = ttl_seconds
+        self.workers = max(1, workers)
+        self.max_budget = max(1, max_budget)
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self.logger = logging.getLogger(__name__)
+
+        per_shard = max(1, max_entries // max(1, shards))
+        self._shards: List[_Shard] = [_Shard(per_shard, ttl_seconds) for _ in range(max(1, shards))]
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._pending_total = 0
+
+        self.admitted = 0
+        self.denied = 0
+        self.loads = 0
+        self.renewals = 0
+        self.direct = 0
+        self.flushes = 0
+        self.flush_failures = 0
+        self.flushed_hits = 0
+
+    @classmethod
+    def from_env(cls, engine: QuotaEngine) -> "QuotaCache":
+        """Create a cache from QUOTA_CACHE_* environment variables"""
+        return cls(
+            engine,
+            shards=int(os.getenv('QUOTA_CACHE_SHARDS', '16')),
+            max_entries=int(os.getenv('QUOTA_CACHE_MAX_ENTRIES', '100000')),
+            ttl_seconds=float(os.getenv('QUOTA_CACHE_TTL_SECONDS', '30')),
+            workers=int(os.getenv('QUOTA_CACHE_WORKERS', os.getenv('WEB_CONCURRENCY', '1'))),
+            max_budget=int(os.getenv('QUOTA_CACHE_MAX_BUDGET', '100')),
+            flush_interval=float(os.getenv('QUOTA_CACHE_FLUSH_INTERVAL', '1.0')),
+            flush_batch=int(os.getenv('QUOTA_CACHE_FLUSH_BATCH', '1000')),
+        )
+
+    def _shard(self, user_id: str) -> _Shard:
+        return self._shards[zlib.crc32(user_id.encode('utf-8')) % len(self._shards)]
+
+    async def admit(self, user_id: str, hits: int = 1) -> Dict[str, Any]:
+        """Admit or deny a request against the user's quota, usually without a round trip"""
+        shard = self._shard(user_id)
+        entry = shard.entries.get(user_id)
+        if entry is None:
+            entry = await self._load(shard, user_id)
+
+        if entry is not None and entry.needs_database(hits):
+            return await self._admit_in_database(shard, user_id, hits)
+
+        allowed = entry is not None and entry.try_take(hits)
+        if entry is not None and not allowed and not entry.exhausted(hits):
+            # Local share spent but the database still has room: reconcile and take a new share
+            self.renewals += 1
+            await self.flush()
+            entry = await self._load(shard, user_id)
+            if entry is not None and entry.needs_database(hits):
+                return await self._admit_in_database(shard, user_id, hits)
+            allowed = entry is not None and entry.try_take(hits)
+
+        if entry is None:
+            return {"success": False, "allowed": False, "error": "Quota unavailable"}
+
+        if not hits:
+            # Status check only: nothing to admit or write
+            pass
+        elif allowed:
+            shard.pending[user_id] = shard.pending.get(user_id, 0) + hits
+            self._pending_total += hits
+            self.admitted += 1
+            if self._pending_total >= self.flush_batch and self._wakeup is not None:
+                self._wakeup.set()
+        else:
+            self.denied += 1
+
+        return {
+            "success": True,
+            "allowed": allowed,
+            "hits_remaining": entry.hits_remaining(),
+            "daily_limit": entry.daily_limit,
+            "monthly_limit": entry.monthly_limit,
+            "plan_name": entry.plan_name
+        }
+
+    async def _admit_in_database(self, shard: _Shard, user_id: str, hits: int) -> Dict[str, Any]:
+        """Near the limit: consume atomically with consume_quota rather than from a local share"""
+        self.direct += 1
+        await self.flush()
+        state = await self.engine.consume(user_id, hits)
+        if not state.get("success"):
+            return {"success": False, "allowed": False, "error": "Quota unavailable"}
+
+        entry = _QuotaEntry(state, shard.pending.get(user_id, 0), self.workers, self.max_budget)
+        self._store(shard, user_id, entry)
+        if state["allowed"]:
+            self.admitted += 1
+        else:
+            self.denied += 1
+
+        return {
+            "success": True,
+            "allowed": state["allowed"],
+            "hits_remaining": entry.hits_remaining(),
+            "daily_limit": entry.daily_limit,
+            "monthly_limit": entry.monthly_limit,
+            "plan_name": entry.plan_name
+        }
+
+    async def _load(self, shard: _Shard, user_id: str) -> Optional[_QuotaEntry]:
+        """Fetch a user's lazily-reset state, one database call per user at a time"""
+        future = shard.loading.get(user_id)
+        if future is not None:
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+            # The loading task was cancelled, not this admit: load again
+            return await self._load(shard, user_id)
+
+        future = asyncio.get_running_loop().create_future()
+        shard.loading[user_id] = future
+        try:
+            self.loads += 1
+            state = await self.engine.consume(user_id, 0)
+            entry = None
+            if state.get("success"):
+                entry = _QuotaEntry(state, shard.pending.get(user_id, 0), self.workers, self.max_budget)
+                self._store(shard, user_id, entry)
+            future.set_result(entry)
+            return entry
+        except Exception as e:
+            self.logger.error(f"Quota cache load failed for {user_id}: {e}")
+            future.set_result(None)
+            return None
+        finally:
+            # Cancelled mid-load: wake the waiters so one of them loads again
+            if not future.done():
+                future.cancel()
+            shard.loading.pop(user_id, None)
+
+    def _store(self, shard: _Shard, user_id: str, entry: _QuotaEntry) -> None:
+        ttl = self.ttl_seconds if entry.expires_at is None else min(self.ttl_seconds, entry.expires_at)
+        shard.entries.set(user_id, entry, ttl_seconds=ttl)
+
+    def invalidate(self, user_id: str) -> None:
+        """Drop a cached entry, e.g. after a plan change; pending hits are kept"""
+        self._shard(user_id).entries.pop(user_id)
+
+    def pending_hits(self) -> int:
+        return self._pending_total
+
+    async def flush(self) -> int:
+        """Write all admitted-but-unsynced hits in one call; returns hits written"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+
+        async with self._flush_lock:
+            usage: Dict[str, int] = {}
+            for shard in self._shards:
+                taken, shard.pending = shard.pending, {}
+                usage.update(taken)
+            self._pending_total = 0
+            if not usage:
+                return 0
+
+            try:
+                rows = await self.engine.apply_usage(usage)
+            except Exception as e:
+                self.logger.error(f"Quota cache flush error: {e}")
+                rows = None
+
+            if rows is None:
+                # Keep the hits for the next attempt
+                self.flush_failures += 1
+                for user_id, hits in usage.items():
+                    shard = self._shard(user_id)
+                    shard.pending[user_id] = shard.pending.get(user_id, 0) + hits
+                    self._pending_total += hits
+                return 0
+
+            for row in rows:
+                user_id = str(row["user_id"])
+                shard = self._shard(user_id)
+                entry = shard.entries.get(user_id)
+                if entry is not None:
+                    entry.used = max(0, entry.used - usage.get(user_id, 0))
+                    entry.sync(row, self.workers, self.max_budget)
+                    self._store(shard, user_id, entry)
+
+            written = sum(usage.values())
+            self.flushes += 1
+            self.flushed_hits += written
+            return written
+
+    async def start(self) -> None:
+        """Start the periodic flush task"""
+        if self._task is not None:
+            return
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.ensure_future(self._run())
+        self.logger.info(f"Quota cache started ({len(self._shards)} shards, budget 1/{self.workers} of remaining)")
+
+    async def stop(self) -> None:
+        """Stop the flush task and write out every pending hit"""
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            self._wakeup = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._stopping:
+                break
+            try:
+                await self.flush()
+            except Exception as e:
+                self.logger.error(f"Quota cache flush error: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        decisions = self.admitted + self.denied
+        return {
+            "shards": len(self._shards),
+            "entries": sum(len(shard.entries) for shard in self._shards),
+            "pending_hits": self.pending_hits(),
+            "admitted": self.admitted,
+            "denied": self.denied,
+            "loads": self.loads,
+            "renewals": self.renewals,
+            "database_decisions": self.direct,
+            "local_decision_rate": round(1 - (self.loads + self.direct) / decisions, 4) if decisions else 0.0,
+            "flushes": self.flushes,
+            "flush_failures": self.flush_failures,
+            "flushed_hits": self.flushed_hits
+        }
+
+
+# Global quota cache instance
+quota_cache = QuotaCache.from_env(quota_engine)
@@ -0,0 +1,45 @@
+import logging
+from typing import Any, Dict, List, Optional
+
+
+class QuotaEngine:
+    """Quota checks backed by the single-row consume_quota SQL function
+
+    Daily and monthly resets are applied lazily to the user's own row inside
+    the same UPDATE ... RETURNING, so a check costs one indexed row write no
+    matter how large user_quotas grows.
+    """
+
+    def __init__(self, database=None):
+        # Set at startup to the database service (asyncpg pool when open, Supabase RPC otherwise)
+        self.database = database
+        self.logger = logging.getLogger(__name__)
+
+    async def consume(self, user_id: str, hits: int = 1) -> Dict[str, Any]:
+        """Atomically consume hits from a user's quota if they fit"""
+        try:
+            if self.database is None:
+                return {"success": False, "allowed": False, "error": "Quota database not configured"}
+
+            row = await self.database.consume_quota(user_id, hits)
+            if not row:
+                return {"success": False, "allowed": False, "error": "Quota check failed"}
+
+            return {"success": True, **row}
+
+        except Exception as e:
+            self.logger.error(f"Error consuming quota for {user_id}: {e}")
+            return {"success": False, "allowed": False, "error": str(e)}
+
+    async def apply_usage(self, usage: Dict[str, int]) -> Optional[List[Dict[str, Any]]]:
+        """Add already-admitted hits for many users in one call; returns their refreshed rows"""
+        if not usage:
+            return []
+
+        if self.database is None:
+            return None
+        return await self.database.apply_quota_usage(usage)
+
+
+# Global quota engine instance
+quota_engine = QuotaEngine()
@@ -0,0 +1,333 @@
+import os
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+import contextvars
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# Priority lanes: lower numbers win. Checkout, auth and refunds are HIGH, user status
+# polling NORMAL, background reconciliation LOW.
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+_lane: contextvars.ContextVar = contextvars.ContextVar('phonepe_priority_lane', default=None)
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a call would wait longer than the limiter's max_wait"""
+
+    def __init__(self, endpoint_class: str, retry_after: float):
+        self.endpoint_class = endpoint_class
+        self.retry_after = max(1, int(retry_after + 0.999))
+        super().__init__(f"{endpoint_class} rate limit reached, retry after {self.retry_after}s")
+
+
+class TokenBucket:
+    """Token bucket refilled at `rate` per second up to `burst` (not thread-safe; callers hold a lock)"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self._updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, reserve: float = 0.0) -> float:
+        """Seconds until a token can be taken while leaving `reserve` tokens behind"""
+        missing = 1 + reserve - self.tokens
+        if missing <= 0 or self.rate <= 0:
+            return 0.0
+        return missing / self.rate
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "wake", "granted", "abandoned")
+
+    def __init__(self, priority: int, seq: int, wake: Callable[[], None]):
+        self.priority = priority
+        self.seq = seq
+        self.wake = wake
+        self.granted = False
+        self.abandoned = False
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class ConcurrencyLimit:
+    """Max-in-flight limit usable from threads and event loops alike
+
+    Waiters queue by (priority, arrival); a released slot is handed straight to
+    the first waiter, so a low-priority caller can never barge ahead of a
+    queued high-priority one.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._waiters: List[_Waiter] = []
+        self._seq = itertools.count()
+
+    def _try_acquire(self) -> bool:
+        while self._waiters and self._waiters[0].abandoned:
+            heapq.heappop(self._waiters)
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            return True
+        return False
+
+    def _enqueue(self, priority: int, wake: Callable[[], None]) -> _Waiter:
+        waiter = _Waiter(priority, next(self._seq), wake)
+        heapq.heappush(self._waiters, waiter)
+        return waiter
+
+    def _abandon(self, waiter: _Waiter) -> None:
+        """Give up waiting; returns a slot that was granted in the meantime"""
+        with self._lock:
+            waiter.abandoned = True
+            granted = waiter.granted
+        if granted:
+            self.release()
+
+    def acquire(self, priority: int, timeout: Optional[float] = None) -> bool:
+        with self._lock:
+            if self._try_acquire():
+                return True
+            event = threading.Event()
+            waiter = self._enqueue(priority, event.set)
+        if event.wait(timeout):
+            return True
+        self._abandon(waiter)
+        return False
+
+    async def acquire_async(self, priority: int, timeout: Optional[float] = None) -> bool:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._try_acquire():
+                return True
+            future = loop.create_future()
+
+            def deliver() -> None:
+                if not future.done():
+                    future.set_result(None)
+
+            waiter = self._enqueue(priority, lambda: loop.call_soon_threadsafe(deliver))
+        try:
+            done, _ = await asyncio.wait({future}, timeout=timeout)
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+        if done:
+            return True
+        self._abandon(waiter)
+        return False
+
+    def release(self) -> None:
+        with self._lock:
+            while self._waiters:
+                waiter = heapq.heappop(self._waiters)
+                if waiter.abandoned:
+                    continue
+                waiter.granted = True
+                waiter.wake()
+                return
+            self.in_flight -= 1
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for waiter in self._waiters if not waiter.abandoned)
+
+
+class EndpointClass:
+    """Rate and concurrency limits for one class of PhonePe endpoints"""
+
+    def __init__(self, name: str, rate_per_second: float, burst: float, max_in_flight: int, priority: int):
+        self.name = name
+        self.priority = priority
+        self.bucket = TokenBucket(rate_per_second, burst)
+        self.concurrency = ConcurrencyLimit(max_in_flight)
+
+        self.admitted = 0
+        self.throttled = 0
+        self.rejected = 0
+        self.wait_time_total = 0.0
+
+
+class RateLimiter:
+    """Outbound token-bucket rate limits and in-flight caps per endpoint class
+
+    Each class (auth, checkout, status, refund) has its own bucket and
+    in-flight cap, and every call also takes a token from a shared bucket for
+    the merchant's overall quota. Lower-priority lanes must leave part of the
+    shared bucket behind (reserve_fraction per lane below HIGH), so checkout
+    creation keeps headroom while status polling or reconciliation is busy.
+    Calls that would wait longer than max_wait raise RateLimitExceeded.
+
+    Use slot()/slot_async() around each request; lane() sets the priority for
+    everything called inside it (threads and asyncio tasks alike).
+    """
+
+    def __init__(self, classes: Dict[str, Tuple[float, float, int, int]], total_rate: float, total_burst: float,
+                 reserve_fraction: float = 0.25, max_wait: float = 10.0):
+        self.classes = {
+            name: EndpointClass(name, rate, burst, max_in_flight, priority)
+            for name, (rate, burst, max_in_flight, priority) in classes.items()
+        }
+        self.total = TokenBucket(total_rate, total_burst)
+        self.reserve_fraction = reserve_fraction
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, prefix: str, defaults: Dict[str, Tuple[float, float, int, int]]) -> "RateLimiter":
+        """Create a limiter from <PREFIX>_RATE_* settings; defaults map class -> (rate, burst, max_in_flight, priority)"""
+        classes = {}
+        for name, (rate, burst, max_in_flight, priority) in defaults.items():
+            key = f"{prefix}_RATE_{name.upper()}"
+            classes[name] = (
+                float(os.getenv(f'{key}_PER_SECOND', str(rate))),
+                float(os.getenv(f'{key}_BURST', str(burst))),
+                int(os.getenv(f'{key}_MAX_IN_FLIGHT', str(max_in_flight))),
+                priority
+            )
+        return cls(
+            classes,
+            total_rate=float(os.getenv(f'{prefix}_RATE_TOTAL_PER_SECOND', '50')),
+            total_burst=float(os.getenv(f'{prefix}_RATE_TOTAL_BURST', '100')),
+            reserve_fraction=float(os.getenv(f'{prefix}_RATE_LANE_RESERVE', '0.25')),
+            max_wait=float(os.getenv(f'{prefix}_RATE_MAX_WAIT_SECONDS', '10'))
+        )
+
+    @contextmanager
+    def lane(self, priority: int) -> Iterator[None]:
+        """Run calls made inside the block at the given priority"""
+        token = _lane.set(priority)
+        try:
+            yield
+        finally:
+            _lane.reset(token)
+
+    def _priority(self, endpoint: EndpointClass, priority: Optional[int]) -> int:
+        if priority is not None:
+            return priority
+        lane = _lane.get()
+        return lane if lane is not None else endpoint.priority
+
+    def _take_token(self, endpoint: EndpointClass, priority: int) -> float:
+        """Take a token from the class and shared buckets, or return how long to wait"""
+        reserve = min(self.total.burst - 1, self.total.burst * self.reserve_fraction * priority)
+        with self._lock:
+            now = time.monotonic()
+            endpoint.bucket.refill(now)
+            self.total.refill(now)
+            wait = max(endpoint.bucket.wait_time(), self.total.wait_time(reserve))
+            if wait <= 0:
+                endpoint.bucket.tokens -= 1
+                self.total.tokens -= 1
+            return wait
+
+    def _return_token(self, endpoint: EndpointClass) -> None:
+        """Give back a token taken for a request that was never sent"""
+        with self._lock:
+            endpoint.bucket.tokens = min(endpoint.bucket.burst, endpoint.bucket.tokens + 1)
+            self.total.tokens = min(self.total.burst, self.total.tokens + 1)
+
+    def _check_deadline(self, endpoint: EndpointClass, wait: float, deadline: float) -> None:
+        if time.monotonic() + wait > deadline:
+            endpoint.rejected += 1
+            raise RateLimitExceeded(endpoint.name, wait)
+
+    @contextmanager
+    def slot(self, endpoint_class: str, priority: Optional[int] = None) -> Iterator[None]:
+        """Blocking admission for one request of an endpoint class"""
+        endpoint = self.classes[endpoint_class]
+        priority = self._priority(endpoint, priority)
+        started = time.monotonic()
+        deadline = started + self.max_wait
+
+        wait = self._take_token(endpoint, priority)
+        if wait > 0:
+            endpoint.throttled += 1
+        while wait > 0:
+            self._check_deadline(endpoint, wait, deadline)
+            time.sleep(wait)
+            wait = self._take_token(endpoint, priority)
+
+        if not endpoint.concurrency.acquire(priority, timeout=max(0.0, deadline - time.monotonic())):
+            self._return_token(endpoint)
+            endpoint.rejected += 1
+            raise RateLimitExceeded(endpoint.name, 1)
+        endpoint.admitted += 1
+        endpoint.wait_time_total += time.monotonic() - started
+        try:
+            yield
+        finally:
+            endpoint.concurrency.release()
+
+    @asynccontextmanager
+    async def slot_async(self, endpoint_class: str, priority: Optional[int] = None):
+        """Non-blocking admission for one request of an endpoint class"""
+        endpoint = self.classes[endpoint_class]
+        priority = self._priority(endpoint, priority)
+        started = time.monotonic()
+        deadline = started + self.max_wait
+
+        wait = self._take_token(endpoint, priority)
+        if wait > 0:
+            endpoint.throttled += 1
+        while wait > 0:
+            self._check_deadline(endpoint, wait, deadline)
+            await asyncio.sleep(wait)
+            wait = self._take_token(endpoint, priority)
+
+        if not await endpoint.concurrency.acquire_async(priority, timeout=max(0.0, deadline - time.monotonic())):
+            self._return_token(endpoint)
+            endpoint.rejected += 1
+            raise RateLimitExceeded(endpoint.name, 1)
+        endpoint.admitted += 1
+        endpoint.wait_time_total += time.monotonic() - started
+        try:
+            yield
+        finally:
+            endpoint.concurrency.release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self.total.refill(time.monotonic())
+            total_tokens = round(self.total.tokens, 2)
+        return {
+            "total_tokens": total_tokens,
+            "classes": {
+                name: {
+                    "rate_per_second": endpoint.bucket.rate,
+                    "max_in_flight": endpoint.concurrency.limit,
+                    "in_flight": endpoint.concurrency.in_flight,
+                    "queued": endpoint.concurrency.queued,
+                    "admitted": endpoint.admitted,
+                    "throttled": endpoint.throttled,
+                    "rejected": endpoint.rejected,
+                    "avg_wait_ms": round(endpoint.wait_time_total / endpoint.admitted * 1000, 3) if endpoint.admitted else 0.0
+                }
+                for name, endpoint in self.classes.items()
+            }
+        }
+
+
+# PhonePe endpoint classes: (requests/second, burst, max in flight, default priority)
+PHONEPE_ENDPOINT_CLASSES = {
+    "auth": (2.0, 5.0, 2, PRIORITY_HIGH),
+    "checkout": (20.0, 40.0, 50, PRIORITY_HIGH),
+    "status": (20.0, 40.0, 50, PRIORITY_NORMAL),
+    "refund": (5.0, 10.0, 10, PRIORITY_HIGH),
+}
+
+# Global PhonePe limiter (per process; serverless instances each get their own)
+phonepe_limiter = RateLimiter.from_env('PHONEPE', PHONEPE_ENDPOINT_CLASSES)
@@ -0,0 +1,238 @@
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .order_state import order_state
+from .payment_status_cache import TERMINAL_STATES, payment_status_cache
+from .rate_limiter import PRIORITY_LOW, phonepe_limiter
+from .supabase_client import supabase_service
+
+# PhonePe orders expire after expireAfter (1800s in create_payment_order); allow a grace period on top
+DEFAULT_MIN_AGE_SECONDS = 1800 + 300
+
+
+class _RateLimiter:
+    """Spaces calls at least 1/rate_per_second apart across all workers"""
+
+    def __init__(self, rate_per_second: float):
+        self.interval = 1.0 / rate_per_second if rate_per_second > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class PaymentReconciler:
+    """Settles payment_transactions rows left pending when a webhook never arrived
+
+    Pending rows older than min_age_seconds are streamed in keyset pages on
+    (created_at, id), checked against the PhonePe status API by a bounded set of
+    workers sharing one rate limit, and COMPLETED/FAILED results are written back
+    through update_payment_status in batches. Completed orders are then activated.
+    In dry-run mode statuses are checked and counted but nothing is written: lookups
+    go through dry_run_fetch_status, which must not persist what it sees.
+    """
+
+    def __init__(self, database, fetch_status: Callable[..., Awaitable[Dict[str, Any]]],
+                 concurrency: int = 8, rate_per_second: float = 5, page_size: int = 200,
+                 batch_size: int = 50, min_age_seconds: float = DEFAULT_MIN_AGE_SECONDS,
+                 interval_seconds: float = 300, dry_run: bool = False,
+                 dry_run_fetch_status: Optional[Callable[..., Awaitable[Dict[str, Any]]]] = None):
+        self.database = database
+        self.fetch_status = fetch_status
+        self.dry_run_fetch_status = dry_run_fetch_status or fetch_status
+        self.concurrency = concurrency
+        self.rate_per_second = rate_per_second
+        self.page_size = page_size
+        self.batch_size = batch_size
+        self.min_age_seconds = min_age_seconds
+        self.interval_seconds = interval_seconds
+        self.dry_run = dry_run
+        self.logger = logging.getLogger(__name__)
+
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._wakeup: Optional[asyncio.Event] = None
+
+        self.runs = 0
+        self.running = False
+        self.last_run_started: Optional[str] = None
+        self.last_run_seconds: Optional[float] = None
+        self.last_run: Dict[str, int] = {}
+        self.totals: Dict[str, int] = self._counters()
+
+    @classmethod
+    def from_env(cls, database, fetch_status: Callable[..., Awaitable[Dict[str, Any]]],
+                 dry_run_fetch_status: Optional[Callable[..., Awaitable[Dict[str, Any]]]] = None) -> "PaymentReconciler":
+        """Create a reconciler from RECONCILER_* environment variables"""
+        return cls(
+            database,
+            fetch_status,
+            dry_run_fetch_status=dry_run_fetch_status,
+            concurrency=int(os.getenv('RECONCILER_CONCURRENCY', '8')),
+            rate_per_second=float(os.getenv('RECONCILER_RATE_PER_SECOND', '5')),
+            page_size=int(os.getenv('RECONCILER_PAGE_SIZE', '200')),
+            batch_size=int(os.getenv('RECONCILER_BATCH_SIZE', '50')),
+            min_age_seconds=float(os.getenv('RECONCILER_MIN_AGE_SECONDS', str(DEFAULT_MIN_AGE_SECONDS))),
+            interval_seconds=float(os.getenv('RECONCILER_INTERVAL_SECONDS', '300')),
+            dry_run=os.getenv('RECONCILER_DRY_RUN', 'false').lower() == 'true'
+        )
+
+    @staticmethod
+    def _counters() -> Dict[str, int]:
+        return {"pages": 0, "scanned": 0, "checked": 0, "completed": 0, "failed": 0,
+                "still_pending": 0, "errors": 0, "applied": 0, "activated": 0}
+
+    def _count(self, counters: Dict[str, int], name: str, amount: int = 1) -> None:
+        counters[name] += amount
+        self.totals[name] += amount
+
+    async def _pages(self, created_before: datetime, counters: Dict[str, int]):
+        """Yield pages of pending rows, resuming after the last (created_at, id) seen"""
+        after: Optional[Tuple[str, str]] = None
+        while not self._stopping:
+            rows = await self.database.get_pending_payments(created_before, after=after, limit=self.page_size)
+            if not rows:
+                return
+            self._count(counters, "pages")
+            self._count(counters, "scanned", len(rows))
+            yield rows
+            if len(rows) < self.page_size:
+                return
+            last = rows[-1]
+            after = (last["created_at"], last["id"])
+
+    async def _apply(self, updates: List[Tuple[str, Dict[str, Any]]], counters: Dict[str, int]) -> None:
+        if not updates:
+            return
+        if self.dry_run:
+            return
+        try:
+            applied = await self.database.update_payment_statuses(updates)
+        except Exception as e:
+            self.logger.error(f"Reconciler batch update failed for {len(updates)} orders: {e}")
+            self._count(counters, "errors", len(updates))
+            return
+        self._count(counters, "applied", applied)
+
+        for merchant_order_id, status_data in updates:
+            if status_data.get('payload', {}).get('state') != 'COMPLETED':
+                continue
+            try:
+                if await self.database.activate_subscription(merchant_order_id):
+                    self._count(counters, "activated")
+            except Exception as e:
+                self.logger.error(f"Reconciler activation failed for {merchant_order_id}: {e}")
+                self._count(counters, "errors")
+
+    async def run_once(self) -> Dict[str, int]:
+        """One pass over every pending row older than min_age_seconds"""
+        counters = self._counters()
+        created_before = datetime.now(timezone.utc) - timedelta(seconds=self.min_age_seconds)
+        limiter = _RateLimiter(self.rate_per_second)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        updates: List[Tuple[str, Dict[str, Any]]] = []
+        # Chosen per run, so switching dry_run after construction (as the CLI does) is honoured
+        fetch_status = self.dry_run_fetch_status if self.dry_run else self.fetch_status
+
+        async def check(merchant_order_id: str) -> None:
+            async with semaphore:
+                await limiter.wait()
+                try:
+                    # Background lane: checkout and user polling take precedence at PhonePe
+                    with phonepe_limiter.lane(PRIORITY_LOW):
+                        result = await fetch_status(merchant_order_id, include_details=True)
+                except Exception as e:
+                    result = {"success": False, "error": str(e)}
+            self._count(counters, "checked")
+
+            if not result.get("success"):
+                self.logger.warning(f"Reconciler status check failed for {merchant_order_id}: {result.get('error')}")
+                self._count(counters, "errors")
+                return
+
+            state = result.get("state")
+            if state not in TERMINAL_STATES:
+                self._count(counters, "still_pending")
+                return
+            self._count(counters, "completed" if state == 'COMPLETED' else "failed")
+            updates.append((merchant_order_id, result.get("status_data") or {"payload": {"state": state}}))
+
+        self.running = True
+        self.last_run_started = datetime.now().isoformat()
+        started = time.monotonic()
+        try:
+            async for rows in self._pages(created_before, counters):
+                await asyncio.gather(*(check(row["phonepe_merchant_order_id"]) for row in rows))
+                while updates:
+                    batch, updates[:] = updates[:self.batch_size], updates[self.batch_size:]
+                    await self._apply(batch, counters)
+        finally:
+            self.running = False
+            self.runs += 1
+            self.last_run_seconds = round(time.monotonic() - started, 3)
+            self.last_run = counters
+
+        self.logger.info(
+            f"Reconciled {counters['scanned']} pending payments{' (dry run)' if self.dry_run else ''}: "
+            f"{counters['completed']} completed, {counters['failed']} failed, "
+            f"{counters['still_pending']} still pending, {counters['errors']} errors"
+        )
+        return counters
+
+    async def start(self) -> None:
+        """Start the periodic reconciliation task"""
+        if self._task is not None:
+            return
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.ensure_future(self._run())
+        self.logger.info(f"Payment reconciler started (every {self.interval_seconds}s, dry run {self.dry_run})")
+
+    async def stop(self) -> None:
+        """Stop the periodic task, letting an in-progress page finish"""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        self._wakeup = None
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await self.run_once()
+            except Exception as e:
+                self.logger.error(f"Payment reconciliation error: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "dry_run": self.dry_run,
+            "runs": self.runs,
+            "last_run_started": self.last_run_started,
+            "last_run_seconds": self.last_run_seconds,
+            "last_run": self.last_run,
+            "totals": self.totals
+        }
+
+
+# Global reconciler; order_state answers from webhook-recorded states before asking PhonePe.
+# Dry runs bypass order_state, which persists gateway states to phonepe_transactions.
+payment_reconciler = PaymentReconciler.from_env(supabase_service, order_state.get_status, payment_status_cache.get)
@@ -0,0 +1,395 @@
+import os
+import math
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import httpx
+
+from .rate_limiter import RateLimitExceeded, RateLimiter, phonepe_limiter
+
+# Circuit breaker states
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an endpoint whose circuit is open"""
+
+    def __init__(self, endpoint: str, retry_after: float):
+        self.endpoint = endpoint
+        self.retry_after = max(1, math.ceil(retry_after))
+        super().__init__(f"{endpoint} circuit open, retry after {self.retry_after}s")
+
+
+class CircuitBreaker:
+    """Failure-rate circuit breaker over the last `window` calls
+
+    Opens when at least min_calls of the last window calls were made and the
+    failure rate reaches failure_rate; while open every call fails fast. After
+    open_seconds one probe call is let through (half-open): success closes the
+    circuit, failure opens it again.
+    """
+
+    def __init__(self, name: str, failure_rate: float = 0.5, window: int = 20, min_calls: int = 10,
+                 open_seconds: float = 30, half_open_probes: int = 1):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.logger = logging.getLogger(__name__)
+
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=window)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+
+        self.times_opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                return HALF_OPEN
+            return self._state
+
+    def acquire(self) -> None:
+        """Admit a call or raise CircuitOpenError"""
+        with self._lock:
+            if self._state == OPEN:
+                remaining = self.open_seconds - (time.monotonic() - self._opened_at)
+                if remaining > 0:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.name, remaining)
+                self._state = HALF_OPEN
+                self._probes = 0
+            if self._state == HALF_OPEN:
+                if self._probes >= self.half_open_probes:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.name, 1)
+                self._probes += 1
+
+    def record(self, success: bool) -> None:
+        """Record the outcome of an admitted call"""
+        with self._lock:
+            if self._state == OPEN:
+                return  # a call admitted before the circuit opened
+            if self._state == HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+                if success:
+                    self._state = CLOSED
+                    self._outcomes.clear()
+                    self.logger.info(f"Circuit {self.name} closed")
+                else:
+                    self._open()
+                return
+
+            self._outcomes.append(success)
+            failures = self._outcomes.count(False)
+            if (self._state == CLOSED and len(self._outcomes) >= self.min_calls
+                    and failures / len(self._outcomes) >= self.failure_rate):
+                self._open()
+
+    def release(self) -> None:
+        """Give back an admitted call that never completed (e.g. cancelled)"""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+
+    def _open(self) -> None:
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self.times_opened += 1
+        self.logger.warning(f"Circuit {self.name} opened for {self.open_seconds}s")
+
+    def get_stats(self) -> Dict[str, Any]:
+        state = self.state
+        with self._lock:
+            calls = len(self._outcomes)
+            failures = self._outcomes.count(False)
+            retry_after = self.open_seconds - (time.monotonic() - self._opened_at) if state == OPEN else 0
+            times_opened, rejected = self.times_opened, self.rejected
+        return {
+            "state": state,
+            "recent_calls": calls,
+            "recent_failure_rate": round(failures / calls, 4) if calls else 0.0,
+            "times_opened": times_opened,
+            "rejected": rejected,
+            "retry_after_seconds": max(0, math.ceil(retry_after))
+        }
+
+
+class RetryBudget:
+    """Caps retries at a fraction of traffic so retries cannot multiply load in a brownout
+
+    Every first attempt deposits `ratio` tokens and min_per_second tokens accrue
+    over time (so low traffic can still retry); a retry spends one token.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_per_second: float = 1.0, max_tokens: float = 50):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+
+        self._lock = threading.Lock()
+        self._tokens = max_tokens
+        self._updated = time.monotonic()
+
+        self.granted = 0
+        self.denied = 0
+
+    def _refill(self, amount: float = 0.0) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.max_tokens, self._tokens + amount + (now - self._updated) * self.min_per_second)
+        self._updated = now
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._refill(self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                self.granted += 1
+                return True
+            self.denied += 1
+            return False
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refill()
+            return {
+                "tokens": round(self._tokens, 2),
+                "ratio": self.ratio,
+                "granted": self.granted,
+                "denied": self.denied
+            }
+
+
+class EndpointPolicy:
+    """Timeouts and retry policy for one upstream endpoint"""
+
+    def __init__(self, name: str, connect_timeout: float, read_timeout: float, idempotent: bool, max_retries: int):
+        self.name = name
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.idempotent = idempotent
+        self.max_retries = max_retries if idempotent else 0
+
+    @classmethod
+    def from_env(cls, prefix: str, name: str, connect_timeout: float, read_timeout: float, idempotent: bool,
+                 max_retries: int) -> "EndpointPolicy":
+        """Override the defaults with <PREFIX>_<NAME>_CONNECT_TIMEOUT, _READ_TIMEOUT and _RETRIES"""
+        key = f"{prefix}_{name.upper()}"
+        return cls(
+            name,
+            connect_timeout=float(os.getenv(f'{key}_CONNECT_TIMEOUT', str(connect_timeout))),
+            read_timeout=float(os.getenv(f'{key}_READ_TIMEOUT', str(read_timeout))),
+            idempotent=idempotent,
+            max_retries=int(os.getenv(f'{key}_RETRIES', str(max_retries)))
+        )
+
+    @property
+    def requests_timeout(self) -> Tuple[float, float]:
+        return (self.connect_timeout, self.read_timeout)
+
+    @property
+    def httpx_timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(self.read_timeout, connect=self.connect_timeout)
+
+
+def is_failure(status_code: int) -> bool:
+    """Responses that mean the gateway is unhealthy (as opposed to rejecting the request)"""
+    return status_code >= 500 or status_code == 429
+
+
+class ResilientGateway:
+    """Per-endpoint timeouts, retries and circuit breakers for one upstream service
+
+    call()/call_async() take a function that sends the request given a timeout.
+    Network errors, 5xx and 429 count as failures. Only idempotent endpoints are
+    retried, with full-jitter exponential backoff and only while the shared
+    retry budget allows. An open circuit raises CircuitOpenError before any
+    request is sent. With a limiter, every attempt also waits for a slot in
+    the endpoint's class (limiter_classes maps endpoint -> class).
+    """
+
+    def __init__(self, name: str, policies: Dict[str, EndpointPolicy], budget: Optional[RetryBudget] = None,
+                 breaker_settings: Optional[Dict[str, Any]] = None, backoff_base: float = 0.1,
+                 backoff_cap: float = 2.0, limiter: Optional[RateLimiter] = None,
+                 limiter_classes: Optional[Dict[str, str]] = None):
+        self.name = name
+        self.policies = policies
+        self.budget = budget or RetryBudget()
+        self.limiter = limiter
+        self.limiter_classes = limiter_classes or {}
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.logger = logging.getLogger(__name__)
+
+        self.breakers = {
+            endpoint: CircuitBreaker(f"{name}.{endpoint}", **(breaker_settings or {}))
+            for endpoint in policies
+        }
+        # Counters are bumped from request threads and the event loop alike
+        self._lock = threading.Lock()
+        self.calls = {endpoint: 0 for endpoint in policies}
+        self.failures = {endpoint: 0 for endpoint in policies}
+        self.retries = {endpoint: 0 for endpoint in policies}
+
+    @classmethod
+    def from_env(cls, name: str, defaults: Dict[str, Tuple[float, float, bool, int]], limiter: Optional[RateLimiter] = None,
+                 limiter_classes: Optional[Dict[str, str]] = None) -> "ResilientGateway":
+        """Create a gateway from <NAME>_* environment variables; defaults map endpoint -> (connect, read, idempotent, retries)"""
+        prefix = name.upper()
+        policies = {
+            endpoint: EndpointPolicy.from_env(prefix, endpoint, *settings)
+            for endpoint, settings in defaults.items()
+        }
+        budget = RetryBudget(
+            ratio=float(os.getenv(f'{prefix}_RETRY_BUDGET_RATIO', '0.2')),
+            min_per_second=float(os.getenv(f'{prefix}_RETRY_MIN_PER_SECOND', '1')),
+            max_tokens=float(os.getenv(f'{prefix}_RETRY_MAX_TOKENS', '50'))
+        )
+        breaker_settings = {
+            "failure_rate": float(os.getenv(f'{prefix}_BREAKER_FAILURE_RATE', '0.5')),
+            "window": int(os.getenv(f'{prefix}_BREAKER_WINDOW', '20')),
+            "min_calls": int(os.getenv(f'{prefix}_BREAKER_MIN_CALLS', '10')),
+            "open_seconds": float(os.getenv(f'{prefix}_BREAKER_OPEN_SECONDS', '30'))
+        }
+        return cls(
+            name, policies, budget, breaker_settings,
+            backoff_base=float(os.getenv(f'{prefix}_RETRY_BACKOFF_BASE', '0.1')),
+            backoff_cap=float(os.getenv(f'{prefix}_RETRY_BACKOFF_CAP', '2.0')),
+            limiter=limiter,
+            limiter_classes=limiter_classes
+        )
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    def _should_retry(self, endpoint: str, attempt: int) -> bool:
+        if attempt >= self.policies[endpoint].max_retries or not self.budget.withdraw():
+            return False
+        with self._lock:
+            self.retries[endpoint] += 1
+        return True
+
+    def _begin(self, endpoint: str) -> None:
+        with self._lock:
+            self.calls[endpoint] += 1
+        self.budget.deposit()
+
+    def _record(self, endpoint: str, success: bool) -> None:
+        self.breakers[endpoint].record(success)
+        if not success:
+            with self._lock:
+                self.failures[endpoint] += 1
+
+    def _send(self, endpoint: str, send: Callable[[Any], Any], timeout: Any) -> Any:
+        if self.limiter is None:
+            return send(timeout)
+        with self.limiter.slot(self.limiter_classes.get(endpoint, endpoint)):
+            return send(timeout)
+
+    async def _send_async(self, endpoint: str, send: Callable[[Any], Awaitable[Any]], timeout: Any) -> Any:
+        if self.limiter is None:
+            return await send(timeout)
+        async with self.limiter.slot_async(self.limiter_classes.get(endpoint, endpoint)):
+            return await send(timeout)
+
+    def call(self, endpoint: str, send: Callable[[Tuple[float, float]], Any]) -> Any:
+        """Send a blocking request (requests-style timeout tuple) through the endpoint's policy"""
+        policy = self.policies[endpoint]
+        breaker = self.breakers[endpoint]
+        self._begin(endpoint)
+        attempt = 0
+        while True:
+            breaker.acquire()
+            try:
+                response = self._send(endpoint, send, policy.requests_timeout)
+            except RateLimitExceeded:
+                breaker.release()
+                raise
+            except Exception:
+                self._record(endpoint, False)
+                if not self._should_retry(endpoint, attempt):
+                    raise
+            else:
+                failed = is_failure(response.status_code)
+                self._record(endpoint, not failed)
+                if not failed or not self._should_retry(endpoint, attempt):
+                    return response
+            time.sleep(self._backoff(attempt))
+            attempt += 1
+
+    async def call_async(self, endpoint: str, send: Callable[[httpx.Timeout], Awaitable[Any]]) -> Any:
+        """Send an async request (httpx timeout) through the endpoint's policy"""
+        policy = self.policies[endpoint]
+        breaker = self.breakers[endpoint]
+        self._begin(endpoint)
+        attempt = 0
+        while True:
+            breaker.acquire()
+            try:
+                response = await self._send_async(endpoint, send, policy.httpx_timeout)
+            except (asyncio.CancelledError, RateLimitExceeded):
+                breaker.release()
+                raise
+            except Exception:
+                self._record(endpoint, False)
+                if not self._should_retry(endpoint, attempt):
+                    raise
+            else:
+                failed = is_failure(response.status_code)
+                self._record(endpoint, not failed)
+                if not failed or not self._should_retry(endpoint, attempt):
+                    return response
+            await asyncio.sleep(self._backoff(attempt))
+            attempt += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            calls, failures, retries = dict(self.calls), dict(self.failures), dict(self.retries)
+        return {
+            "endpoints": {
+                endpoint: {
+                    "connect_timeout": policy.connect_timeout,
+                    "read_timeout": policy.read_timeout,
+                    "max_retries": policy.max_retries,
+                    "calls": calls[endpoint],
+                    "failures": failures[endpoint],
+                    "retries": retries[endpoint],
+                    "circuit": self.breakers[endpoint].get_stats()
+                }
+                for endpoint, policy in self.policies.items()
+            },
+            "retry_budget": self.budget.get_stats()
+        }
+
+
+# PhonePe endpoints: (connect timeout, read timeout, idempotent, retries).
+# Token and status calls are safe to repeat; pay and refund create state at PhonePe and are never retried.
+PHONEPE_ENDPOINTS = {
+    "token": (3.0, 10.0, True, 2),
+    "pay": (3.0, 15.0, False, 0),
+    "status": (2.0, 5.0, True, 2),
+    "refund": (3.0, 15.0, False, 0),
+}
+
+# Rate limiter class for each endpoint (see rate_limiter.PHONEPE_ENDPOINT_CLASSES)
+PHONEPE_LIMITER_CLASSES = {"token": "auth", "pay": "checkout", "status": "status", "refund": "refund"}
+
+# Global PhonePe gateway policy shared by the sync and async services
+phonepe_gateway = ResilientGateway.from_env('phonepe', PHONEPE_ENDPOINTS, phonepe_limiter, PHONEPE_LIMITER_CLASSES)
@@ -1,16 +1,124 @@
 import os
-import asyncpg
+import asyncio
 import logging
-from typing import Dict, Any, List, Optional
-from dotenv import load_dotenv
-from supabase import create_client, Client
+from typing import TYPE_CHECKING, Dict, Any, List, Optional, Tuple
 import json
-from datetime import datetime
+from uuid import UUID
+from decimal import Decimal
+from datetime import datetime, timezone
+from .cache import TTLCache
+from .lazy import LazyService
+from .write_behind import write_behind
+from .quota_cache import quota_cache
+
+if TYPE_CHECKING:
+    import asyncpg
+    from supabase import Client
+
+# Usage and plan limits in one query (see get_quota_status in database_schema_performance.sql)
+QUOTA_STATUS_QUERY = "SELECT * FROM get_quota_status($1::uuid)"
+
+# Lazily-reset quota consumption and batched usage (see database_schema_performance.sql)
+CONSUME_QUOTA_QUERY = "SELECT * FROM consume_quota($1::uuid, $2)"
+APPLY_QUOTA_USAGE_QUERY = "SELECT * FROM apply_quota_usage($1::uuid[], $2::int[])"
+
+# Hot-path statements for the asyncpg backend; asyncpg prepares each once per connection
+# User and quota row found or created together (see upsert_user in database_schema_performance.sql)
+UPSERT_USER_QUERY = "SELECT * FROM upsert_user($1, $2, $3)"
+
+INSERT_PAYMENT_TRANSACTION = """
+    INSERT INTO payment_transactions (user_id, phonepe_merchant_order_id, amount_paisa, amount_rupees,
+                                      base_amount, gst_amount, status, metadata)
+    VALUES ($1, $2, $3, $4, $5, $6, 'pending', $7)
+"""
+
+INSERT_PHONEPE_TRANSACTION = """
+    INSERT INTO phonepe_transactions (user_id, merchant_order_id, amount_paisa, state, expires_at)
+    VALUES ($1, $2, $3, 'PENDING', $4)
+"""
+
+UPDATE_PAYMENT_TRANSACTION = """
+    UPDATE payment_transactions SET
+      phonepe_state = $2,
+      phonepe_payment_details = $3,
+      status = CASE $2 WHEN 'COMPLETED' THEN 'completed' WHEN 'FAILED' THEN 'failed' ELSE status END,
+      completed_at = CASE WHEN $2 = 'COMPLETED' THEN NOW() ELSE completed_at END,
+      failed_at = CASE WHEN $2 = 'FAILED' THEN NOW() ELSE failed_at END,
+      updated_at = NOW()
+    WHERE phonepe_merchant_order_id = $1
+"""
+
+# Batch form of UPDATE_PAYMENT_TRANSACTION; returns one row per payment that matched
+UPDATE_PAYMENT_TRANSACTIONS_BATCH = """
+    UPDATE payment_transactions AS p SET
+      phonepe_state = u.state,
+      phonepe_payment_details = u.details::jsonb,
+      status = CASE u.state WHEN 'COMPLETED' THEN 'completed' WHEN 'FAILED' THEN 'failed' ELSE p.status END,
+      completed_at = CASE WHEN u.state = 'COMPLETED' THEN NOW() ELSE p.completed_at END,
+      failed_at = CASE WHEN u.state = 'FAILED' THEN NOW() ELSE p.failed_at END,
+      updated_at = NOW()
+    FROM unnest($1::text[], $2::text[], $3::text[]) AS u(order_id, state, details)
+    WHERE p.phonepe_merchant_order_id = u.order_id
+    RETURNING 1
+"""
+
+UPDATE_PHONEPE_TRANSACTION = """
+    UPDATE phonepe_transactions SET state = $2, payment_details = $3, verified_at = NOW(), updated_at = NOW()
+    WHERE merchant_order_id = $1
+"""
+
+SELECT_PAYMENT_BY_ORDER_ID = "SELECT * FROM payment_transactions WHERE phonepe_merchant_order_id = $1"
+
+# Cancel, insert, link and re-limit in one transaction (see activate_subscription in database_schema_performance.sql)
+ACTIVATE_SUBSCRIPTION_QUERY = "SELECT * FROM activate_subscription($1)"
+
+# Keyset page of pending payments ordered by (created_at, id)
+SELECT_PENDING_PAYMENTS = """
+    SELECT id, phonepe_merchant_order_id, created_at FROM payment_transactions
+    WHERE status = 'pending' AND created_at < $1 AND (created_at, id) > ($2, $3)
+    ORDER BY created_at, id
+    LIMIT $4
+"""
+
+
+async def _init_connection(conn: "asyncpg.Connection") -> None:
+    """Decode json/jsonb to Python objects, as the REST client does"""
+    for type_name in ('json', 'jsonb'):
+        await conn.set_type_codec(type_name, encoder=json.dumps, decoder=json.loads, schema='pg_catalog')
+
+
+def _record(row: Optional["asyncpg.Record"]) -> Optional[Dict[str, Any]]:
+    """Convert an asyncpg row to the JSON-shaped dict supabase-py returns"""
+    if row is None:
+        return None
+    record = {}
+    for key, value in row.items():
+        if isinstance(value, UUID):
+            value = str(value)
+        elif isinstance(value, datetime):
+            value = value.isoformat()
+        elif isinstance(value, Decimal):
+            value = float(value)
+        record[key] = value
+    return record
+
+
+def _timestamp(value: Any) -> Optional[datetime]:
+    """Accept ISO strings or PhonePe epoch milliseconds for timestamptz parameters"""
+    if value is None or isinstance(value, datetime):
+        return value
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value / 1000 if value > 1e11 else value, tz=timezone.utc)
+    return datetime.fromisoformat(str(value).replace('Z', '+00:00'))
 
-load_dotenv()
 
 class SupabaseService:
-    """Supabase database service for Lekhak AI PhonePe integration"""
+    """Supabase database service for Lekhak AI PhonePe integration
+
+    Hot queries run on an asyncpg pool when DATABASE_BACKEND=asyncpg (the default
+    when DATABASE_URL is set); everything else, and the rest backend, uses supabase-py
+    with the blocking .execute() moved off the event loop.
+    """
     
     def __init__(self):
         self.database_url = os.getenv('DATABASE_URL')
@@ -18,68 +126,106 @@ class SupabaseService:
         self.supabase_anon_key = os.getenv('SUPABASE_ANON_KEY')
         self.supabase_service_key = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
         
+        self.backend = os.getenv('DATABASE_BACKEND', 'asyncpg' if self.database_url else 'rest').lower()
+        self.pool_min_size = int(os.getenv('DATABASE_POOL_MIN_SIZE', '5'))
+        self.pool_max_size = int(os.getenv('DATABASE_POOL_MAX_SIZE', '20'))
+        # Set to 0 behind a transaction-mode pooler (Supabase port 6543), which cannot keep prepared statements
+        self.statement_cache_size = int(os.getenv('DATABASE_STATEMENT_CACHE_SIZE', '100'))
+        
         self.logger = logging.getLogger(__name__)
         
-        # Initialize Supabase client
-        self.supabase: Client = create_client(
-            self.supabase_url, 
-            self.supabase_service_key  # Use service role for backend operations
-        )
+        # Supabase client, created on first REST call so the asyncpg backend never needs it
+        self._supabase: Optional["Client"] = None
         
         # Connection pool for direct PostgreSQL access
         self.connection_pool = None
         
+        # extension_id -> user row, so repeat identifications skip the database
+        self.user_cache = TTLCache(
+            max_entries=int(os.getenv('USER_CACHE_MAX_ENTRIES', '50000')),
+            ttl_seconds=float(os.getenv('USER_CACHE_TTL_SECONDS', '300'))
+        )
+        
+    @property
+    def supabase(self) -> "Client":
+        if self._supabase is None:
+            # Imported here: supabase-py is slow to import and unused on the asyncpg path
+            from supabase import create_client
+            self._supabase = create_client(
+                self.supabase_url, 
+                self.supabase_service_key  # Use service role for backend operations
+            )
+        return self._supabase
+    
     async def init_connection_pool(self):
         """Initialize asyncpg connection pool"""
+        if self.backend != 'asyncpg' or not self.database_url:
+            self.logger.info("Database backend: supabase REST")
+            return
+        
         if not self.connection_pool:
-            self.connection_pool = await asyncpg.create_pool(
-                self.database_url,
-                min_size=5,
-                max_size=20,
-                command_timeout=60
-            )
-            self.logger.info("Database connection pool initialized")
+            import asyncpg
+            
+            try:
+                self.connection_pool = await asyncpg.create_pool(
+                    self.database_url,
+                    min_size=self.pool_min_size,
+                    max_size=self.pool_max_size,
+                    command_timeout=60,
+                    statement_cache_size=self.statement_cache_size,
+                    init=_init_connection
+                )
+                self.logger.info("Database connection pool initialized")
+            except Exception as e:
+                self.logger.error(f"Database connection pool unavailable, using supabase REST: {e}")
     
     async def close_connection_pool(self):
         """Close database connection pool"""
         if self.connection_pool:
-            await self.connection_pool.close()
+            pool, self.connection_pool = self.connection_pool, None
+            await pool.close()
             self.logger.info("Database connection pool closed")
     
+    async def _execute(self, query):
+        """Run a supabase-py request in a worker thread so it never blocks the event loop"""
+        return await asyncio.to_thread(query.execute)
+    
+    def get_pool_stats(self) -> Dict[str, Any]:
+        """Backend in use and asyncpg pool occupancy"""
+        if not self.connection_pool:
+            return {"backend": "rest"}
+        return {
+            "backend": "asyncpg",
+            "size": self.connection_pool.get_size(),
+            "idle": self.connection_pool.get_idle_size(),
+            "max_size": self.pool_max_size,
+            "statement_cache_size": self.statement_cache_size
+        }
+    
     # User Management
     async def create_or_get_user(self, extension_id: str, email: str = None, name: str = None) -> Dict[str, Any]:
-        """Create or get user by extension ID"""
+        """Create or get user by extension ID with one upsert call, cached by extension ID"""
         try:
-            # Check if user exists
-            result = self.supabase.table('users').select('*').eq('extension_id', extension_id).execute()
+            user = self.user_cache.get(extension_id)
+            if user is not None and (not email or email == user.get('email')) and (not name or name == user.get('name')):
+                return {"success": True, "user": dict(user), "created": False}
             
-            if result.data:
-                user = result.data[0]
-                self.logger.info(f"User found: {user['id']}")
-                return {"success": True, "user": user, "created": False}
-            
-            # Create new user
-            user_data = {
-                "extension_id": extension_id,
-                "email": email,
-                "name": name,
-                "is_active": True,
-                "created_at": datetime.now().isoformat(),
-                "last_seen": datetime.now().isoformat()
-            }
-            
-            result = self.supabase.table('users').insert(user_data).execute()
-            
-            if result.data:
-                user = result.data[0]
-                
-                # Create initial quota
-                await self.create_user_quota(user['id'])
-                
-                self.logger.info(f"User created: {user['id']}")
-                return {"success": True, "user": user, "created": True}
+            if self.connection_pool:
+                row = _record(await self.connection_pool.fetchrow(UPSERT_USER_QUERY, extension_id, email, name))
             else:
+                result = await self._execute(self.supabase.rpc(
+                    'upsert_user', {'p_extension_id': extension_id, 'p_email': email, 'p_name': name}
+                ))
+                row = result.data[0] if result.data else None
+            
+            if not row:
                 return {"success": False, "error": "Failed to create user"}
+            
+            created = row.pop('created', False)
+            self.user_cache.set(extension_id, row)
+            if created:
+                self.logger.info(f"User created: {row['id']}")
+            return {"success": True, "user": dict(row), "created": created}
                 
         except Exception as e:
             self.logger.error(f"Error creating/getting user: {e}")
@@ -97,7 +243,7 @@ class SupabaseService:
                 "monthly_limit": -1
             }
             
-            result = self.supabase.table('user_quotas').insert(quota_data).execute()
+            result = await self._execute(self.supabase.table('user_quotas').insert(quota_data))
             return bool(result.data)
             
         except Exception as e:
@@ -108,6 +254,30 @@ class SupabaseService:
     async def store_payment_order(self, payment_data: Dict[str, Any]) -> bool:
         """Store payment order in database"""
         try:
+            if self.connection_pool:
+                async with self.connection_pool.acquire() as conn:
+                    async with conn.transaction():
+                        await conn.execute(
+                            INSERT_PAYMENT_TRANSACTION,
+                            UUID(str(payment_data["user_id"])),
+                            payment_data["merchant_order_id"],
+                            payment_data["amount_paisa"],
+                            Decimal(str(payment_data["amount_rupees"])),
+                            Decimal(str(payment_data["base_amount"])),
+                            Decimal(str(payment_data["gst_amount"])),
+                            {"plan_id": payment_data["plan_id"], "plan_name": payment_data["plan_name"]}
+                        )
+                        await conn.execute(
+                            INSERT_PHONEPE_TRANSACTION,
+                            UUID(str(payment_data["user_id"])),
+                            payment_data["merchant_order_id"],
+                            payment_data["amount_paisa"],
+                            _timestamp(payment_data.get("expires_at"))
+                        )
+                
+                self.logger.info(f"Payment order stored: {payment_data['merchant_order_id']}")
+                return True
+            
             # Store in payment_transactions table
             payment_record = {
                 "user_id": payment_data["user_id"],
@@ -123,7 +293,7 @@ class SupabaseService:
                 }
             }
             
-            result = self.supabase.table('payment_transactions').insert(payment_record).execute()
+            result = await self._execute(self.supabase.table('payment_transactions').insert(payment_record))
             
             if result.data:
                 # Also store in phonepe_transactions for detailed tracking
@@ -135,7 +305,7 @@ class SupabaseService:
                     "expires_at": payment_data.get("expires_at")
                 }
                 
-                self.supabase.table('phonepe_transactions').insert(phonepe_record).execute()
+                await self._execute(self.supabase.table('phonepe_transactions').insert(phonepe_record))
                 
                 self.logger.info(f"Payment order stored: {payment_data['merchant_order_id']}")
                 return True
@@ -152,6 +322,19 @@ class SupabaseService:
             state = status_data.get('payload', {}).get('state')
             payment_details = status_data.get('payload', {}).get('paymentDetails', [])
             
+            if self.connection_pool:
+                async with self.connection_pool.acquire() as conn:
+                    async with conn.transaction():
+                        result = await conn.execute(
+                            UPDATE_PAYMENT_TRANSACTION, merchant_order_id, state, payment_details
+                        )
+                        await conn.execute(
+                            UPDATE_PHONEPE_TRANSACTION, merchant_order_id, state, status_data.get('payload', {})
+                        )
+                
+                self.logger.info(f"Payment status updated: {merchant_order_id} - {state}")
+                return result != "UPDATE 0"
+            
             # Update payment_transactions
             update_data = {
                 "phonepe_state": state,
@@ -166,9 +349,9 @@ class SupabaseService:
                 update_data["status"] = "failed"
                 update_data["failed_at"] = datetime.now().isoformat()
             
-            result = self.supabase.table('payment_transactions').update(update_data).eq(
+            result = await self._execute(self.supabase.table('payment_transactions').update(update_data).eq(
                 'phonepe_merchant_order_id', merchant_order_id
-            ).execute()
+            ))
             
             # Update phonepe_transactions
             phonepe_update = {
@@ -177,9 +360,9 @@ class SupabaseService:
                 "verified_at": datetime.now().isoformat()
             }
             
-            self.supabase.table('phonepe_transactions').update(phonepe_update).eq(
+            await self._execute(self.supabase.table('phonepe_transactions').update(phonepe_update).eq(
                 'merchant_order_id', merchant_order_id
-            ).execute()
+            ))
             
             self.logger.info(f"Payment status updated: {merchant_order_id} - {state}")
             return bool(result.data)
@@ -189,78 +372,36 @@ class SupabaseService:
             return False
     
     async def activate_subscription(self, merchant_order_id: str) -> bool:
-        """Activate subscription after successful payment"""
+        """Activate subscription after successful payment in one server-side transaction"""
         try:
-            # Get payment details
-            payment_result = self.supabase.table('payment_transactions').select(
-                '*, metadata'
-            ).eq('phonepe_merchant_order_id', merchant_order_id).execute()
-            
-            if not payment_result.data:
-                return False
-            
-            payment = payment_result.data[0]
-            user_id = payment['user_id']
-            plan_name = payment['metadata'].get('plan_name', 'Pro')
-            
-            # Get plan details
-            plan_result = self.supabase.table('subscription_plans').select('*').eq(
-                'name', plan_name
-            ).execute()
+            if self.connection_pool:
+                activation = _record(await self.connection_pool.fetchrow(ACTIVATE_SUBSCRIPTION_QUERY, merchant_order_id))
+            else:
+                result = await self._execute(self.supabase.rpc(
+                    'activate_subscription', {'p_merchant_order_id': merchant_order_id}
+                ))
+                activation = result.data[0] if result.data else None
             
-            if not plan_result.data:
+            if not activation:
+                self.logger.error(f"No payment or plan found to activate order: {merchant_order_id}")
                 return False
             
-            plan = plan_result.data[0]
-            
-            # Deactivate existing subscriptions
-            self.supabase.table('user_subscriptions').update({
-                "status": "cancelled",
-                "cancelled_at": datetime.now().isoformat()
-            }).eq('user_id', user_id).eq('status', 'active').execute()
-            
-            # Create new subscription
-            subscription_data = {
-                "user_id": user_id,
-                "plan_id": plan['id'],
-                "status": "active",
-                "billing_cycle": "monthly",
-                "phonepe_merchant_order_id": merchant_order_id,
-                "started_at": datetime.now().isoformat(),
-                "current_period_start": datetime.now().isoformat(),
-                "current_period_end": (datetime.now().replace(day=1) + 
-                                     datetime.timedelta(days=32)).replace(day=1).isoformat()
-            }
-            
-            subscription_result = self.supabase.table('user_subscriptions').insert(
-                subscription_data
-            ).execute()
-            
-            if subscription_result.data:
-                # Update user quota limits
-                quota_update = {
-                    "daily_limit": 7 if plan['name'] == 'Free' else plan['hits_limit'],
-                    "monthly_limit": plan['hits_limit'],
-                    "hits_used_this_month": 0,  # Reset for new subscription
-                    "updated_at": datetime.now().isoformat()
-                }
-                
-                self.supabase.table('user_quotas').update(quota_update).eq(
-                    'user_id', user_id
-                ).execute()
-                
-                self.logger.info(f"Subscription activated for user: {user_id}, plan: {plan_name}")
-                return True
+            # Drop the cached free-plan limits so the next check sees the new plan
+            quota_cache.invalidate(activation['user_id'])
             
-            return False
+            if activation['created']:
+                self.logger.info(f"Subscription activated for user: {activation['user_id']}, plan: {activation['plan_name']}")
+            else:
+                self.logger.info(f"Subscription already active for order: {merchant_order_id}")
+            return True
             
         except Exception as e:
             self.logger.error(f"Error activating subscription: {e}")
             return False
     
-    # Webhook Event Logging
-    async def log_webhook_event(self, event_type: str, payload: Dict[str, Any]) -> bool:
-        """Log webhook event"""
+    # Webhook Event Logging (buffered: rows are written in bulk by the write-behind buffer)
+    async def log_webhook_event(self, event_type: str, payload: Dict[str, Any]) -> Optional[str]:
+        """Log webhook event; returns the id the row will be written with"""
         try:
             webhook_data = {
                 "event_type": event_type,
@@ -271,22 +412,18 @@ class SupabaseService:
                 "created_at": datetime.now().isoformat()
             }
             
-            result = self.supabase.table('webhook_events').insert(webhook_data).execute()
-            return bool(result.data)
+            return write_behind.insert('webhook_events', webhook_data)
             
         except Exception as e:
             self.logger.error(f"Error logging webhook event: {e}")
-            return False
+            return None
     
     async def mark_webhook_processed(self, webhook_id: str) -> bool:
         """Mark webhook as processed"""
         try:
-            result = self.supabase.table('webhook_events').update({
-                "processed": True,
-                "processed_at": datetime.now().isoformat()
-            }).eq('id', webhook_id).execute()
-            
-            return bool(result.data)
+            write_behind.update('webhook_events', 'id', webhook_id, {"processed": True},
+                                timestamp_column='processed_at')
+            return True
             
         except Exception as e:
             self.logger.error(f"Error marking webhook processed: {e}")
@@ -294,69 +431,75 @@ class SupabaseService:
     
     # User Quota Management
     async def check_user_quota(self, user_id: str) -> Dict[str, Any]:
-        """Check user quota and limits"""
+        """Check user quota and limits, usually answered by the in-process quota cache"""
         try:
-            # Get user quota
-            quota_result = self.supabase.table('user_quotas').select('*').eq(
-                'user_id', user_id
-            ).execute()
+            state = await quota_cache.admit(user_id, 0)
+            if not state.get("success"):
+                return {"can_use": False, "error": state.get("error", "No quota found")}
             
-            if not quota_result.data:
-                return {"can_use": False, "error": "No quota found"}
-            
-            quota = quota_result.data[0]
-            
-            # Get active subscription
-            subscription_result = self.supabase.table('user_subscriptions').select(
-                '*, subscription_plans(*)'
-            ).eq('user_id', user_id).eq('status', 'active').execute()
-            
-            if subscription_result.data:
-                subscription = subscription_result.data[0]
-                plan = subscription['subscription_plans']
-                
-                if plan['name'] == 'Unlimited':
-                    return {
-                        "can_use": True,
-                        "hits_remaining": -1,
-                        "subscription_status": "unlimited",
-                        "plan_name": plan['name']
-                    }
-                elif plan['name'] == 'Pro':
-                    remaining = max(0, 1000 - quota['hits_used_this_month'])
-                    return {
-                        "can_use": remaining > 0,
-                        "hits_remaining": remaining,
-                        "subscription_status": "pro",
-                        "plan_name": plan['name']
-                    }
-            
-            # Free plan
-            remaining = max(0, 7 - quota['hits_used_today'])
             return {
-                "can_use": remaining > 0,
-                "hits_remaining": remaining,
-                "subscription_status": "free",
-                "plan_name": "Free"
+                "can_use": state["hits_remaining"] != 0,
+                "hits_remaining": state["hits_remaining"],
+                "daily_limit": state["daily_limit"],
+                "monthly_limit": state["monthly_limit"],
+                "plan_name": state["plan_name"]
             }
             
         except Exception as e:
             self.logger.error(f"Error checking user quota: {e}")
             return {"can_use": False, "error": str(e)}
     
+    async def get_quota_status(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Usage and limits straight from Postgres in a single round trip, bypassing the quota cache"""
+        try:
+            if self.connection_pool:
+                # Prepared once per pooled connection by asyncpg's statement cache
+                row = await self.connection_pool.fetchrow(QUOTA_STATUS_QUERY, user_id)
+                return _record(row)
+            
+            result = await self._execute(self.supabase.rpc('get_quota_status', {'p_user_id': user_id}))
+            return result.data[0] if result.data else None
+            
+        except Exception as e:
+            self.logger.error(f"Error getting quota status: {e}")
+            return None
+    
+    async def consume_quota(self, user_id: str, hits: int = 1) -> Optional[Dict[str, Any]]:
+        """Consume hits from one user's quota if they fit; returns the refreshed quota row"""
+        if self.connection_pool:
+            return _record(await self.connection_pool.fetchrow(CONSUME_QUOTA_QUERY, user_id, hits))
+        
+        result = await self._execute(self.supabase.rpc('consume_quota', {'p_user_id': user_id, 'p_hits': hits}))
+        return result.data[0] if result.data else None
+    
+    async def apply_quota_usage(self, usage: Dict[str, int]) -> List[Dict[str, Any]]:
+        """Add already-admitted hits for many users in one statement; returns their refreshed rows"""
+        user_ids = list(usage)
+        hits = [usage[user_id] for user_id in user_ids]
+        if self.connection_pool:
+            rows = await self.connection_pool.fetch(APPLY_QUOTA_USAGE_QUERY, user_ids, hits)
+            return [_record(row) for row in rows]
+        
+        result = await self._execute(self.supabase.rpc('apply_quota_usage', {'p_user_ids': user_ids, 'p_hits': hits}))
+        return result.data or []
+    
     async def increment_usage(self, user_id: str) -> bool:
-        """Increment user usage count"""
+        """Consume one hit from the user's quota; False when it is used up"""
         try:
-            # This will be handled by database triggers
-            # For now, we'll just log the usage
+            # Admitted hits are written to user_quotas in batches by the quota cache
+            state = await quota_cache.admit(user_id, 1)
+            if not state.get("allowed"):
+                return False
+            
+            # The usage log row is only a record and is written in bulk
             usage_data = {
                 "user_id": user_id,
                 "action_type": "text_rewrite",
                 "created_at": datetime.now().isoformat()
             }
             
-            result = self.supabase.table('usage_logs').insert(usage_data).execute()
-            return bool(result.data)
+            write_behind.insert('usage_logs', usage_data)
+            return True
             
         except Exception as e:
             self.logger.error(f"Error incrementing usage: {e}")
@@ -365,18 +508,68 @@ class SupabaseService:
     async def get_payment_by_order_id(self, merchant_order_id: str) -> Optional[Dict[str, Any]]:
         """Get payment by merchant order ID"""
         try:
-            result = self.supabase.table('payment_transactions').select('*').eq(
+            if self.connection_pool:
+                return _record(await self.connection_pool.fetchrow(SELECT_PAYMENT_BY_ORDER_ID, merchant_order_id))
+            
+            result = await self._execute(self.supabase.table('payment_transactions').select('*').eq(
                 'phonepe_merchant_order_id', merchant_order_id
-            ).execute()
+            ))
             
             return result.data[0] if result.data else None
             
         except Exception as e:
             self.logger.error(f"Error getting payment: {e}")
             return None
+    
+    async def get_pending_payments(self, created_before: datetime, after: Optional[Tuple[str, str]] = None,
+                                   limit: int = 200) -> List[Dict[str, Any]]:
+        """One keyset page of pending payments older than created_before, after (created_at, id)"""
+        if self.connection_pool:
+            after_created_at, after_id = after or (datetime.min.replace(tzinfo=timezone.utc), UUID(int=0))
+            rows = await self.connection_pool.fetch(
+                SELECT_PENDING_PAYMENTS, created_before, _timestamp(after_created_at), UUID(str(after_id)), limit
+            )
+            return [_record(row) for row in rows]
+        
+        query = self.supabase.table('payment_transactions').select(
+            'id, phonepe_merchant_order_id, created_at'
+        ).eq('status', 'pending').lt('created_at', created_before.isoformat())
+        if after:
+            after_created_at, after_id = after
+            query = query.or_(
+                f'created_at.gt."{after_created_at}",and(created_at.eq."{after_created_at}",id.gt.{after_id})'
+            )
+        result = await self._execute(query.order('created_at').order('id').limit(limit))
+        return result.data or []
+    
+    async def update_payment_statuses(self, updates: List[Tuple[str, Dict[str, Any]]]) -> int:
+        """Apply many (merchant_order_id, status_data) results; returns how many payments matched"""
+        if not updates:
+            return 0
+        
+        if self.connection_pool:
+            async with self.connection_pool.acquire() as conn:
+                async with conn.transaction():
+                    matched = await conn.fetch(
+                        UPDATE_PAYMENT_TRANSACTIONS_BATCH,
+                        [order_id for order_id, _ in updates],
+                        [data.get('payload', {}).get('state') for _, data in updates],
+                        [json.dumps(data.get('payload', {}).get('paymentDetails', [])) for _, data in updates]
+                    )
+                    await conn.executemany(UPDATE_PHONEPE_TRANSACTION, [
+                        (order_id, data.get('payload', {}).get('state'), data.get('payload', {}))
+                        for order_id, data in updates
+                    ])
+            return len(matched)
+        
+        applied = 0
+        for merchant_order_id, status_data in updates:
+            if await self.update_payment_status(merchant_order_id, status_data):
+                applied += 1
+        return applied
 
-# Global Supabase service instance
-supabase_service = SupabaseService()
+# Global Supabase service instance, created on first use
+supabase_service = LazyService(SupabaseService)
 
 # Test connection
 if __name__ == "__main__":
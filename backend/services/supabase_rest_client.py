@@ -2,14 +2,14 @@
 """Supabase REST API client for PhonePe integration"""
 
 import os
-import requests
 import logging
 from typing import Dict, Any, List, Optional
-from dotenv import load_dotenv
 from datetime import datetime
 import json
-
-load_dotenv()
+from .cache import TTLCache
+from .http_pool import get_async_pool, get_sync_pool
+from .lazy import LazyService
+from .write_behind import write_behind
 
 class SupabaseRestService:
     """Supabase REST API service for Lekhak AI PhonePe integration"""
@@ -31,65 +31,92 @@ class SupabaseRestService:
             "Content-Type": "application/json",
             "Prefer": "return=representation"
         }
+        
+        # Keep-alive pools so PostgREST calls reuse TCP+TLS connections
+        self.http_pool = get_sync_pool("supabase")
+        self.async_http_pool = get_async_pool("supabase")
+        
+        # extension_id -> user row, so repeat identifications skip the database
+        self.user_cache = TTLCache(
+            max_entries=int(os.getenv('USER_CACHE_MAX_ENTRIES', '50000')),
+            ttl_seconds=float(os.getenv('USER_CACHE_TTL_SECONDS', '300'))
+        )
+        self.plan_cache = TTLCache(max_entries=1, ttl_seconds=float(os.getenv('PLAN_CATALOG_TTL_SECONDS', '3600')))
     
-    def _make_request(self, method: str, endpoint: str, data: Dict = None, params: Dict = None) -> Optional[Dict]:
+    def _make_request(self, method: str, endpoint: str, data: Dict = None, params: Dict = None,
+                      headers: Dict = None) -> Optional[Dict]:
         """Make HTTP request to Supabase REST API"""
         try:
             url = f"{self.supabase_url}/rest/v1/{endpoint}"
             
-            response = requests.request(
-                method=method,
-                url=url,
-                headers=self.headers,
+            response = self.http_pool.request(
+                method,
+                url,
+                headers={**self.headers, **headers} if headers else self.headers,
                 json=data if data else None,
                 params=params if params else None,
                 timeout=30
             )
             
-            if response.status_code in [200, 201]:
-                return response.json()
-            else:
-                self.logger.error(f"Supabase API error: {response.status_code} - {response.text}")
-                return None
+            return self._parse_response(response)
                 
         except Exception as e:
             self.logger.error(f"Supabase request error: {e}")
             return None
     
+    async def _make_request_async(self, method: str, endpoint: str, data: Dict = None, params: Dict = None,
+                                  headers: Dict = None) -> Optional[Dict]:
+        """Make non-blocking HTTP request to Supabase REST API"""
+        try:
+            url = f"{self.supabase_url}/rest/v1/{endpoint}"
+            
+            response = await self.async_http_pool.request(
+                method,
+                url,
+                headers={**self.headers, **headers} if headers else self.headers,
+                json=data if data else None,
+                params=params if params else None,
+                timeout=30
+            )
+            
+            return self._parse_response(response)
+                
+        except Exception as e:
+            self.logger.error(f"Supabase request error: {e}")
+            return None
+    
+    def _parse_response(self, response: Any) -> Optional[Dict]:
+        """Return the JSON body of a successful PostgREST response"""
+        if response.status_code in [200, 201]:
+            return response.json()
+        
+        self.logger.error(f"Supabase API error: {response.status_code} - {response.text}")
+        return None
+    
     # User Management
     def create_or_get_user(self, extension_id: str, email: str = None, name: str = None) -> Dict[str, Any]:
-        """Create or get user by extension ID"""
+        """Create or get user by extension ID with one upsert call, cached by extension ID"""
         try:
-            # Check if user exists
-            users = self._make_request("GET", "users", params={"extension_id": f"eq.{extension_id}"})
+            user = self.user_cache.get(extension_id)
+            if user is not None and (not email or email == user.get('email')) and (not name or name == user.get('name')):
+                return {"success": True, "user": dict(user), "created": False}
             
-            if users and len(users) > 0:
-                user = users[0]
-                self.logger.info(f"User found: {user['id']}")
-                return {"success": True, "user": user, "created": False}
-            
-            # Create new user
-            user_data = {
-                "extension_id": extension_id,
-                "email": email,
-                "name": name,
-                "is_active": True,
-                "created_at": datetime.now().isoformat(),
-                "last_seen": datetime.now().isoformat()
-            }
+            # Finds or creates the user and its quota row (see upsert_user in database_schema_performance.sql)
+            result = self._make_request("POST", "rpc/upsert_user", data={
+                "p_extension_id": extension_id,
+                "p_email": email,
+                "p_name": name
+            })
             
-            result = self._make_request("POST", "users", data=user_data)
+            if not result:
+                return {"success": False, "error": "Failed to create user"}
             
-            if result and len(result) > 0:
-                user = result[0]
-                
-                # Create initial quota
-                self.create_user_quota(user['id'])
-                
+            user = result[0]
+            created = user.pop('created', False)
+            self.user_cache.set(extension_id, user)
+            if created:
                 self.logger.info(f"User created: {user['id']}")
-                return {"success": True, "user": user, "created": True}
-            else:
-                return {"success": False, "error": "Failed to create user"}
+            return {"success": True, "user": dict(user), "created": created}
                 
         except Exception as e:
             self.logger.error(f"Error creating/getting user: {e}")
@@ -217,17 +244,96 @@ class SupabaseRestService:
             self.logger.error(f"Error getting payment: {e}")
             return None
     
-    def get_subscription_plans(self) -> List[Dict[str, Any]]:
-        """Get all subscription plans"""
+    def get_subscription_plans(self, refresh: bool = False) -> List[Dict[str, Any]]:
+        """Get all subscription plans, cached for PLAN_CATALOG_TTL_SECONDS"""
         try:
-            plans = self._make_request("GET", "subscription_plans", params={"is_active": "eq.true"})
+            plans = None if refresh else self.plan_cache.get("active")
+            if plans is None:
+                plans = self._make_request("GET", "subscription_plans", params={"is_active": "eq.true"})
+                if plans:
+                    self.plan_cache.set("active", plans)
             return plans or []
         except Exception as e:
             self.logger.error(f"Error getting subscription plans: {e}")
             return []
+    
+    # Bulk Writes (write-behind sink)
+    async def insert_rows(self, table: str, rows: List[Dict[str, Any]]) -> bool:
+        """Insert many rows with one PostgREST array body per distinct column set"""
+        # PostgREST takes the columns of an array insert from its first object
+        groups: Dict[tuple, List[Dict[str, Any]]] = {}
+        for row in rows:
+            groups.setdefault(tuple(sorted(row)), []).append(row)
+        
+        for group in groups.values():
+            response = await self.async_http_pool.request(
+                "POST",
+                f"{self.supabase_url}/rest/v1/{table}",
+                headers={**self.headers, "Prefer": "return=minimal"},
+                content=json.dumps(group, default=str),
+                timeout=30
+            )
+            if response.status_code not in [200, 201, 204]:
+                self.logger.error(f"Supabase bulk insert into {table} failed: {response.status_code} - {response.text}")
+                return False
+        return True
+    
+    async def update_rows(self, table: str, key_column: str, keys: List[str], values: Dict[str, Any]) -> bool:
+        """Apply the same update to every row whose key_column is in keys, in one PATCH"""
+        quoted = ",".join('"' + str(key).replace('\\', '\\\\').replace('"', '\\"') + '"' for key in keys)
+        response = await self.async_http_pool.request(
+            "PATCH",
+            f"{self.supabase_url}/rest/v1/{table}",
+            headers={**self.headers, "Prefer": "return=minimal"},
+            params={key_column: f"in.({quoted})"},
+            content=json.dumps(values, default=str),
+            timeout=30
+        )
+        if response.status_code not in [200, 204]:
+            self.logger.error(f"Supabase bulk update of {table} failed: {response.status_code} - {response.text}")
+            return False
+        return True
+    
+    # Webhook Deduplication
+    async def claim_webhook_event(self, dedup_key: str, event_type: str, payload: Dict[str, Any]) -> Optional[bool]:
+        """Record a webhook under its dedup key; True if new, False if a duplicate, None on error"""
+        event_record = {
+            "dedup_key": dedup_key,
+            "event_type": event_type or "unknown",
+            "merchant_order_id": payload.get("merchantOrderId"),
+            "phonepe_order_id": payload.get("orderId"),
+            "payload": payload
+        }
+        
+        # ignore-duplicates turns a unique violation into an empty result instead of a 409
+        result = await self._make_request_async(
+            "POST",
+            "webhook_events",
+            data=event_record,
+            params={"on_conflict": "dedup_key"},
+            headers={"Prefer": "return=representation,resolution=ignore-duplicates"}
+        )
+        
+        if result is None:
+            return None
+        return len(result) > 0
+    
+    async def release_webhook_event(self, dedup_key: str) -> bool:
+        """Remove an unprocessed webhook claim so a redelivery is handled again"""
+        result = await self._make_request_async(
+            "DELETE",
+            "webhook_events",
+            params={"dedup_key": f"eq.{dedup_key}", "processed": "eq.false"}
+        )
+        return result is not None
+    
+    def mark_webhook_event_processed(self, dedup_key: str) -> None:
+        """Buffer the processed flag for a claimed webhook; written with the next bulk flush"""
+        write_behind.update('webhook_events', 'dedup_key', dedup_key, {"processed": True},
+                            timestamp_column='processed_at')
 
-# Global Supabase service instance
-supabase_service = SupabaseRestService()
+# Global Supabase service instance, created on first use
+supabase_service = LazyService(SupabaseRestService)
 
 # Test connection
 if __name__ == "__main__":
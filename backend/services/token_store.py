@@ -0,0 +1,231 @@
+"""Shared PhonePe OAuth token stores for multi-worker and serverless deployments"""
+
+import os
+import json
+import time
+import sqlite3
+import tempfile
+import threading
+import logging
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import ContextManager, Dict, Any, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX platforms
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class TokenStore(ABC):
+    """Base token store: holds one OAuth token per key plus a refresh lock"""
+
+    def __init__(self, key: str = "default"):
+        self.key = key
+
+    @abstractmethod
+    def load(self) -> Optional[Dict[str, Any]]:
+        """Return the stored token as {"access_token", "expires_at"} or None"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def save(self, access_token: str, expires_at: float) -> None:
+        """Store a token with its expiry as an epoch timestamp"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def refresh_lock(self, blocking: bool = True) -> ContextManager[bool]:
+        """Hold the lock that serializes token refreshes; yields whether it was acquired"""
+        raise NotImplementedError
+
+    def get_valid(self, min_ttl_seconds: float = 0) -> Optional[Dict[str, Any]]:
+        """Return the stored token if it stays valid for at least min_ttl_seconds"""
+        token = self.load()
+        if token and token.get("access_token") and token.get("expires_at", 0) - time.time() > min_ttl_seconds:
+            return token
+        return None
+
+
+class MemoryTokenStore(TokenStore):
+    """In-process token store shared by every auth service in the worker"""
+
+    def __init__(self, key: str = "default"):
+        super().__init__(key)
+        self._token = None
+        self._lock = threading.Lock()
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        return dict(self._token) if self._token else None
+
+    def save(self, access_token: str, expires_at: float) -> None:
+        self._token = {"access_token": access_token, "expires_at": float(expires_at)}
+
+    @contextmanager
+    def refresh_lock(self, blocking: bool = True) -> Iterator[bool]:
+        acquired = self._lock.acquire(blocking)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                self._lock.release()
+
+
+@contextmanager
+def _flock(lock_path: str, blocking: bool) -> Iterator[bool]:
+    """Exclusive advisory lock on a lock file, shared across processes on one host"""
+    if fcntl is None:
+        yield True
+        return
+
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+    acquired = False
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            acquired = True
+        except BlockingIOError:
+            acquired = False
+        yield acquired
+    finally:
+        if acquired:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+class FileTokenStore(TokenStore):
+    """JSON file token store for one host or a warm serverless /tmp
+
+    Writers replace the file atomically (temp file + rename), so readers never
+    see a partial token, and refreshes are serialized with flock on a sibling
+    lock file.
+    """
+
+    def __init__(self, path: str, key: str = "default"):
+        super().__init__(key)
+        self.path = path
+        self.lock_path = f"{path}.lock"
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        token = data.get(self.key)
+        return token if isinstance(token, dict) else None
+
+    def save(self, access_token: str, expires_at: float) -> None:
+        directory = os.path.dirname(os.path.abspath(self.path))
+
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+
+        data[self.key] = {"access_token": access_token, "expires_at": float(expires_at)}
+
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".token-")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp_path, 0o600)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    @contextmanager
+    def refresh_lock(self, blocking: bool = True) -> Iterator[bool]:
+        with _flock(self.lock_path, blocking) as acquired:
+            yield acquired
+
+
+class SQLiteTokenStore(TokenStore):
+    """SQLite token store; WAL mode lets many worker processes read concurrently"""
+
+    def __init__(self, path: str, key: str = "default"):
+        super().__init__(key)
+        self.path = path
+        self.lock_path = f"{path}.lock"
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS oauth_tokens ("
+                    "key TEXT PRIMARY KEY, access_token TEXT NOT NULL, expires_at REAL NOT NULL)"
+                )
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=5)
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        try:
+            conn = self._connect()
+            try:
+                row = conn.execute(
+                    "SELECT access_token, expires_at FROM oauth_tokens WHERE key = ?", (self.key,)
+                ).fetchone()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"Token store read failed: {e}")
+            return None
+
+        return {"access_token": row[0], "expires_at": row[1]} if row else None
+
+    def save(self, access_token: str, expires_at: float) -> None:
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO oauth_tokens (key, access_token, expires_at) VALUES (?, ?, ?)",
+                    (self.key, access_token, float(expires_at))
+                )
+        finally:
+            conn.close()
+
+    @contextmanager
+    def refresh_lock(self, blocking: bool = True) -> Iterator[bool]:
+        with _flock(self.lock_path, blocking) as acquired:
+            yield acquired
+
+
+def create_token_store(backend: Optional[str] = None, path: Optional[str] = None, key: str = "default") -> TokenStore:
+    """Create a token store from PHONEPE_TOKEN_STORE / PHONEPE_TOKEN_STORE_PATH"""
+    backend = (backend or os.getenv('PHONEPE_TOKEN_STORE', 'memory')).lower()
+    path = path or os.getenv('PHONEPE_TOKEN_STORE_PATH')
+    tmp_dir = tempfile.gettempdir()
+
+    if backend == 'file':
+        return FileTokenStore(path or os.path.join(tmp_dir, 'lekhak_phonepe_token.json'), key)
+    if backend == 'sqlite':
+        return SQLiteTokenStore(path or os.path.join(tmp_dir, 'lekhak_phonepe_token.db'), key)
+    if backend == 'memory':
+        return MemoryTokenStore(key)
+
+    raise ValueError(f"Unknown token store backend: {backend}")
+
+
+_default_stores: Dict[str, TokenStore] = {}
+_default_stores_lock = threading.Lock()
+
+
+def get_default_token_store(key: str = "default") -> TokenStore:
+    """Get the process-wide token store for a key, shared by all auth services"""
+    with _default_stores_lock:
+        if key not in _default_stores:
+            _default_stores[key] = create_token_store(key=key)
+        return _default_stores[key]
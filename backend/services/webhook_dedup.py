@@ -0,0 +1,125 @@
+import os
+import hashlib
+import logging
+from typing import Any, Dict, Optional
+
+from .cache import TTLCache
+
+# Payload fields that identify what an event is about, most specific first
+DEDUP_ID_FIELDS = (
+    'merchantRefundId',
+    'refundId',
+    'merchantOrderId',
+    'settlementId',
+    'disputeId',
+    'subscriptionId',
+    'paylinkId',
+)
+
+
+def build_dedup_key(event_class: str, webhook_data: Dict[str, Any], webhook_body: bytes) -> str:
+    """Key a webhook on (event class, entity id, state), or on a body digest when it has no id"""
+    payload = webhook_data.get('payload') or {}
+
+    for field in DEDUP_ID_FIELDS:
+        entity_id = payload.get(field)
+        if entity_id:
+            return f"{event_class}:{entity_id}:{payload.get('state') or ''}"
+
+    return f"sha256:{hashlib.sha256(webhook_body).hexdigest()}"
+
+
+class SupabaseWebhookIndex:
+    """Persistent dedup index: a unique dedup_key on webhook_events
+
+    Claiming a key inserts the webhook_events row with ignore-duplicates, so the
+    audit row and the dedup check share one PostgREST round trip.
+    """
+
+    def __init__(self, supabase_service):
+        self.supabase_service = supabase_service
+
+    async def claim(self, dedup_key: str, webhook_data: Dict[str, Any]) -> Optional[bool]:
+        """True if the key is new, False if already recorded, None if the index is unavailable"""
+        return await self.supabase_service.claim_webhook_event(
+            dedup_key,
+            webhook_data.get('event'),
+            webhook_data.get('payload') or {}
+        )
+
+    async def release(self, dedup_key: str) -> None:
+        """Drop a claimed key so a redelivery of a failed event is processed again"""
+        await self.supabase_service.release_webhook_event(dedup_key)
+
+    def mark_processed(self, dedup_key: str) -> None:
+        """Flag the claimed row as processed (buffered, no round trip)"""
+        self.supabase_service.mark_webhook_event_processed(dedup_key)
+
+
+class WebhookDeduplicator:
+    """Bounded LRU/TTL front over an optional persistent dedup index"""
+
+    def __init__(self, ttl_seconds: float = 86400, max_entries: int = 100000, index: Optional[Any] = None):
+        self.recent = TTLCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self.index = index
+        self.logger = logging.getLogger(__name__)
+
+        self.duplicates = 0
+        self.index_duplicates = 0
+
+    @classmethod
+    def from_env(cls) -> "WebhookDeduplicator":
+        """Create a deduplicator from WEBHOOK_DEDUP_* environment variables"""
+        return cls(
+            ttl_seconds=float(os.getenv('WEBHOOK_DEDUP_TTL_SECONDS', '86400')),
+            max_entries=int(os.getenv('WEBHOOK_DEDUP_MAX_ENTRIES', '100000')),
+        )
+
+    async def check_and_record(self, dedup_key: str, webhook_data: Dict[str, Any]) -> bool:
+        """Record a key; returns True if it was already seen"""
+        if dedup_key in self.recent:
+            self.duplicates += 1
+            return True
+
+        # Claim locally before awaiting the index so concurrent redeliveries dedup too
+        self.recent.set(dedup_key, True)
+
+        if self.index is not None:
+            try:
+                is_new = await self.index.claim(dedup_key, webhook_data)
+            except Exception as e:
+                self.logger.warning(f"Webhook dedup index unavailable: {e}")
+                is_new = None
+
+            if is_new is False:
+                self.duplicates += 1
+                self.index_duplicates += 1
+                return True
+
+        return False
+
+    async def forget(self, dedup_key: str) -> None:
+        """Forget a key whose processing failed, so the gateway's retry is not dropped"""
+        self.recent.pop(dedup_key)
+
+        if self.index is not None:
+            try:
+                await self.index.release(dedup_key)
+            except Exception as e:
+                self.logger.warning(f"Failed to release webhook dedup key {dedup_key}: {e}")
+
+    def mark_processed(self, dedup_key: str) -> None:
+        """Record that the event behind a key was applied"""
+        if self.index is not None:
+            try:
+                self.index.mark_processed(dedup_key)
+            except Exception as e:
+                self.logger.warning(f"Failed to mark webhook {dedup_key} processed: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "duplicates": self.duplicates,
+            "index_duplicates": self.index_duplicates,
+            "persistent_index": self.index is not None,
+            "recent": self.recent.get_stats()
+        }
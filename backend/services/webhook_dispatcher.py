@@ -0,0 +1,157 @@
+import time
+import zlib
+import asyncio
+import itertools
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# Payload fields that identify the order an event belongs to, most specific first.
+# Refund events carry the original order id, so they stay ordered with its payment events.
+ORDER_KEY_FIELDS = (
+    'originalMerchantOrderId',
+    'merchantOrderId',
+    'merchantRefundId',
+    'refundId',
+    'subscriptionId',
+    'settlementId',
+    'disputeId',
+)
+
+
+def webhook_order_key(webhook_data: Dict[str, Any]) -> Optional[str]:
+    """Get the ordering key (order or refund id) for a webhook event"""
+    payload = webhook_data.get('payload') or {}
+    for field in ORDER_KEY_FIELDS:
+        value = payload.get(field)
+        if value:
+            return str(value)
+    return None
+
+
+class _Lane:
+    """One FIFO lane and its counters"""
+
+    def __init__(self, index: int, capacity: int):
+        self.index = index
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=capacity)
+        self.task: Optional[asyncio.Task] = None
+        self.processed = 0
+        self.failed = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def get_stats(self) -> Dict[str, Any]:
+        completed = self.processed + self.failed
+        return {
+            "lane": self.index,
+            "depth": self.queue.qsize(),
+            "processed": self.processed,
+            "failed": self.failed,
+            "avg_latency_ms": round(self.latency_total / completed * 1000, 3) if completed else 0.0,
+            "max_latency_ms": round(self.latency_max * 1000, 3)
+        }
+
+
+class ShardedDispatcher:
+    """Hashes event keys onto a fixed set of async lanes
+
+    Events with the same key always land in the same lane and are applied one
+    at a time in submission order; events with different keys run in parallel
+    across lanes, so throughput scales with the lane count.
+    """
+
+    def __init__(self, process_event: Callable[[Dict[str, Any]], Awaitable[None]], lanes: int = 8,
+                 lane_capacity: int = 1000):
+        self.process_event = process_event
+        self.lane_count = max(1, lanes)
+        self.lane_capacity = lane_capacity
+        self.logger = logging.getLogger(__name__)
+
+        self._lanes: List[_Lane] = []
+        self._unkeyed = itertools.count()
+
+    @property
+    def running(self) -> bool:
+        return bool(self._lanes)
+
+    def lane_for(self, key: Optional[str]) -> int:
+        """Lane index for a key; unkeyed events are spread round-robin"""
+        if key is None:
+            return next(self._unkeyed) % self.lane_count
+        return zlib.crc32(key.encode('utf-8')) % self.lane_count
+
+    async def start(self) -> None:
+        """Start one worker task per lane"""
+        if self._lanes:
+            return
+
+        self._lanes = [_Lane(index, self.lane_capacity) for index in range(self.lane_count)]
+        for lane in self._lanes:
+            lane.task = asyncio.ensure_future(self._run_lane(lane))
+        self.logger.info(f"Webhook dispatcher started with {self.lane_count} lanes")
+
+    async def stop(self, drain_timeout: float = 10.0) -> None:
+        """Let lanes drain for up to drain_timeout seconds, then stop them"""
+        if not self._lanes:
+            return
+
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(lane.queue.join() for lane in self._lanes)),
+                timeout=drain_timeout
+            )
+        except asyncio.TimeoutError:
+            self.logger.warning("Webhook dispatcher stopped before draining all lanes")
+
+        for lane in self._lanes:
+            lane.task.cancel()
+        await asyncio.gather(*(lane.task for lane in self._lanes), return_exceptions=True)
+        self._lanes = []
+
+    async def submit(self, key: Optional[str], webhook_data: Dict[str, Any]) -> asyncio.Future:
+        """Queue an event on its lane; the returned future resolves once it has been applied"""
+        if not self._lanes:
+            raise RuntimeError("Webhook dispatcher is not running")
+
+        future = asyncio.get_running_loop().create_future()
+        lane = self._lanes[self.lane_for(key)]
+        await lane.queue.put((webhook_data, future, time.perf_counter()))
+        return future
+
+    async def dispatch(self, key: Optional[str], webhook_data: Dict[str, Any]) -> None:
+        """Submit an event and wait until it has been applied"""
+        future = await self.submit(key, webhook_data)
+        await future
+
+    async def _run_lane(self, lane: _Lane) -> None:
+        while True:
+            webhook_data, future, enqueued_at = await lane.queue.get()
+            try:
+                await self.process_event(webhook_data)
+                lane.processed += 1
+                if not future.done():
+                    future.set_result(None)
+            except asyncio.CancelledError:
+                if not future.done():
+                    future.cancel()
+                raise
+            except Exception as e:
+                lane.failed += 1
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                latency = time.perf_counter() - enqueued_at
+                lane.latency_total += latency
+                lane.latency_max = max(lane.latency_max, latency)
+                lane.queue.task_done()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get per-lane queue depth and latency"""
+        lanes = [lane.get_stats() for lane in self._lanes]
+        return {
+            "lanes": self.lane_count,
+            "queued": sum(lane["depth"] for lane in lanes),
+            "processed": sum(lane["processed"] for lane in lanes),
+            "failed": sum(lane["failed"] for lane in lanes),
+            "per_lane": lanes
+        }
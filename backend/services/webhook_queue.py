@@ -0,0 +1,318 @@
+import os
+import json
+import socket
+import time
+import random
+import sqlite3
+import asyncio
+import tempfile
+import threading
+import logging
+from typing import Any, Callable, Dict, List, Optional, Set
+from .webhook_dispatcher import ShardedDispatcher, webhook_order_key
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+
+def _pid_alive(pid: str) -> bool:
+    """Check whether a process id on this host is still running"""
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except (ValueError, PermissionError):
+        return True
+    return True
+
+
+class WebhookQueue:
+    """Durable local queue of verified webhook bodies backed by SQLite in WAL mode
+
+    Rows move pending -> processing (leased) -> deleted on success, so a restart
+    picks up everything that was acknowledged but not yet applied. An event is
+    only claimed once every earlier event with the same order key has finished,
+    so one waiting out a retry backoff holds back the later events of its order.
+    """
+
+    def __init__(self, path: str, lease_seconds: float = 30, max_attempts: int = 10,
+                 synchronous: str = "NORMAL"):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.logger = logging.getLogger(__name__)
+
+        # Leases are stamped with host:pid so a restart can tell dead owners from live ones
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(f"PRAGMA synchronous={synchronous}")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS webhook_queue ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "body BLOB NOT NULL, "
+            "received_at REAL NOT NULL, "
+            "status TEXT NOT NULL DEFAULT 'pending', "
+            "attempts INTEGER NOT NULL DEFAULT 0, "
+            "available_at REAL NOT NULL, "
+            "leased_until REAL, "
+            "leased_by TEXT, "
+            "last_error TEXT, "
+            "order_key TEXT)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(webhook_queue)")}
+        if "order_key" not in columns:
+            self._conn.execute("ALTER TABLE webhook_queue ADD COLUMN order_key TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_webhook_queue_status ON webhook_queue(status, id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_webhook_queue_order_key ON webhook_queue(order_key, id)")
+
+    @classmethod
+    def from_env(cls) -> "WebhookQueue":
+        """Create a queue from WEBHOOK_QUEUE_* environment variables"""
+        return cls(
+            path=os.getenv('WEBHOOK_QUEUE_PATH', os.path.join(tempfile.gettempdir(), 'lekhak_webhook_queue.db')),
+            lease_seconds=float(os.getenv('WEBHOOK_QUEUE_LEASE_SECONDS', '30')),
+            max_attempts=int(os.getenv('WEBHOOK_QUEUE_MAX_ATTEMPTS', '10')),
+            synchronous=os.getenv('WEBHOOK_QUEUE_SYNCHRONOUS', 'NORMAL'),
+        )
+
+    def enqueue(self, body: bytes, order_key: Optional[str] = None) -> int:
+        """Durably append a verified webhook body; returns its queue id"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO webhook_queue (body, received_at, available_at, order_key) VALUES (?, ?, ?, ?)",
+                (body, now, now, order_key)
+            )
+            return cursor.lastrowid
+
+    def claim(self, limit: int = 1) -> List[Dict[str, Any]]:
+        """Lease up to limit ready events in arrival order, at most one per order key"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT id, body, attempts FROM webhook_queue AS q "
+                    "WHERE ((status = 'pending' AND available_at <= ?) "
+                    "OR (status = 'processing' AND leased_until <= ?)) "
+                    "AND (order_key IS NULL OR NOT EXISTS ("
+                    "SELECT 1 FROM webhook_queue AS e WHERE e.order_key = q.order_key AND e.id < q.id "
+                    "AND e.status IN ('pending', 'processing'))) "
+                    "ORDER BY id LIMIT ?",
+                    (now, now, limit)
+                ).fetchall()
+
+                if rows:
+                    self._conn.executemany(
+                        "UPDATE webhook_queue SET status = 'processing', leased_until = ?, leased_by = ?, "
+                        "attempts = attempts + 1 WHERE id = ?",
+                        [(now + self.lease_seconds, self.owner, row[0]) for row in rows]
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        return [{"id": row[0], "body": row[1], "attempts": row[2] + 1} for row in rows]
+
+    def complete(self, event_id: int) -> None:
+        """Remove an event that was applied successfully"""
+        with self._lock:
+            self._conn.execute("DELETE FROM webhook_queue WHERE id = ?", (event_id,))
+
+    def fail(self, event_id: int, attempts: int, error: str) -> bool:
+        """Return a failed event to the queue with backoff, or park it after max attempts
+
+        Returns True when the event was moved to the dead letter status.
+        """
+        dead = attempts >= self.max_attempts
+        if dead:
+            status, available_at = 'dead', time.time()
+            self.logger.error(f"Webhook queue event {event_id} moved to dead letter after {attempts} attempts: {error}")
+        else:
+            status = 'pending'
+            available_at = time.time() + min(300, 2 ** attempts) * random.uniform(0.5, 1.0)
+
+        with self._lock:
+            self._conn.execute(
+                "UPDATE webhook_queue SET status = ?, available_at = ?, leased_until = NULL, leased_by = NULL, "
+                "last_error = ? "
+                "WHERE id = ?",
+                (status, available_at, error[:1000], event_id)
+            )
+        return dead
+
+    def recover(self) -> int:
+        """Release leases held by dead processes on this host; returns rows recovered
+
+        Leases of other live workers are left alone, and leases from other hosts
+        are reclaimed by claim() once they expire.
+        """
+        host = socket.gethostname()
+        with self._lock:
+            owners = self._conn.execute(
+                "SELECT DISTINCT leased_by FROM webhook_queue WHERE status = 'processing'"
+            ).fetchall()
+
+            dead_owners = []
+            for (owner,) in owners:
+                owner_host, _, owner_pid = (owner or "").rpartition(":")
+                if owner_host == host and owner != self.owner and not _pid_alive(owner_pid):
+                    dead_owners.append(owner)
+
+            recovered = 0
+            for owner in dead_owners:
+                cursor = self._conn.execute(
+                    "UPDATE webhook_queue SET status = 'pending', leased_until = NULL, leased_by = NULL "
+                    "WHERE status = 'processing' AND leased_by = ?",
+                    (owner,)
+                )
+                recovered += cursor.rowcount
+            return recovered
+
+    def get_stats(self) -> Dict[str, int]:
+        """Get queue depth by status"""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM webhook_queue GROUP BY status").fetchall()
+        stats = {"pending": 0, "processing": 0, "dead": 0}
+        stats.update({status: count for status, count in rows})
+        return stats
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class WebhookQueueWorker:
+    """Drains a WebhookQueue into a ShardedDispatcher
+
+    A single claimer reads events in arrival order and hands them to the
+    dispatcher, which keeps events for the same order in sequence while
+    different orders are applied in parallel. With a deduplicator, applied
+    events are marked processed and dead-lettered events release their dedup
+    key, so PhonePe's next redelivery is applied instead of dropped.
+    """
+
+    def __init__(self, queue: WebhookQueue, dispatcher: ShardedDispatcher, max_in_flight: int = 64,
+                 poll_interval: float = 0.5, deduplicator: Optional[Any] = None,
+                 dedup_key: Optional[Callable[[Dict[str, Any], bytes], str]] = None):
+        self.queue = queue
+        self.dispatcher = dispatcher
+        self.deduplicator = deduplicator
+        self.dedup_key = dedup_key
+        self.max_in_flight = max_in_flight
+        self.poll_interval = poll_interval
+        self.logger = logging.getLogger(__name__)
+
+        self.processed = 0
+        self.failed = 0
+        self._task: Optional[asyncio.Task] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._completions: Set[asyncio.Task] = set()
+        self._stopping = False
+
+    async def start(self) -> None:
+        """Recover leases of crashed workers and start draining the queue"""
+        recovered = await asyncio.to_thread(self.queue.recover)
+        if recovered:
+            self.logger.info(f"Recovered {recovered} unfinished webhook events from queue")
+
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        self._task = asyncio.ensure_future(self._run())
+        self.logger.info(f"Webhook queue worker started with {self.max_in_flight} events in flight")
+
+    def notify(self) -> None:
+        """Wake the claimer after an enqueue"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def stop(self) -> None:
+        """Stop claiming and wait for events already handed to the dispatcher"""
+        self._stopping = True
+        self.notify()
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._completions:
+            await asyncio.gather(*self._completions, return_exceptions=True)
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            # Cleared before claiming so a notify() during the claim is not lost
+            self._wakeup.clear()
+            events = await asyncio.to_thread(self.queue.claim, self.max_in_flight)
+
+            if not events:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            # Submit in claim order so each lane sees its events in arrival order
+            for event in events:
+                await self._slots.acquire()
+                await self._submit(event)
+
+    async def _submit(self, event: Dict[str, Any]) -> None:
+        try:
+            webhook_data = event["data"] = _json_loads(event["body"])
+            future = await self.dispatcher.submit(webhook_order_key(webhook_data), webhook_data)
+        except Exception as e:
+            await self._finish(event, e)
+            return
+
+        completion = asyncio.ensure_future(self._await_result(event, future))
+        self._completions.add(completion)
+        completion.add_done_callback(self._completions.discard)
+
+    async def _await_result(self, event: Dict[str, Any], future: asyncio.Future) -> None:
+        try:
+            await future
+        except Exception as e:
+            await self._finish(event, e)
+        else:
+            await self._finish(event, None)
+
+    async def _finish(self, event: Dict[str, Any], error: Optional[Exception]) -> None:
+        try:
+            if error is None:
+                await asyncio.to_thread(self.queue.complete, event["id"])
+                self.processed += 1
+                key = self._event_dedup_key(event)
+                if key is not None:
+                    self.deduplicator.mark_processed(key)
+            else:
+                self.failed += 1
+                self.logger.error(f"Queued webhook {event['id']} failed (attempt {event['attempts']}): {error}")
+                dead = await asyncio.to_thread(self.queue.fail, event["id"], event["attempts"], str(error))
+                key = self._event_dedup_key(event) if dead else None
+                if key is not None:
+                    await self.deduplicator.forget(key)
+        finally:
+            self._slots.release()
+            # The next event of this order may be claimable now
+            self.notify()
+
+    def _event_dedup_key(self, event: Dict[str, Any]) -> Optional[str]:
+        if self.deduplicator is None or self.dedup_key is None or "data" not in event:
+            return None
+        return self.dedup_key(event["data"], event["body"])
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "max_in_flight": self.max_in_flight,
+            "processed": self.processed,
+            "failed": self.failed,
+            "queue": self.queue.get_stats()
+        }
@@ -0,0 +1,277 @@
+import os
+import json
+import uuid
+import asyncio
+import tempfile
+import threading
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def _row_count(operation: Dict[str, Any]) -> int:
+    return len(operation.get("rows") or operation.get("keys") or [])
+
+
+class WriteBehindBuffer:
+    """Collects audit and event rows in memory and writes them in bulk
+
+    Inserts are grouped per table into one array insert, and updates that set
+    the same values are grouped into one PATCH ... ?key=in.(...). Flushes run
+    when a table reaches max_batch rows or every flush_interval seconds. When
+    the sink is unavailable, batches are appended to a local JSONL spill file
+    and replayed on the next successful flush.
+
+    The sink must provide async insert_rows(table, rows) and
+    update_rows(table, key_column, keys, values), each returning True on success.
+    """
+
+    def __init__(self, sink: Optional[Any] = None, max_batch: int = 500, flush_interval: float = 1.0,
+                 spill_path: Optional[str] = None, max_attempts: int = 20):
+        self.sink = sink
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path or os.path.join(tempfile.gettempdir(), 'lekhak_write_behind.jsonl')
+        self.max_attempts = max_attempts
+        self.logger = logging.getLogger(__name__)
+
+        self._lock = threading.Lock()
+        self._inserts: Dict[str, List[Dict[str, Any]]] = {}
+        self._pending_by_id: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._updates: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        self.rows_written = 0
+        self.flushes = 0
+        self.round_trips = 0
+        self.rows_spilled = 0
+        self.rows_replayed = 0
+
+    @classmethod
+    def from_env(cls) -> "WriteBehindBuffer":
+        """Create a buffer from WRITE_BEHIND_* environment variables"""
+        return cls(
+            max_batch=int(os.getenv('WRITE_BEHIND_MAX_BATCH', '500')),
+            flush_interval=float(os.getenv('WRITE_BEHIND_FLUSH_INTERVAL', '1.0')),
+            spill_path=os.getenv('WRITE_BEHIND_SPILL_PATH'),
+            max_attempts=int(os.getenv('WRITE_BEHIND_MAX_ATTEMPTS', '20')),
+        )
+
+    def insert(self, table: str, row: Dict[str, Any]) -> str:
+        """Buffer a row for insertion; returns its id (generated when missing)"""
+        row = dict(row)
+        row.setdefault("id", str(uuid.uuid4()))
+        row.setdefault("created_at", datetime.now().isoformat())
+
+        with self._lock:
+            rows = self._inserts.setdefault(table, [])
+            rows.append(row)
+            self._pending_by_id[(table, row["id"])] = row
+            full = len(rows) >= self.max_batch
+
+        if full:
+            self._wake()
+        return row["id"]
+
+    def update(self, table: str, key_column: str, key: str, values: Dict[str, Any],
+               timestamp_column: Optional[str] = None) -> None:
+        """Buffer an update of the row(s) where key_column = key
+
+        timestamp_column is stamped with the flush time, so updates setting the
+        same values share one PATCH regardless of when they were buffered.
+        """
+        with self._lock:
+            # Still waiting to be inserted: fold the update into the insert itself
+            pending = self._pending_by_id.get((table, key)) if key_column == "id" else None
+            if pending is not None:
+                pending.update(values)
+                if timestamp_column:
+                    pending[timestamp_column] = datetime.now().isoformat()
+                return
+
+            group_key = (table, key_column, json.dumps([values, timestamp_column], sort_keys=True, default=str))
+            group = self._updates.setdefault(group_key, {
+                "values": values, "timestamp_column": timestamp_column, "keys": []
+            })
+            group["keys"].append(key)
+            full = len(group["keys"]) >= self.max_batch
+
+        if full:
+            self._wake()
+
+    def _wake(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return (sum(len(rows) for rows in self._inserts.values())
+                    + sum(len(group["keys"]) for group in self._updates.values()))
+
+    def _take(self) -> List[Dict[str, Any]]:
+        """Swap out buffered writes as a list of operations, inserts before updates"""
+        with self._lock:
+            inserts, self._inserts = self._inserts, {}
+            updates, self._updates = self._updates, {}
+            self._pending_by_id = {}
+
+        stamp = datetime.now().isoformat()
+        operations = []
+        for table, rows in inserts.items():
+            for start in range(0, len(rows), self.max_batch):
+                operations.append({"op": "insert", "table": table, "rows": rows[start:start + self.max_batch]})
+        for (table, key_column, _), group in updates.items():
+            values = dict(group["values"])
+            if group["timestamp_column"]:
+                values[group["timestamp_column"]] = stamp
+            keys = group["keys"]
+            for start in range(0, len(keys), self.max_batch):
+                operations.append({"op": "update", "table": table, "key_column": key_column,
+                                   "keys": keys[start:start + self.max_batch], "values": values})
+        return operations
+
+    async def _apply(self, operation: Dict[str, Any]) -> bool:
+        if self.sink is None:
+            return False
+        try:
+            if operation["op"] == "insert":
+                ok = await self.sink.insert_rows(operation["table"], operation["rows"])
+            else:
+                ok = await self.sink.update_rows(operation["table"], operation["key_column"],
+                                                 operation["keys"], operation["values"])
+        except Exception as e:
+            self.logger.error(f"Write-behind flush to {operation['table']} failed: {e}")
+            ok = False
+
+        self.round_trips += 1
+        if ok:
+            self.rows_written += _row_count(operation)
+        return bool(ok)
+
+    def _spill(self, operations: List[Dict[str, Any]]) -> None:
+        """Append operations that could not be written to the local spill file
+
+        The failing operation is counted; once it reaches max_attempts it is moved
+        to a .dead file so one bad batch cannot hold back the rest forever.
+        """
+        # Without a sink nothing was attempted, so only real write failures count
+        attempts = operations[0].get("attempts", 0) + (1 if self.sink is not None else 0)
+        head = dict(operations[0], attempts=attempts)
+        if attempts >= self.max_attempts:
+            self._append_lines(f"{self.spill_path}.dead", [head])
+            self.logger.error(f"Write-behind batch for {head['table']} dead-lettered after {head['attempts']} attempts")
+            operations = operations[1:]
+        else:
+            operations = [head] + operations[1:]
+
+        if operations:
+            self._append_lines(self.spill_path, operations)
+            spilled = sum(_row_count(operation) for operation in operations)
+            self.rows_spilled += spilled
+            self.logger.warning(f"Write-behind sink unavailable, spilled {spilled} rows to {self.spill_path}")
+
+    def _append_lines(self, path: str, operations: List[Dict[str, Any]]) -> None:
+        with open(path, 'a', encoding='utf-8') as spill:
+            for operation in operations:
+                spill.write(json.dumps(operation, default=str) + "\n")
+            spill.flush()
+            os.fsync(spill.fileno())
+
+    def _take_spill(self) -> List[Dict[str, Any]]:
+        """Claim the spill file for replay by renaming it away"""
+        if not os.path.exists(self.spill_path):
+            return []
+
+        replay_path = f"{self.spill_path}.{os.getpid()}.replay"
+        try:
+            os.replace(self.spill_path, replay_path)
+        except FileNotFoundError:
+            return []
+
+        operations = []
+        with open(replay_path, 'r', encoding='utf-8') as spill:
+            for line in spill:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    operations.append(json.loads(line))
+                except ValueError:
+                    self.logger.error("Skipping corrupt write-behind spill line")
+        os.remove(replay_path)
+        return operations
+
+    async def flush(self) -> int:
+        """Write spilled backlog then everything buffered; returns rows written"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+
+        async with self._flush_lock:
+            written_before = self.rows_written
+            backlog = await asyncio.to_thread(self._take_spill) if self.sink is not None else []
+            operations = backlog + self._take()
+            if not operations:
+                return 0
+
+            # Apply in order and stop at the first failure so an update never overtakes its insert
+            for index, operation in enumerate(operations):
+                if not await self._apply(operation):
+                    await asyncio.to_thread(self._spill, operations[index:])
+                    break
+                if index < len(backlog):
+                    self.rows_replayed += _row_count(operation)
+
+            self.flushes += 1
+            return self.rows_written - written_before
+
+    async def start(self) -> None:
+        """Start the periodic flush task"""
+        if self._task is not None:
+            return
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.ensure_future(self._run())
+        self.logger.info(f"Write-behind buffer started (batch {self.max_batch}, every {self.flush_interval}s)")
+
+    async def stop(self) -> None:
+        """Stop the flush task and write out everything still buffered"""
+        # Let an in-progress flush finish rather than cancelling it mid-write
+        if self._task is not None:
+            self._stopping = True
+            self._wake()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            self._wakeup = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._stopping:
+                break
+            try:
+                await self.flush()
+            except Exception as e:
+                self.logger.error(f"Write-behind flush error: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "pending": self.pending_count(),
+            "rows_written": self.rows_written,
+            "flushes": self.flushes,
+            "round_trips": self.round_trips,
+            "rows_spilled": self.rows_spilled,
+            "rows_replayed": self.rows_replayed,
+            "spill_backlog": os.path.exists(self.spill_path)
+        }
+
+
+# Global write-behind buffer; the sink is attached at application startup
+write_behind = WriteBehindBuffer.from_env()
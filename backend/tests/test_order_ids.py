@@ -0,0 +1,98 @@
+import os
+
+import pytest
+
+from services import order_ids as order_ids_module
+from services.order_ids import SEQUENCE_LIMIT, OrderIdGenerator
+
+
+class FakeClock:
+    def __init__(self, ms: int):
+        self.ms = ms
+
+    def __call__(self) -> float:
+        return self.ms / 1000
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock(1_700_000_000_000)
+    monkeypatch.setattr(order_ids_module.time, 'time', fake)
+    return fake
+
+
+def test_ids_strictly_increase_within_a_process():
+    generator = OrderIdGenerator()
+    ids = [generator.order_id() for _ in range(20000)]
+
+    assert ids == sorted(ids)
+    assert len(set(ids)) == len(ids)
+    assert all(len(generated) <= 63 for generated in ids)
+
+
+def test_ids_carry_their_timestamp(clock):
+    generator = OrderIdGenerator(worker_id=7)
+
+    assert OrderIdGenerator.timestamp_ms(generator.order_id()) == clock.ms
+    assert OrderIdGenerator.timestamp_ms(generator.refund_id()) == clock.ms
+
+
+def test_clock_regression_does_not_repeat_or_go_backwards(clock):
+    generator = OrderIdGenerator(worker_id=7)
+    before = [generator.order_id() for _ in range(5)]
+
+    clock.ms -= 5000
+    after = [generator.order_id() for _ in range(5)]
+
+    ids = before + after
+    assert ids == sorted(ids)
+    assert len(set(ids)) == len(ids)
+    assert generator.clock_regressions == 1
+
+
+def test_sequence_rollover_borrows_the_next_millisecond(clock):
+    generator = OrderIdGenerator(worker_id=7)
+    first = generator.order_id()
+    generator._sequence = SEQUENCE_LIMIT - 2
+
+    ids = [first] + [generator.order_id() for _ in range(4)]
+
+    assert ids == sorted(ids)
+    assert len(set(ids)) == len(ids)
+    assert generator.sequence_rollovers == 1
+    assert OrderIdGenerator.timestamp_ms(ids[-1]) == clock.ms + 1
+
+    # Once the real clock catches up, IDs keep increasing past the borrowed millisecond
+    clock.ms += 1
+    assert generator.order_id() > ids[-1]
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason="requires os.fork")
+def test_forked_child_gets_a_fresh_worker():
+    generator = OrderIdGenerator()
+    parent_id = generator.order_id()
+
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.close(read_end)
+            os.write(write_end, f"{generator.worker_id} {generator.order_id()}".encode())
+        finally:
+            os._exit(0)
+
+    os.close(write_end)
+    with os.fdopen(read_end) as pipe:
+        child_worker_id, child_id = pipe.read().split()
+    os.waitpid(pid, 0)
+
+    assert int(child_worker_id) != generator.worker_id
+    assert child_id != parent_id
+    assert child_id[7 + 10:7 + 18] != parent_id[7 + 10:7 + 18]
+
+
+def test_pinned_worker_id_survives_fork_reset():
+    generator = OrderIdGenerator(worker_id=42)
+    generator._reset()
+
+    assert generator.worker_id == 42
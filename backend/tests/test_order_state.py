@@ -0,0 +1,74 @@
+import pytest
+
+from services import order_state as order_state_module
+from services.order_state import OrderStateStore
+
+
+class FakeWriteBehind:
+    def __init__(self):
+        self.updates = []
+
+    def update(self, table, key_column, key, values, timestamp_column=None):
+        self.updates.append((table, key, values["state"]))
+
+
+class FakeStatusCache:
+    """PaymentStatusCache stand-in returning a fixed gateway state"""
+
+    def __init__(self, state: str):
+        self.state = state
+        self.calls = 0
+        self.invalidated = []
+
+    async def get(self, merchant_order_id, include_details=True):
+        self.calls += 1
+        return {"success": True, "state": self.state, "status_data": {"payload": {"state": self.state}}}
+
+    def invalidate(self, merchant_order_id):
+        self.invalidated.append(merchant_order_id)
+
+
+@pytest.fixture
+def write_behind(monkeypatch):
+    fake = FakeWriteBehind()
+    monkeypatch.setattr(order_state_module, 'write_behind', fake)
+    return fake
+
+
+@pytest.mark.parametrize("terminal", ["COMPLETED", "FAILED"])
+@pytest.mark.parametrize("source", ["webhook", "gateway"])
+def test_terminal_state_is_never_replaced_by_a_non_terminal_one(write_behind, terminal, source):
+    store = OrderStateStore(FakeStatusCache("PENDING"))
+    assert store.record("LEKHAK_1", terminal, {}, source='webhook')
+
+    assert not store.record("LEKHAK_1", "PENDING", {}, source=source)
+
+    assert store.get("LEKHAK_1")["state"] == terminal
+    assert write_behind.updates == [("phonepe_transactions", "LEKHAK_1", terminal)]
+
+
+def test_non_terminal_states_move_forward(write_behind):
+    store = OrderStateStore(FakeStatusCache("PENDING"))
+
+    assert store.record("LEKHAK_1", "PENDING", {})
+    assert store.record("LEKHAK_1", "COMPLETED", {})
+
+    assert store.get("LEKHAK_1")["state"] == "COMPLETED"
+
+
+@pytest.mark.asyncio
+async def test_stale_gateway_answer_does_not_reopen_a_terminal_order(write_behind):
+    status_cache = FakeStatusCache("PENDING")
+    store = OrderStateStore(status_cache)
+
+    # The gateway still reports PENDING when the status poll races the webhook
+    assert (await store.get_status("LEKHAK_1"))["state"] == "PENDING"
+    store.record("LEKHAK_1", "COMPLETED", {"state": "COMPLETED"}, source='webhook')
+    store.record("LEKHAK_1", "PENDING", {"state": "PENDING"}, source='gateway')
+
+    result = await store.get_status("LEKHAK_1")
+
+    assert result["state"] == "COMPLETED"
+    assert result["source"] == "webhook"
+    assert status_cache.calls == 1
+    assert store.local_answers == 1
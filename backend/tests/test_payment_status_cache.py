@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+
+from services.payment_status_cache import PaymentStatusCache
+
+
+class FakeGateway:
+    """check_payment_status stand-in that holds every call until released"""
+
+    def __init__(self, state: str = "PENDING"):
+        self.state = state
+        self.calls = 0
+        self.release = asyncio.Event()
+        self.error = None
+
+    async def __call__(self, merchant_order_id: str, include_details: bool = True):
+        self.calls += 1
+        await self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return {"success": True, "state": self.state, "merchant_order_id": merchant_order_id}
+
+
+@pytest.mark.asyncio
+async def test_concurrent_lookups_share_one_upstream_call():
+    gateway = FakeGateway()
+    cache = PaymentStatusCache(gateway)
+
+    lookups = [asyncio.ensure_future(cache.get("LEKHAK_1")) for _ in range(50)]
+    await asyncio.sleep(0)
+    gateway.release.set()
+    results = await asyncio.gather(*lookups)
+
+    assert gateway.calls == 1
+    assert all(result["state"] == "PENDING" for result in results)
+    assert cache.misses == 1
+    assert cache.coalesced == 49
+
+
+@pytest.mark.asyncio
+async def test_different_orders_are_not_coalesced():
+    gateway = FakeGateway()
+    gateway.release.set()
+    cache = PaymentStatusCache(gateway)
+
+    await asyncio.gather(cache.get("LEKHAK_1"), cache.get("LEKHAK_2"))
+
+    assert gateway.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_waiters_see_the_upstream_error_and_nothing_is_cached():
+    gateway = FakeGateway()
+    gateway.error = RuntimeError("gateway down")
+    cache = PaymentStatusCache(gateway)
+
+    lookups = [asyncio.ensure_future(cache.get("LEKHAK_1")) for _ in range(3)]
+    await asyncio.sleep(0)
+    gateway.release.set()
+    results = await asyncio.gather(*lookups, return_exceptions=True)
+
+    assert gateway.calls == 1
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+    gateway.error = None
+    assert (await cache.get("LEKHAK_1"))["success"]
+    assert gateway.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_terminal_results_are_cached_and_answer_summary_lookups():
+    gateway = FakeGateway(state="COMPLETED")
+    gateway.release.set()
+    cache = PaymentStatusCache(gateway, pending_ttl_seconds=0)
+
+    await cache.get("LEKHAK_1", include_details=True)
+    await cache.get("LEKHAK_1", include_details=True)
+    await cache.get("LEKHAK_1", include_details=False)
+
+    assert gateway.calls == 1
+    assert cache.hits == 2
+
+    cache.invalidate("LEKHAK_1")
+    await cache.get("LEKHAK_1")
+    assert gateway.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_pending_results_expire_quickly():
+    gateway = FakeGateway(state="PENDING")
+    gateway.release.set()
+    cache = PaymentStatusCache(gateway, pending_ttl_seconds=0)
+
+    await cache.get("LEKHAK_1")
+    await cache.get("LEKHAK_1")
+
+    assert gateway.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_cancelled_leader_does_not_hang_coalesced_waiters():
+    gateway = FakeGateway()
+    cache = PaymentStatusCache(gateway)
+
+    leader = asyncio.ensure_future(cache.get("LEKHAK_1"))
+    await asyncio.sleep(0)
+    waiters = [asyncio.ensure_future(cache.get("LEKHAK_1")) for _ in range(3)]
+    await asyncio.sleep(0)
+    leader.cancel()
+    await asyncio.sleep(0)
+    gateway.release.set()
+
+    results = await asyncio.wait_for(asyncio.gather(*waiters), timeout=1)
+
+    # One waiter takes over the lookup and the others join it
+    assert all(result["success"] for result in results)
+    assert gateway.calls == 2
+    assert leader.cancelled()
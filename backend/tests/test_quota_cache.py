@@ -0,0 +1,40 @@
+import asyncio
+
+import pytest
+
+from services.quota_cache import QuotaCache
+
+
+class SlowEngine:
+    """QuotaEngine stand-in whose consume() waits until released"""
+
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.calls = 0
+
+    async def consume(self, user_id, hits=1):
+        self.calls += 1
+        await self.release.wait()
+        return {"success": True, "allowed": True, "hits_remaining": 7 - hits, "daily_limit": 7,
+                "monthly_limit": -1, "plan_name": "Free"}
+
+
+@pytest.mark.asyncio
+async def test_cancelled_load_does_not_hang_concurrent_admits():
+    engine = SlowEngine()
+    cache = QuotaCache(engine)
+
+    leader = asyncio.ensure_future(cache.admit("user-1"))
+    await asyncio.sleep(0)
+    waiter = asyncio.ensure_future(cache.admit("user-1"))
+    await asyncio.sleep(0)
+    leader.cancel()
+    await asyncio.sleep(0)
+    engine.release.set()
+
+    # The waiter loads again itself instead of waiting on the cancelled load
+    result = await asyncio.wait_for(waiter, timeout=1)
+
+    assert result["allowed"]
+    assert engine.calls == 2
+    assert leader.cancelled()
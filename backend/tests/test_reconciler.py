@@ -0,0 +1,111 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from services import order_state as order_state_module
+from services.order_state import OrderStateStore
+from services.reconciler import PaymentReconciler, payment_reconciler
+from services.payment_status_cache import payment_status_cache
+
+
+class FakeWriteBehind:
+    def __init__(self):
+        self.updates = []
+
+    def update(self, table, key_column, key, values, timestamp_column=None):
+        self.updates.append((table, key, values))
+
+
+class FakeStatusCache:
+    """PaymentStatusCache stand-in: PhonePe reports every order COMPLETED"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def get(self, merchant_order_id, include_details=True):
+        self.calls += 1
+        return {"success": True, "state": "COMPLETED",
+                "status_data": {"payload": {"state": "COMPLETED", "merchantOrderId": merchant_order_id}}}
+
+    def invalidate(self, merchant_order_id):
+        pass
+
+
+class FakeDatabase:
+    def __init__(self, order_ids):
+        self.rows = [
+            {"id": str(index), "phonepe_merchant_order_id": order_id, "created_at": datetime.now(timezone.utc).isoformat()}
+            for index, order_id in enumerate(order_ids)
+        ]
+        self.updated = []
+        self.activated = []
+
+    async def get_pending_payments(self, created_before, after=None, limit=200):
+        return [] if after else self.rows[:limit]
+
+    async def update_payment_statuses(self, updates):
+        self.updated.extend(updates)
+        return len(updates)
+
+    async def activate_subscription(self, merchant_order_id):
+        self.activated.append(merchant_order_id)
+        return True
+
+
+@pytest.fixture
+def write_behind(monkeypatch):
+    fake = FakeWriteBehind()
+    monkeypatch.setattr(order_state_module, 'write_behind', fake)
+    return fake
+
+
+def make_reconciler(monkeypatch, dry_run: bool):
+    monkeypatch.setenv('RECONCILER_DRY_RUN', 'true' if dry_run else 'false')
+    monkeypatch.setenv('RECONCILER_RATE_PER_SECOND', '0')
+    status_cache = FakeStatusCache()
+    store = OrderStateStore(status_cache)
+    database = FakeDatabase(["LEKHAK_1", "LEKHAK_2"])
+    # Wired like the global reconciler: order_state normally, the status cache for dry runs
+    reconciler = PaymentReconciler.from_env(database, store.get_status, status_cache.get)
+    return reconciler, database, store
+
+
+@pytest.mark.asyncio
+async def test_dry_run_writes_nothing(monkeypatch, write_behind):
+    reconciler, database, store = make_reconciler(monkeypatch, dry_run=True)
+
+    counters = await reconciler.run_once()
+
+    assert counters["completed"] == 2
+    assert write_behind.updates == []
+    assert database.updated == []
+    assert database.activated == []
+    assert store.get("LEKHAK_1") is None
+
+
+@pytest.mark.asyncio
+async def test_dry_run_switched_on_after_construction_writes_nothing(monkeypatch, write_behind):
+    reconciler, database, _ = make_reconciler(monkeypatch, dry_run=False)
+    reconciler.dry_run = True
+
+    await reconciler.run_once()
+
+    assert write_behind.updates == []
+    assert database.updated == []
+
+
+@pytest.mark.asyncio
+async def test_live_run_records_and_applies(monkeypatch, write_behind):
+    reconciler, database, store = make_reconciler(monkeypatch, dry_run=False)
+
+    counters = await reconciler.run_once()
+
+    assert counters["applied"] == 2
+    assert [order_id for order_id, _ in database.updated] == ["LEKHAK_1", "LEKHAK_2"]
+    assert database.activated == ["LEKHAK_1", "LEKHAK_2"]
+    assert len(write_behind.updates) == 2
+    assert store.get("LEKHAK_1")["state"] == "COMPLETED"
+
+
+def test_global_reconciler_dry_runs_bypass_order_state():
+    assert payment_reconciler.dry_run_fetch_status == payment_status_cache.get